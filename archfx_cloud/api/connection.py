@@ -14,7 +14,10 @@ Usage:
     api.logout()
 """
 import logging
+from io import BytesIO
 import requests
+from urllib3.fields import RequestField
+from urllib3.filepost import choose_boundary, encode_multipart_formdata
 from archfx_cloud.api.exceptions import (
     ImproperlyConfigured,
     HttpClientError,
@@ -23,6 +26,7 @@ from archfx_cloud.api.exceptions import (
     HttpServerError,
     RestBaseException,
 )
+from archfx_cloud.reports.compression import compress_content
 
 DOMAIN_NAME = 'https://arch.archfx.io'
 API_PREFIX = 'api/v1'
@@ -138,25 +142,33 @@ class RestResource:
         else:
             return False
 
-    def upload_fp(self, fp, data=None, **kwargs):
+    def upload_fp(self, fp, data=None, content_encoding=None, compression_level=None, **kwargs):
         """
         Upload a file from an opened file pointer
 
         Args:
             fp: File Pointer
             data: object with any additional payload data
+            content_encoding: Optional codec ('gzip' or 'zstd') to compress the whole request body with.
+                It is sent as the Content-Encoding header of the request.
+            compression_level: The compression level of content_encoding. None uses the codec's default.
             kwargs: additional parameters
 
         Returns:
             Object representing returned payload from server
         """
-        files = {
-            'file': fp
+        body = _MultipartBody(data, 'file', fp)
+        headers = {
+            'Content-Type': body.content_type,
         }
 
         logger.debug('Uploading file to {}'.format(str(kwargs)))
 
-        resp = self._convert_ssl_exception(self._session.post, data=data, files=files, params=kwargs)
+        if content_encoding is not None:
+            body = compress_content(body.read(), content_encoding, compression_level)
+            headers['Content-Encoding'] = content_encoding
+
+        resp = self._convert_ssl_exception(self._session.post, data=body, headers=headers, params=kwargs)
         return self._process_response(resp)
 
     def upload_file(self, filename, data=None, mode='rb', **kwargs):
@@ -178,6 +190,71 @@ class RestResource:
         raise RestBaseException("Unable to open and/or upload file")
 
 
+class _MultipartBody:
+    """
+    A multipart/form-data request body that streams its file.
+    The form fields and part headers are encoded up front, but the file is only read
+    a chunk at a time while the request is sent, so it is never copied into memory as
+    a whole. Files whose size can't be found (e.g. pipes) are read once, up front.
+
+    Args:
+        data: Form fields (a dictionary or a list of pairs), or None
+        name: The name of the file field
+        fp: A file object, or a (filename, file object) tuple
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, data, name, fp):
+        if isinstance(fp, tuple):
+            filename, fp = fp
+        else:
+            filename = requests.utils.guess_filename(fp) or name
+
+        fields = []
+        for key, value in (data.items() if hasattr(data, 'items') else data or []):
+            fields.append((key, value if isinstance(value, bytes) else str(value).encode('utf-8')))
+        field = RequestField(name=name, data=b'', filename=filename)
+        field.make_multipart()
+        fields.append(field)
+
+        # Encode the form with an empty file, and stream the file in its place
+        boundary = choose_boundary()
+        encoded, self.content_type = encode_multipart_formdata(fields, boundary=boundary)
+        tail = len(encoded) - len('\r\n--{}--\r\n'.format(boundary))
+
+        size = requests.utils.super_len(fp)
+        if not size:
+            content = fp.read()
+            fp, size = BytesIO(content), len(content)
+        # [file object, number of bytes left to read] of every part of the body
+        self._parts = [[BytesIO(encoded[:tail]), tail], [fp, size], [BytesIO(encoded[tail:]), len(encoded) - tail]]
+        self._length = sum(part[1] for part in self._parts)
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        chunks = []
+        while self._parts and (size is None or size < 0 or size > 0):
+            part = self._parts[0]
+            count = part[1] if size is None or size < 0 else min(size, part[1])
+            chunk = part[0].read(count)
+            part[1] -= len(chunk)
+            if not chunk or not part[1]:
+                self._parts.pop(0)
+            if size is not None and size >= 0:
+                size -= len(chunk)
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def __iter__(self):
+        chunk = self.read(self.CHUNK_SIZE)
+        while chunk:
+            yield chunk
+            chunk = self.read(self.CHUNK_SIZE)
+
+
 class _TimeoutHTTPAdapter(requests.adapters.HTTPAdapter):
     """Custom http adapter to allow setting timeouts on http verbs.
 
@@ -203,7 +280,17 @@ class Api(object):
     domain = DOMAIN_NAME
     resource_class = RestResource
 
-    def __init__(self, domain=None, token_type=None, verify=True, timeout=None, retries=None):
+    def __init__(self, domain=None, token_type=None, verify=True, timeout=None, retries=None, pool_size=None):
+        """
+        Args:
+            domain: Base url of the server (e.g. 'https://arch.archfx.io')
+            token_type: Type of the authentication token
+            verify: Whether to verify the server's SSL certificate
+            timeout: Timeout in seconds for every request
+            retries: Number of retries (or a urllib3 Retry) for failed connections
+            pool_size: Number of connections kept per host. Set it to the number of threads
+                sharing this Api when making concurrent requests.
+        """
         if domain:
             self.domain = domain
 
@@ -215,8 +302,15 @@ class Api(object):
         self.session = requests.Session()
         self.session.verify = verify
 
+        adapter_kwargs = {}
         if retries is not None or timeout is not None:
-            adapter = _TimeoutHTTPAdapter(max_retries=retries, timeout=timeout)
+            adapter_kwargs['max_retries'] = retries
+        if pool_size is not None:
+            adapter_kwargs['pool_connections'] = pool_size
+            adapter_kwargs['pool_maxsize'] = pool_size
+
+        if adapter_kwargs:
+            adapter = _TimeoutHTTPAdapter(timeout=timeout, **adapter_kwargs)
             self.session.mount("https://", adapter)
             self.session.mount("http://", adapter)
 
@@ -0,0 +1,337 @@
+"""
+Helpers to pull time series out of the paginated `data` resource.
+Usage:
+    api = Api('https://arch.archfx.io')
+    api.login(email='user1@test.com', password='user1')
+    data = fetch_columnar(api, 'sl--0000-0001--0000-0000-0000-0002--0000-5051')
+    logger.debug('Fetched {0} points'.format(len(data)))
+    df = data.to_dataframe()
+    for point in fetch_merged(api, [stream1, stream2], start=start, end=end):
+        logger.debug('{0}: {1}'.format(point.stream, point.value))
+"""
+import datetime
+import heapq
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Union
+
+from archfx_cloud.utils.basic import str_to_datetime
+from archfx_cloud.utils.columnar import GrowableColumn, np, require_numpy, timestamps_to_us
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_MAX_WORKERS = 8
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_param(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_responses(api, resource: str = 'data', **kwargs) -> Iterator[dict]:
+    """
+    Yield every page of a paginated resource, following the `next` links
+    returned by the server.
+
+    Args:
+        api: an instance of archfx_cloud.api.connection.Api. Must be authenticated.
+        resource: Path of the resource to list (e.g. 'data')
+        kwargs: url parameters for the first request
+
+    Returns:
+        Iterator over the decoded pages, one dictionary per page
+    """
+    params = {key: _encode_param(value) for key, value in kwargs.items() if value is not None}
+    resp = api(resource).get(**params)
+    while True:
+        if isinstance(resp, list):
+            # Resource is not paginated
+            yield {'count': len(resp), 'next': None, 'results': resp}
+            return
+
+        yield resp
+
+        next_url = resp.get('next')
+        if not next_url:
+            return
+        resp = api.resource_class(session=api.session, base_url=next_url).get()
+
+
+def iter_pages(api, resource: str = 'data', **kwargs) -> Iterator[List[dict]]:
+    """
+    Yield the `results` list of every page of a paginated resource.
+
+    Args:
+        api: an instance of archfx_cloud.api.connection.Api. Must be authenticated.
+        resource: Path of the resource to list (e.g. 'data')
+        kwargs: url parameters for the first request
+
+    Returns:
+        Iterator over lists of records, one list per page
+    """
+    for resp in iter_responses(api, resource, **kwargs):
+        yield resp.get('results') or []
+
+
+class ColumnarData:
+    """
+    Time series of a single stream stored as parallel NumPy columns.
+
+    Args:
+        stream: The stream slug the data belongs to
+        timestamp: int64 array of UTC timestamps in microseconds since the epoch
+        value: float64 array of values (NaN where the server returned no value)
+        seqid: int64 array of sequence IDs (0 where the server returned none)
+    """
+
+    __slots__ = ('stream', 'timestamp', 'value', 'seqid')
+
+    def __init__(self, stream: str, timestamp, value, seqid):
+        self.stream = stream
+        self.timestamp = timestamp
+        self.value = value
+        self.seqid = seqid
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __str__(self):
+        return "Stream {}: {} points".format(self.stream, len(self))
+
+    def to_dataframe(self):
+        """
+        Convert to a pandas DataFrame with `timestamp` (UTC), `value` and `seqid` columns.
+        Requires pandas to be installed.
+        """
+        try:
+            import pandas as pd
+        except ImportError as err:
+            raise ImportError("pandas is required for DataFrame conversion. "
+                              "Install with `pip install archfx_cloud[pandas]`") from err
+
+        return pd.DataFrame({
+            'timestamp': pd.to_datetime(self.timestamp, unit='us', utc=True),
+            'value': self.value,
+            'seqid': self.seqid,
+        })
+
+
+def fetch_columnar(api,
+                   stream,
+                   start: Optional[Union[str, datetime.datetime]] = None,
+                   end: Optional[Union[str, datetime.datetime]] = None,
+                   page_size: int = DEFAULT_PAGE_SIZE,
+                   resource: str = 'data',
+                   timestamp_field: str = 'timestamp',
+                   value_field: str = 'value',
+                   seqid_field: str = 'seqid',
+                   **kwargs) -> ColumnarData:
+    """
+    Fetch the data of a stream straight into NumPy columns.
+
+    Each page is converted into arrays and copied into preallocated columns
+    (sized from the `count` of the first page) before the next page is requested,
+    so only one page of records is ever held in memory.
+
+    Args:
+        api: an instance of archfx_cloud.api.connection.Api. Must be authenticated.
+        stream: The stream slug (str or ArchFxStreamSlug) to fetch
+        start: Optional start of the time range
+        end: Optional end of the time range
+        page_size: Number of records to request per page
+        resource: Path of the resource to list
+        timestamp_field: Record key holding the ISO-8601 timestamp
+        value_field: Record key holding the value
+        seqid_field: Record key holding the sequence ID
+        kwargs: Any additional url parameters
+
+    Returns:
+        ColumnarData: The fetched time series
+    """
+    require_numpy()
+
+    timestamp = value = seqid = None
+    for resp in iter_responses(api, resource, filter=str(stream), start=start, end=end,
+                               page_size=page_size, **kwargs):
+        rows = resp.get('results') or []
+        if timestamp is None:
+            capacity = resp.get('count') or len(rows)
+            timestamp = GrowableColumn(np.int64, capacity)
+            value = GrowableColumn(np.float64, capacity)
+            seqid = GrowableColumn(np.int64, capacity)
+
+        if not rows:
+            continue
+
+        timestamp.extend(timestamps_to_us([row[timestamp_field] for row in rows]))
+        value.extend(np.array([row.get(value_field) for row in rows], dtype=np.float64))
+        seqid.extend(np.array([row.get(seqid_field) or 0 for row in rows], dtype=np.int64))
+
+    logger.debug('Fetched {0} points for {1}'.format(0 if timestamp is None else len(timestamp), stream))
+
+    if timestamp is None:
+        empty = np.empty(0, dtype=np.int64)
+        return ColumnarData(str(stream), empty, np.empty(0, dtype=np.float64), empty.copy())
+
+    return ColumnarData(str(stream), timestamp.finalize(), value.finalize(), seqid.finalize())
+
+
+StreamPoint = namedtuple('StreamPoint', ['stream', 'timestamp', 'value', 'seqid'])
+StreamPoint.__doc__ = """A single data point tagged with the slug of the stream it belongs to."""
+
+
+def _row_to_point(stream, row, timestamp_field, value_field, seqid_field):
+    return StreamPoint(
+        stream,
+        str_to_datetime(row[timestamp_field]),
+        row.get(value_field),
+        row.get(seqid_field),
+    )
+
+
+def iter_point_pages(api,
+                     stream,
+                     start: Optional[Union[str, datetime.datetime]] = None,
+                     end: Optional[Union[str, datetime.datetime]] = None,
+                     page_size: int = DEFAULT_PAGE_SIZE,
+                     resource: str = 'data',
+                     timestamp_field: str = 'timestamp',
+                     value_field: str = 'value',
+                     seqid_field: str = 'seqid',
+                     **kwargs) -> Iterator[List[StreamPoint]]:
+    """
+    Yield the data of a stream one page at a time, as lists of StreamPoint records.
+
+    Args:
+        api: an instance of archfx_cloud.api.connection.Api. Must be authenticated.
+        stream: The stream slug (str or ArchFxStreamSlug) to fetch
+        start: Optional start of the time range
+        end: Optional end of the time range
+        page_size: Number of records to request per page
+        resource: Path of the resource to list
+        timestamp_field: Record key holding the ISO-8601 timestamp
+        value_field: Record key holding the value
+        seqid_field: Record key holding the sequence ID
+        kwargs: Any additional url parameters
+
+    Returns:
+        Iterator over lists of StreamPoint, one list per page
+    """
+    stream = str(stream)
+    for rows in iter_pages(api, resource, filter=stream, start=start, end=end, page_size=page_size, **kwargs):
+        yield [_row_to_point(stream, row, timestamp_field, value_field, seqid_field) for row in rows]
+
+
+class _StreamCursor:
+    """
+    Walk the records of one stream, page by page.
+    The next page is always requested in the background while the current one
+    is consumed, so at most two pages per stream are held in memory.
+    """
+
+    def __init__(self, executor, stream, pages, timestamp_field, value_field, seqid_field):
+        self._executor = executor
+        self._stream = stream
+        self._pages = pages
+        self._timestamp_field = timestamp_field
+        self._value_field = value_field
+        self._seqid_field = seqid_field
+        self._rows = []
+        self._pos = 0
+        self._pending = executor.submit(self._fetch)
+
+    def _fetch(self):
+        return next(self._pages, None)
+
+    def next_point(self) -> Optional[StreamPoint]:
+        """Return the next point of the stream, or None once it is exhausted."""
+        while self._pos >= len(self._rows):
+            if self._pending is None:
+                return None
+            rows = self._pending.result()
+            if rows is None:
+                self._pending = None
+                self._rows = []
+                return None
+            self._rows = rows
+            self._pos = 0
+            self._pending = self._executor.submit(self._fetch)
+
+        row = self._rows[self._pos]
+        self._pos += 1
+        return _row_to_point(self._stream, row, self._timestamp_field, self._value_field, self._seqid_field)
+
+
+def fetch_merged(api,
+                 streams: Iterable,
+                 start: Optional[Union[str, datetime.datetime]] = None,
+                 end: Optional[Union[str, datetime.datetime]] = None,
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 max_workers: int = DEFAULT_MAX_WORKERS,
+                 resource: str = 'data',
+                 timestamp_field: str = 'timestamp',
+                 value_field: str = 'value',
+                 seqid_field: str = 'seqid',
+                 **kwargs) -> Iterator[StreamPoint]:
+    """
+    Fetch several streams concurrently and merge them into a single timeline.
+
+    Pages are requested by a pool of at most `max_workers` threads and the
+    streams are combined with a heap based k-way merge, so memory stays
+    proportional to the number of streams times the page size. Each stream is
+    expected to be returned by the server in ascending timestamp order. Points
+    with the same timestamp are yielded in the order their streams were given.
+
+    Args:
+        api: an instance of archfx_cloud.api.connection.Api. Must be authenticated.
+        streams: The stream slugs (str or ArchFxStreamSlug) to fetch
+        start: Optional start of the time range
+        end: Optional end of the time range
+        page_size: Number of records to request per page
+        max_workers: Maximum number of concurrent requests
+        resource: Path of the resource to list
+        timestamp_field: Record key holding the ISO-8601 timestamp
+        value_field: Record key holding the value
+        seqid_field: Record key holding the sequence ID
+        kwargs: Any additional url parameters
+
+    Returns:
+        Iterator over StreamPoint records in global timestamp order
+    """
+    streams = [str(stream) for stream in streams]
+    if not streams:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(streams)))) as executor:
+        cursors = [
+            _StreamCursor(
+                executor,
+                stream,
+                iter_pages(api, resource, filter=stream, start=start, end=end, page_size=page_size, **kwargs),
+                timestamp_field,
+                value_field,
+                seqid_field,
+            )
+            for stream in streams
+        ]
+
+        # The cursor index breaks timestamp ties, so points are never compared
+        heap = []
+        for index, cursor in enumerate(cursors):
+            point = cursor.next_point()
+            if point is not None:
+                heap.append((point.timestamp, index, point))
+        heapq.heapify(heap)
+
+        while heap:
+            _, index, point = heap[0]
+            yield point
+
+            point = cursors[index].next_point()
+            if point is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (point.timestamp, index, point))
@@ -0,0 +1,218 @@
+"""
+Incremental synchronization of stream data.
+Every stream keeps a checkpoint (timestamp and seqid of the last point that was
+acknowledged by the consumer) in a local file, so each run only requests data
+newer than what was already processed. Batches of a stream may be acknowledged
+in any order, but a checkpoint only moves past a batch once it was acknowledged.
+Usage:
+    store = CheckpointStore('checkpoints.json')
+    sync = IncrementalSync(api, store)
+    for batch in sync.run(stream_slugs):
+        process(batch.points)
+        batch.ack()
+"""
+import datetime
+import json
+import logging
+import threading
+from collections import namedtuple
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from archfx_cloud.api.data import DEFAULT_PAGE_SIZE, StreamPoint, iter_point_pages
+from archfx_cloud.utils.basic import str_to_datetime
+from archfx_cloud.utils.files import atomic_write
+
+logger = logging.getLogger(__name__)
+
+Checkpoint = namedtuple('Checkpoint', ['timestamp', 'seqid'])
+Checkpoint.__doc__ = """Position of the last acknowledged point of a stream (ISO-8601 timestamp and seqid)."""
+
+
+def _checkpoint_key(checkpoint: Checkpoint):
+    seqid = checkpoint.seqid if checkpoint.seqid is not None else -1
+    return str_to_datetime(checkpoint.timestamp), seqid
+
+
+def _point_key(point: StreamPoint):
+    return point.timestamp, point.seqid if point.seqid is not None else -1
+
+
+class CheckpointStore:
+    """
+    Local store of per-stream checkpoints, persisted as a json file.
+    Every commit rewrites the file atomically (write to a temporary file, fsync
+    and rename), so a crash leaves either the old or the new checkpoints on
+    disk, never a partial file.
+    Args:
+        path: Path of the json file holding the checkpoints
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._checkpoints = self._load()
+        # Out of order acks, by stream and by the checkpoint they follow
+        self._pending: Dict[str, Dict[Optional[Checkpoint], Checkpoint]] = {}
+
+    def _load(self) -> Dict[str, Checkpoint]:
+        try:
+            with open(self.path, 'r') as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return {}
+
+        return {stream: Checkpoint(value['timestamp'], value.get('seqid')) for stream, value in data.items()}
+
+    def _save(self):
+        data = {stream: checkpoint._asdict() for stream, checkpoint in self._checkpoints.items()}
+        atomic_write(self.path, json.dumps(data, indent=1, sort_keys=True).encode())
+
+    def get(self, stream) -> Optional[Checkpoint]:
+        """Return the checkpoint of a stream, or None if it was never synchronized"""
+        return self._checkpoints.get(str(stream))
+
+    def streams(self) -> List[str]:
+        """Return the slugs of all streams with a checkpoint"""
+        return list(self._checkpoints.keys())
+
+    def commit(self, stream, checkpoint: Checkpoint):
+        """
+        Atomically persist a new checkpoint for a stream.
+        Checkpoints older than the stored one are ignored, so acknowledging
+        batches out of order never moves a stream backwards.
+        """
+        stream = str(stream)
+        with self._lock:
+            current = self._checkpoints.get(stream)
+            if current is not None and _checkpoint_key(checkpoint) <= _checkpoint_key(current):
+                return
+            self._checkpoints[stream] = checkpoint
+            self._save()
+
+    def commit_after(self, stream, previous: Optional[Checkpoint], checkpoint: Checkpoint):
+        """
+        Persist the checkpoint of a batch that follows the `previous` checkpoint.
+        If the stream is not at `previous` yet (an earlier batch was not acknowledged),
+        the checkpoint is kept pending, and only committed once the earlier batches are.
+        Pending checkpoints are not persisted: their batches are fetched again by the next run.
+        """
+        stream = str(stream)
+        with self._lock:
+            current = self._checkpoints.get(stream)
+            if current is not None and _checkpoint_key(checkpoint) <= _checkpoint_key(current):
+                return
+
+            pending = self._pending.setdefault(stream, {})
+            pending[previous] = checkpoint
+            if current not in pending:
+                logger.debug('Checkpoint {0} of {1} is pending earlier acks'.format(checkpoint, stream))
+                return
+
+            while current in pending:
+                current = pending.pop(current)
+            self._checkpoints[stream] = current
+            self._save()
+
+    def reset(self, stream):
+        """Forget the checkpoint of a stream, so the next run starts from the beginning"""
+        with self._lock:
+            self._pending.pop(str(stream), None)
+            if self._checkpoints.pop(str(stream), None) is not None:
+                self._save()
+
+
+class SyncBatch:
+    """
+    A page of new points for a stream.
+    The checkpoint is only committed once the consumer calls `ack()`, so
+    a batch that was not fully processed is fetched again on the next run.
+    A batch acknowledged before the previous ones of its stream is only
+    committed once they are all acknowledged.
+    """
+
+    __slots__ = ('stream', 'points', 'checkpoint', 'previous', '_store')
+
+    def __init__(self,
+                 stream: str,
+                 points: List[StreamPoint],
+                 checkpoint: Checkpoint,
+                 store: CheckpointStore,
+                 previous: Optional[Checkpoint] = None):
+        self.stream = stream
+        self.points = points
+        self.checkpoint = checkpoint
+        self.previous = previous
+        self._store = store
+
+    def __len__(self):
+        return len(self.points)
+
+    def ack(self):
+        """Acknowledge that all points of this batch were processed"""
+        self._store.commit_after(self.stream, self.previous, self.checkpoint)
+
+
+class IncrementalSync:
+    """
+    Fetch only the data that is newer than the checkpoint of each stream.
+    Args:
+        api: an instance of archfx_cloud.api.connection.Api. Must be authenticated.
+        store: The CheckpointStore to read and commit checkpoints to
+        page_size: Number of records to request per page (and therefore per batch)
+        initial_start: Where to start streams without a checkpoint. None means from the beginning.
+        kwargs: Any additional arguments for archfx_cloud.api.data.iter_point_pages()
+    """
+
+    def __init__(self,
+                 api,
+                 store: CheckpointStore,
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 initial_start: Optional[Union[str, datetime.datetime]] = None,
+                 **kwargs):
+        self.api = api
+        self.store = store
+        self.page_size = page_size
+        self.initial_start = initial_start
+        self._kwargs = kwargs
+
+    def run(self,
+            streams: Iterable,
+            end: Optional[Union[str, datetime.datetime]] = None) -> Iterator[SyncBatch]:
+        """
+        Yield batches of new points, stream by stream.
+
+        Args:
+            streams: The stream slugs (str or ArchFxStreamSlug) to synchronize
+            end: Optional end of the time range
+
+        Returns:
+            Iterator over SyncBatch objects that need to be acknowledged
+        """
+        for stream in streams:
+            yield from self.run_stream(stream, end=end)
+
+    def run_stream(self, stream, end: Optional[Union[str, datetime.datetime]] = None) -> Iterator[SyncBatch]:
+        """Yield batches of new points for a single stream"""
+        stream = str(stream)
+        checkpoint = self.store.get(stream)
+        if checkpoint is not None:
+            start = checkpoint.timestamp
+            last_key = _checkpoint_key(checkpoint)
+        else:
+            start = self.initial_start
+            last_key = None
+
+        logger.debug('Synchronizing {0} from {1}'.format(stream, start))
+
+        for page in iter_point_pages(self.api, stream, start=start, end=end, page_size=self.page_size, **self._kwargs):
+            if last_key is not None:
+                # The start filter is inclusive, so drop the points that were already acknowledged
+                page = [point for point in page if _point_key(point) > last_key]
+            if not page:
+                continue
+
+            previous = checkpoint
+            last = page[-1]
+            checkpoint = Checkpoint(last.timestamp.isoformat(), last.seqid)
+            last_key = _checkpoint_key(checkpoint)
+            yield SyncBatch(stream, page, checkpoint, self.store, previous=previous)
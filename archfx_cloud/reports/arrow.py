@@ -0,0 +1,176 @@
+"""Export reports to Arrow record batches, Arrow IPC files and Parquet files.
+
+Every report is decoded into a DataPointBatch (without creating any
+ArchFXDataPoint) and converted into record batches of at most batch_size rows,
+which are written out one at a time. Memory use is therefore bounded by the
+largest report and batch_size, however many reports are exported.
+
+All exports share the same schema (see SCHEMA):
+- device: uint64, the device ID
+- streamer_index: uint32, the streamer of the report
+- stream: uint32, the variable ID of the stream
+- timestamp: timestamp in microseconds, UTC
+- value: float64
+- seqid: int64, the reading ID (dev_seqid), 0 if not known
+- summary_data: map<string, string>, with json encoded values
+
+Requires pyarrow and numpy (`pip install archfx_cloud[arrow]`).
+
+Usage:
+    reports = (ArchFXFlexibleDictionaryReport.FromFile(path) for path in find_reports('/data/reports'))
+    write_parquet(reports, 'readings.parquet')
+"""
+
+import json
+import logging
+from typing import Iterable, Iterator, Optional, Union
+
+from ..utils.slugs import ArchFxDeviceSlug
+from .batch import DataPointBatch
+from .report import ArchFXReport
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+    pq = None
+
+DEFAULT_BATCH_SIZE = 65536
+
+logger = logging.getLogger(__name__)
+
+if pa is not None:
+    SCHEMA = pa.schema([
+        pa.field('device', pa.uint64(), nullable=False),
+        pa.field('streamer_index', pa.uint32()),
+        pa.field('stream', pa.uint32(), nullable=False),
+        pa.field('timestamp', pa.timestamp('us', tz='UTC'), nullable=False),
+        pa.field('value', pa.float64(), nullable=False),
+        pa.field('seqid', pa.int64(), nullable=False),
+        pa.field('summary_data', pa.map_(pa.string(), pa.string())),
+    ])
+else:  # pragma: no cover
+    SCHEMA = None
+
+
+def require_pyarrow():
+    """Raise an ImportError if pyarrow is not installed."""
+    if pa is None:
+        raise ImportError("pyarrow is required to export reports. Install with `pip install archfx_cloud[arrow]`")
+
+
+def _summary_column(summary_data, start: int, end: int) -> 'pa.Array':
+    if summary_data is None:
+        return pa.nulls(end - start, type=SCHEMA.field('summary_data').type)
+
+    return pa.array(
+        [
+            [(key, json.dumps(value)) for key, value in summary.items()] if summary else None
+            for summary in summary_data[start:end]
+        ],
+        type=SCHEMA.field('summary_data').type,
+    )
+
+
+def batch_to_record_batches(batch: DataPointBatch,
+                            device: Union[str, int],
+                            streamer_index: Optional[int] = None,
+                            batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator['pa.RecordBatch']:
+    """Convert a DataPointBatch into record batches of at most batch_size rows.
+    Args:
+        batch: The data points
+        device: The device the data points are from
+        streamer_index: Optional streamer of the data points
+        batch_size: Maximum number of rows per record batch
+    Returns:
+        Iterator over pyarrow.RecordBatch with the SCHEMA schema
+    """
+    require_pyarrow()
+
+    device = ArchFxDeviceSlug(device).get_id()
+    for start in range(0, len(batch), batch_size):
+        end = min(start + batch_size, len(batch))
+        count = end - start
+        yield pa.RecordBatch.from_arrays([
+            pa.array([device] * count, type=pa.uint64()),
+            pa.array([streamer_index] * count, type=pa.uint32()),
+            pa.array(batch.stream[start:end], type=pa.uint32()),
+            pa.array(batch.timestamp[start:end].view('datetime64[us]'), type=pa.timestamp('us', tz='UTC')),
+            pa.array(batch.value[start:end], type=pa.float64()),
+            pa.array(batch.reading_id[start:end], type=pa.int64()),
+            _summary_column(batch.summary_data, start, end),
+        ], schema=SCHEMA)
+
+
+def to_record_batches(reports: Union[ArchFXReport, Iterable[ArchFXReport]],
+                      batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator['pa.RecordBatch']:
+    """Convert reports into record batches, one report at a time.
+    Record batches never span two reports, so the last batch of every report may be smaller than batch_size.
+    Args:
+        reports: A report, or any iterable of reports (e.g. reports lazily loaded from files)
+        batch_size: Maximum number of rows per record batch
+    Returns:
+        Iterator over pyarrow.RecordBatch with the SCHEMA schema
+    """
+    require_pyarrow()
+
+    if isinstance(reports, ArchFXReport):
+        reports = [reports]
+
+    for report in reports:
+        batch = DataPointBatch.FromReport(report)
+        yield from batch_to_record_batches(batch, report.origin, report.origin_streamer, batch_size)
+
+
+def to_table(reports: Union[ArchFXReport, Iterable[ArchFXReport]]) -> 'pa.Table':
+    """Convert reports into a single pyarrow.Table (held in memory)."""
+    return pa.Table.from_batches(list(to_record_batches(reports)), schema=SCHEMA)
+
+
+def write_arrow(reports: Union[ArchFXReport, Iterable[ArchFXReport]],
+                sink,
+                batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Write reports to an Arrow IPC file, a record batch at a time.
+    Args:
+        reports: A report, or any iterable of reports
+        sink: The path of the file, or a writable binary file object
+        batch_size: Maximum number of rows per record batch
+    Returns:
+        int: The number of rows written
+    """
+    require_pyarrow()
+
+    rows = 0
+    with pa.ipc.new_file(sink, SCHEMA) as writer:
+        for record_batch in to_record_batches(reports, batch_size):
+            writer.write_batch(record_batch)
+            rows += record_batch.num_rows
+
+    logger.debug("Wrote %d rows to an Arrow file", rows)
+    return rows
+
+
+def write_parquet(reports: Union[ArchFXReport, Iterable[ArchFXReport]],
+                  where,
+                  batch_size: int = DEFAULT_BATCH_SIZE,
+                  compression: str = 'zstd') -> int:
+    """Write reports to a Parquet file, a record batch at a time.
+    Args:
+        reports: A report, or any iterable of reports
+        where: The path of the file, or a writable binary file object
+        batch_size: Maximum number of rows per record batch (and row group)
+        compression: The Parquet compression codec
+    Returns:
+        int: The number of rows written
+    """
+    require_pyarrow()
+
+    rows = 0
+    with pq.ParquetWriter(where, SCHEMA, compression=compression) as writer:
+        for record_batch in to_record_batches(reports, batch_size):
+            writer.write_batch(record_batch, row_group_size=batch_size)
+            rows += record_batch.num_rows
+
+    logger.debug("Wrote %d rows to a Parquet file", rows)
+    return rows
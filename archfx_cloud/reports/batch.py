@@ -0,0 +1,404 @@
+"""Columnar storage for large numbers of data points."""
+
+import datetime
+import operator
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import msgpack
+
+from ..utils.basic import str_to_datetime
+from ..utils.columnar import (
+    datetime_to_us,
+    np,
+    require_numpy,
+    timestamps_to_us,
+    us_to_datetime,
+    us_to_isoformat,
+)
+from .exceptions import DataError
+from .flexible_dictionary import (
+    RAW_DATA_KEY,
+    ArchFXFlexibleDictionaryReport,
+    ArchFXFlexibleDictionaryReportWriter,
+    _BufferReader,
+    _read_raw_section,
+    _resolve_raw_data,
+)
+from .report import ArchFXDataPoint, ArchFXReport, _stream_id
+
+
+def _import_pandas():
+    try:
+        import pandas as pd  # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        raise ImportError("pandas is required for DataFrame conversion. "
+                          "Install with `pip install archfx_cloud[pandas]`") from err
+    return pd
+
+
+class DataPointBatch:
+    """A batch of data points stored as parallel NumPy columns.
+    A DataPointBatch holds the same information as a list of ArchFXDataPoint,
+    but uses a few bytes per data point instead of a Python object (plus a
+    datetime, a float and an int) for each one. Summary and raw data are kept
+    in side tables, which are None when no data point has any.
+    Requires numpy (`pip install archfx_cloud[numpy]`).
+    Args:
+        timestamp: UTC timestamps in microseconds since the epoch (int64)
+        stream: Variable IDs of the streams (uint32)
+        value: Primary values (float64)
+        reading_id: Reading IDs (int64), ArchFXDataPoint.InvalidReadingID if not known
+        summary_data: Optional list with the summary data dictionary (or None) of every data point
+        raw_data: Optional list with the raw data dictionary (or None) of every data point
+    """
+
+    __slots__ = ('timestamp', 'stream', 'value', 'reading_id', 'summary_data', 'raw_data')
+
+    def __init__(self,
+                 timestamp,
+                 stream,
+                 value,
+                 reading_id,
+                 summary_data: Optional[List[Optional[dict]]] = None,
+                 raw_data: Optional[List[Optional[dict]]] = None):
+        require_numpy()
+
+        self.timestamp = np.asarray(timestamp, dtype=np.int64)
+        self.stream = np.asarray(stream, dtype=np.uint32)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.reading_id = np.asarray(reading_id, dtype=np.int64)
+        self.summary_data = summary_data if summary_data is None or any(summary_data) else None
+        self.raw_data = raw_data if raw_data is None or any(x is not None for x in raw_data) else None
+
+        size = len(self.timestamp)
+        for column in (self.stream, self.value, self.reading_id, self.summary_data, self.raw_data):
+            if column is not None and len(column) != size:
+                raise DataError("All columns of a DataPointBatch must have the same length")
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __str__(self):
+        return "DataPointBatch ({} data points)".format(len(self))
+
+    @classmethod
+    def FromPoints(cls, points: Iterable[ArchFXDataPoint]) -> 'DataPointBatch':
+        """Create a batch from a list (or any iterable) of ArchFXDataPoint."""
+        timestamp = []
+        stream = []
+        value = []
+        reading_id = []
+        summary_data = []
+        raw_data = []
+        for point in points:
+            timestamp.append(datetime_to_us(point.timestamp))
+            stream.append(point.stream)
+            value.append(point.value)
+            reading_id.append(point.reading_id)
+            summary_data.append(point.summary_data or None)
+            raw_data.append(point.raw_data)
+
+        return cls(timestamp, stream, value, reading_id, summary_data, raw_data)
+
+    @classmethod
+    def FromArrays(cls,
+                   timestamp,
+                   stream,
+                   value,
+                   reading_id=None,
+                   summary_data: Optional[Sequence[Optional[dict]]] = None,
+                   raw_data: Optional[Sequence[Optional[dict]]] = None) -> 'DataPointBatch':
+        """Validate and normalize parallel sequences (or NumPy arrays) of data point fields into a batch.
+        Every row gets the checks and conversions of ArchFXDataPoint (stream parsed into a
+        variable ID, value converted to float, no 'value' key in summary_data), but done
+        one column at a time with NumPy wherever possible, instead of once per data point.
+        Args:
+            timestamp: datetime64 values, int64 microseconds since the epoch, datetimes or ISO-8601 strings.
+                Naive timestamps are assumed to be UTC.
+            stream: Variable IDs or stream strings (e.g. '5001' or '0001-5030')
+            value: Primary values, anything float() accepts
+            reading_id: Optional reading IDs, None or ArchFXDataPoint.InvalidReadingID if not known
+            summary_data: Optional summary data dictionary (or None) of every data point
+            raw_data: Optional raw data dictionary (or None) of every data point
+        Returns:
+            DataPointBatch: The normalized batch
+        Raises:
+            DataError: If any row is invalid. All invalid rows are reported at once, in the rows
+                parameter (a dictionary of row index to error).
+        """
+        require_numpy()
+
+        count = len(timestamp)
+        for name, column in (('stream', stream), ('value', value), ('reading_id', reading_id),
+                             ('summary_data', summary_data), ('raw_data', raw_data)):
+            if column is not None and len(column) != count:
+                raise DataError("Column {} has {} rows instead of {}".format(name, len(column), count))
+
+        errors = defaultdict(list)
+        timestamp = _normalize_timestamps(timestamp, errors)
+        stream = _normalize_streams(stream, errors)
+        value = _normalize_values(value, errors)
+        reading_id = _normalize_reading_ids(reading_id, count, errors)
+        if summary_data is not None:
+            summary_data = [summary or None for summary in summary_data]
+            for row, summary in enumerate(summary_data):
+                if summary is not None and 'value' in summary:
+                    errors[row].append('value is not a valid field for summary_data')
+        if raw_data is not None:
+            raw_data = list(raw_data)
+
+        if errors:
+            rows = {row: '; '.join(errors[row]) for row in sorted(errors)}
+            first = next(iter(rows))
+            raise DataError("Invalid data points in {} rows (row {}: {})".format(len(rows), first, rows[first]),
+                            rows=rows)
+
+        return cls(timestamp, stream, value, reading_id, summary_data, raw_data)
+
+    def to_points(self) -> List[ArchFXDataPoint]:
+        """Convert the batch into a list of ArchFXDataPoint."""
+        summary_data = self.summary_data or [None] * len(self)
+        raw_data = self.raw_data or [None] * len(self)
+
+        return [
+            ArchFXDataPoint(us_to_datetime(timestamp), stream, value, summary, raw, reading_id=reading_id)
+            for timestamp, stream, value, reading_id, summary, raw in zip(
+                self.timestamp.tolist(), self.stream.tolist(), self.value.tolist(), self.reading_id.tolist(),
+                summary_data, raw_data
+            )
+        ]
+
+    @classmethod
+    def FromReport(cls, report: ArchFXReport) -> 'DataPointBatch':
+        """Decode the events of a flexible dictionary (or compact) report straight into a batch.
+        Events are unpacked one at a time and no ArchFXDataPoint is created. Raw data stored
+        in a raw data section is kept as LazyRawData in the raw_data side table.
+        """
+        encoded = report.encode()
+        unpacker = msgpack.Unpacker(_BufferReader(encoded), raw=False)
+        section = None
+        for _ in range(unpacker.read_map_header()):
+            key = unpacker.unpack()
+            if key == RAW_DATA_KEY:
+                section = _read_raw_section(unpacker, encoded)
+                continue
+            if key == 'events':
+                return cls._from_events(unpacker, section)
+            if key == 'columns':
+                return cls._from_columns(unpacker.unpack())
+            unpacker.skip()
+
+        return cls._from_events(None)
+
+    @classmethod
+    def _from_columns(cls, columns: dict) -> 'DataPointBatch':
+        count = len(columns.get('stream', []))
+        streams = np.array(columns.get('streams', []), dtype=np.uint32)
+        keys = columns.get('keys', [])
+
+        summary_data = [
+            {keys[pairs[j]]: pairs[j + 1] for j in range(0, len(pairs), 2)} if pairs else None
+            for pairs in columns.get('extra_data', [])
+        ]
+        raw_data = [None] * count
+        for index, raw in columns.get('data', []):
+            raw_data[index] = raw
+
+        return cls(
+            np.cumsum(np.array(columns.get('timestamp', []), dtype=np.int64)),
+            streams[np.array(columns.get('stream', []), dtype=np.intp)],
+            np.frombuffer(columns.get('value', b''), dtype='<f8'),
+            np.cumsum(np.array(columns.get('dev_seqid', []), dtype=np.int64)),
+            summary_data,
+            raw_data,
+        )
+
+    @classmethod
+    def _from_events(cls, unpacker, section=None) -> 'DataPointBatch':
+        count = unpacker.read_array_header() if unpacker is not None else 0
+
+        timestamp = [None] * count
+        stream = np.empty(count, dtype=np.uint32)
+        value = np.empty(count, dtype=np.float64)
+        reading_id = np.empty(count, dtype=np.int64)
+        summary_data = [None] * count
+        raw_data = [None] * count
+        stream_ids = {}
+
+        for i in range(count):
+            event = _resolve_raw_data(unpacker.unpack(), section)
+            timestamp[i] = event['timestamp']
+
+            raw_stream = event.get('stream')
+            stream_id = stream_ids.get(raw_stream)
+            if stream_id is None:
+                stream_id = stream_ids[raw_stream] = _stream_id(raw_stream)
+            stream[i] = stream_id
+
+            value[i] = event.get('value')
+            reading_id[i] = event.get('dev_seqid') or ArchFXDataPoint.InvalidReadingID
+            summary = event.get('extra_data')
+            if summary:
+                if 'value' in summary:
+                    raise DataError('value is not a valid field for summary_data')
+                summary_data[i] = summary
+            raw_data[i] = event.get('data')
+
+        return cls(timestamps_to_us(timestamp), stream, value, reading_id, summary_data, raw_data)
+
+    def write_to(self, writer: ArchFXFlexibleDictionaryReportWriter):
+        """Encode all data points of the batch into a report writer."""
+        summary_data = self.summary_data or [None] * len(self)
+        raw_data = self.raw_data or [None] * len(self)
+
+        for timestamp, stream, value, reading_id, summary, raw in zip(
+                us_to_isoformat(self.timestamp).tolist(), self.stream.tolist(), self.value.tolist(),
+                self.reading_id.tolist(), summary_data, raw_data):
+            writer.add_dict({
+                'stream': stream,
+                'dev_seqid': reading_id,
+                'timestamp': timestamp,
+                'value': value,
+                'extra_data': summary or {},
+                'data': raw
+            })
+
+    def to_report(self,
+                  device: Union[str, int],
+                  report_id: int = ArchFXDataPoint.InvalidReadingID,
+                  selector: int = 0xFFFF,
+                  streamer: int = 0x100,
+                  sent_timestamp: datetime.datetime = None,
+                  received_time: datetime.datetime = None) -> ArchFXFlexibleDictionaryReport:
+        """Create a flexible dictionary report with all data points of the batch.
+        Same as ArchFXFlexibleDictionaryReport.FromReadings(), without creating any ArchFXDataPoint.
+        """
+        writer = ArchFXFlexibleDictionaryReportWriter(device, report_id=report_id, selector=selector,
+                                                      streamer=streamer, sent_timestamp=sent_timestamp,
+                                                      spool_size=None)
+        self.write_to(writer)
+        return writer.finish(received_time=received_time)
+
+    @classmethod
+    def FromDataFrame(cls, df) -> 'DataPointBatch':
+        """Create a batch from a pandas DataFrame.
+        The DataFrame needs `timestamp`, `stream`, `value` and `reading_id` columns, and may
+        have `summary_data` and `raw_data` columns. Naive timestamps are assumed to be UTC.
+        Requires pandas to be installed.
+        """
+        pd = _import_pandas()
+
+        timestamp = pd.to_datetime(df['timestamp'], utc=True)
+        timestamp = (timestamp - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(microseconds=1)
+
+        return cls(
+            timestamp.to_numpy(dtype=np.int64),
+            df['stream'].to_numpy(),
+            df['value'].to_numpy(),
+            df['reading_id'].to_numpy(),
+            df['summary_data'].tolist() if 'summary_data' in df else None,
+            df['raw_data'].tolist() if 'raw_data' in df else None,
+        )
+
+    def to_dataframe(self):
+        """Convert the batch into a pandas DataFrame (see FromDataFrame() for the columns).
+        Requires pandas to be installed.
+        """
+        pd = _import_pandas()
+
+        return pd.DataFrame({
+            'timestamp': pd.to_datetime(self.timestamp, unit='us', utc=True),
+            'stream': self.stream,
+            'value': self.value,
+            'reading_id': self.reading_id,
+            'summary_data': self.summary_data or [None] * len(self),
+            'raw_data': self.raw_data or [None] * len(self),
+        })
+
+
+def _normalize_timestamps(values, errors: Dict[int, List[str]]) -> 'np.ndarray':
+    array = np.asarray(values)
+    if array.dtype.kind == 'M':
+        for row in np.flatnonzero(np.isnat(array)).tolist():
+            errors[row].append('missing timestamp')
+        return array.astype('datetime64[us]').astype(np.int64)
+    if array.dtype.kind in 'iu':
+        return array.astype(np.int64)
+
+    if array.dtype.kind == 'U':
+        try:
+            return timestamps_to_us(array.tolist())
+        except ValueError:
+            pass  # Find the invalid rows below
+
+    result = np.zeros(len(array), dtype=np.int64)
+    for row, item in enumerate(array.tolist()):
+        if item is None:
+            errors[row].append('missing timestamp')
+            continue
+        try:
+            if isinstance(item, str):
+                item = str_to_datetime(item)
+            result[row] = datetime_to_us(item)
+        except (TypeError, ValueError, OverflowError, AttributeError):
+            errors[row].append('invalid timestamp {!r}'.format(item))
+    return result
+
+
+def _normalize_streams(values, errors: Dict[int, List[str]]) -> 'np.ndarray':
+    array = np.asarray(values)
+    if array.dtype.kind in 'iu':
+        invalid = (array < 0) | (array > 0xFFFFFFFF)
+        for row in np.flatnonzero(invalid).tolist():
+            errors[row].append('invalid stream {!r}'.format(array[row].item()))
+        return np.where(invalid, 0, array).astype(np.uint32)
+
+    # Streams repeat a lot, so every distinct stream is only parsed once
+    result = np.zeros(len(array), dtype=np.uint32)
+    stream_ids = {}
+    for row, item in enumerate(array.tolist()):
+        try:
+            stream_id = stream_ids.get(item)
+            if stream_id is None:
+                stream_id = stream_ids[item] = _stream_id(item)
+            result[row] = stream_id
+        except (TypeError, ValueError) as err:
+            errors[row].append('invalid stream {!r}: {}'.format(item, err))
+    return result
+
+
+def _normalize_values(values, errors: Dict[int, List[str]]) -> 'np.ndarray':
+    array = np.asarray(values)
+    if array.dtype.kind in 'biuf':
+        return array.astype(np.float64)
+    if array.dtype.kind == 'U':
+        try:
+            return array.astype(np.float64)
+        except ValueError:
+            pass  # Find the invalid rows below
+
+    result = np.zeros(len(array), dtype=np.float64)
+    for row, item in enumerate(array.tolist()):
+        try:
+            result[row] = float(item)
+        except (TypeError, ValueError):
+            errors[row].append('invalid value {!r}'.format(item))
+    return result
+
+
+def _normalize_reading_ids(values, count: int, errors: Dict[int, List[str]]) -> 'np.ndarray':
+    if values is None:
+        return np.full(count, ArchFXDataPoint.InvalidReadingID, dtype=np.int64)
+
+    array = np.asarray(values)
+    if array.dtype.kind in 'iu':
+        return array.astype(np.int64)
+
+    result = np.zeros(count, dtype=np.int64)
+    for row, item in enumerate(array.tolist()):
+        try:
+            result[row] = ArchFXDataPoint.InvalidReadingID if item is None else operator.index(item)
+        except TypeError:
+            errors[row].append('invalid reading_id {!r}'.format(item))
+    return result
@@ -0,0 +1,334 @@
+"""Build streamer reports from CSV or NDJSON readings, e.g. historian exports.
+
+Rows are read one at a time and sent to a pool of worker processes a chunk
+(chunk_rows rows) at a time. Every worker converts its rows into
+ArchFXDataPoint and encodes them into reports, split by number of events
+and/or size (see ArchFXFlexibleDictionaryReport.ChunkedFromReadings()). Only a
+bounded number of chunks is in flight, so memory does not depend on the size
+of the input, and reports are yielded in input order.
+
+A column mapping tells which columns hold the stream, timestamp, value and
+seqid (reading ID) of every reading. Timestamps can be ISO-8601 strings or
+seconds since the epoch. Without a seqid, readings have no ID and every report
+gets seqid 0, so the cloud can't tell reports apart: the console script refuses
+to upload them, and warns when it only writes them.
+
+The archfx-build-reports console script writes the reports to a directory
+and/or uploads them:
+    archfx-build-reports export.csv --device d--1234 --column stream=tag --column value=val --column seqid=id \\
+        --max-bytes 4000000 --output-dir reports/ --upload --user user@example.com
+"""
+
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from ..utils.basic import str_to_datetime
+from ..utils.main import BaseMain
+from .exceptions import DataError
+from .flexible_dictionary import ArchFXFlexibleDictionaryReport
+from .report import ArchFXDataPoint
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FIELDS = ('stream', 'timestamp', 'value', 'seqid')
+DEFAULT_CHUNK_ROWS = 100000
+
+logger = logging.getLogger(__name__)
+
+BuiltChunk = namedtuple('BuiltChunk', ['rows', 'skipped', 'reports'])
+BuiltChunk.__doc__ = """The reports built from a chunk of rows, with the number of rows read and skipped."""
+
+
+def detect_format(path: str) -> str:
+    """Return the format of a readings file from its extension: NDJSON for .ndjson, .jsonl and .json, else CSV."""
+    extension = os.path.splitext(path)[1].lower()
+    return NDJSON if extension in ('.ndjson', '.jsonl', '.json') else CSV
+
+
+def iter_rows(fp, fmt: str = CSV) -> Iterator[dict]:
+    """Read the rows of a CSV file (with a header line) or of an NDJSON file (one object per line), lazily.
+    Args:
+        fp: A text file object
+        fmt: CSV or NDJSON
+    """
+    if fmt == CSV:
+        yield from csv.DictReader(fp)
+    elif fmt == NDJSON:
+        for line in fp:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise DataError("Unknown readings format: {}".format(fmt))
+
+
+def _parse_timestamp(value) -> datetime.datetime:
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value, datetime.timezone.utc)
+    try:
+        return datetime.datetime.fromtimestamp(float(value), datetime.timezone.utc)
+    except ValueError:
+        return str_to_datetime(value)
+
+
+def row_to_point(row: dict, columns: Optional[Dict[str, str]] = None, stream=None) -> ArchFXDataPoint:
+    """Convert a row into a data point.
+    Args:
+        row: The row, as a dictionary of column name to value
+        columns: Optional mapping of field (stream, timestamp, value or seqid) to column name.
+            Fields default to a column with the same name.
+        stream: Stream of every row, if there is no stream column
+    Raises:
+        DataError: If the row is missing a field or has an invalid one
+    """
+    columns = columns or {}
+    try:
+        if stream is None:
+            stream = row[columns.get('stream', 'stream')]
+        seqid = row.get(columns.get('seqid', 'seqid'))
+        return ArchFXDataPoint(
+            timestamp=_parse_timestamp(row[columns.get('timestamp', 'timestamp')]),
+            stream=stream,
+            value=row[columns.get('value', 'value')],
+            reading_id=int(seqid) if seqid not in (None, '') else None,
+        )
+    except KeyError as err:
+        raise DataError("Missing column {}".format(err)) from err
+    except (TypeError, ValueError, OverflowError) as err:
+        raise DataError("Invalid row: {}".format(err)) from err
+
+
+def _build_chunk(rows: List[dict], device, columns, stream, streamer, selector, max_events, max_bytes,
+                 skip_invalid) -> tuple:
+    points = []
+    skipped = 0
+    for row in rows:
+        try:
+            points.append(row_to_point(row, columns, stream))
+        except DataError:
+            if not skip_invalid:
+                raise
+            skipped += 1
+
+    reports = ArchFXFlexibleDictionaryReport.ChunkedFromReadings(
+        device, points, max_events=max_events, max_bytes=max_bytes, selector=selector, streamer=streamer)
+    # Encoded reports are cheaper to send back to the parent process than decoded ones
+    return len(rows), skipped, [report.encode() for report in reports]
+
+
+def _chunks(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _built(result: tuple) -> BuiltChunk:
+    rows, skipped, encoded = result
+    return BuiltChunk(rows, skipped, [ArchFXFlexibleDictionaryReport(data, False, False, lazy=True)
+                                      for data in encoded])
+
+
+def build_reports(rows: Iterable[dict],
+                  device: Union[str, int],
+                  columns: Optional[Dict[str, str]] = None,
+                  stream=None,
+                  streamer: int = 0x100,
+                  selector: int = 0xFFFF,
+                  max_events: Optional[int] = None,
+                  max_bytes: Optional[int] = None,
+                  chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                  max_workers: Optional[int] = 0,
+                  max_in_flight: Optional[int] = None,
+                  skip_invalid: bool = False) -> Iterator[BuiltChunk]:
+    """Build reports from rows of readings across a pool of processes.
+    Every chunk of rows is split into its own reports, so chunk_rows should be a multiple of max_events.
+    Reports of rows without a seqid all get ArchFXDataPoint.InvalidReadingID (0) as their seqid.
+    Args:
+        rows: The rows (dictionaries of column name to value, see iter_rows())
+        device: The uuid or slug of the device the readings are from
+        columns: Optional mapping of field (stream, timestamp, value or seqid) to column name
+        stream: Stream of every row, if there is no stream column
+        streamer: The streamer index of the reports
+        selector: The streamer selector of the reports
+        max_events: Maximum number of events per report
+        max_bytes: Maximum size in bytes of every report
+        chunk_rows: Number of rows sent to a worker at once
+        max_workers: Number of worker processes. None uses the number of CPUs, 0 builds in this process.
+        max_in_flight: Maximum number of chunks submitted and not yet yielded. Defaults to twice the workers.
+        skip_invalid: Whether to skip (and count) invalid rows instead of raising DataError
+    Returns:
+        Iterator over BuiltChunk, in input order
+    """
+    unknown = set(columns or {}) - set(FIELDS)
+    if unknown:
+        raise DataError("Unknown fields in column mapping: {}".format(', '.join(sorted(unknown))))
+
+    options = (device, columns, stream, streamer, selector, max_events, max_bytes, skip_invalid)
+    chunks = _chunks(rows, chunk_rows)
+
+    if max_workers == 0:
+        for chunk in chunks:
+            yield _built(_build_chunk(chunk, *options))
+        return
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_in_flight is None:
+        max_in_flight = 2 * max_workers
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_build_chunk, chunk, *options))
+            if len(pending) >= max_in_flight:
+                yield _built(pending.popleft().result())
+
+        while pending:
+            yield _built(pending.popleft().result())
+
+
+class _Progress:
+    """Log rows/s and bytes/s at most every interval seconds."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.rows = 0
+        self.skipped = 0
+        self.reports = 0
+        self.bytes = 0
+        self._start = self._last = time.monotonic()
+
+    def update(self, chunk: BuiltChunk, size: int):
+        self.rows += chunk.rows
+        self.skipped += chunk.skipped
+        self.reports += len(chunk.reports)
+        self.bytes += size
+        if time.monotonic() - self._last >= self.interval:
+            self.log()
+
+    def log(self):
+        self._last = time.monotonic()
+        elapsed = max(self._last - self._start, 1e-9)
+        logger.info("%d rows (%.0f rows/s), %d skipped, %d reports, %d bytes (%.0f bytes/s)",
+                    self.rows, self.rows / elapsed, self.skipped, self.reports, self.bytes, self.bytes / elapsed)
+
+
+class BuildReportsMain(BaseMain):
+    """Console script building reports from CSV/NDJSON readings (see archfx-build-reports --help)."""
+
+    def add_extra_args(self):
+        self.parser.description = "Build streamer reports from CSV or NDJSON readings"
+        self.parser.add_argument('inputs', nargs='+', help="Readings files, or - for stdin")
+        self.parser.add_argument('--format', choices=[CSV, NDJSON],
+                                 help="Format of the readings. Detected from the file extension by default")
+        self.parser.add_argument('--device', required=True, help="Device slug or ID of the readings")
+        self.parser.add_argument('--streamer', type=lambda value: int(value, 0), default=0x100,
+                                 help="Streamer index of the reports")
+        self.parser.add_argument('--selector', type=lambda value: int(value, 0), default=0xFFFF,
+                                 help="Streamer selector of the reports")
+        self.parser.add_argument('--column', action='append', default=[], metavar='FIELD=COLUMN',
+                                 help="Column holding a field: stream, timestamp, value or seqid (repeatable)")
+        self.parser.add_argument('--stream', help="Stream of every reading, if there is no stream column")
+        self.parser.add_argument('--max-events', type=int, help="Maximum number of events per report")
+        self.parser.add_argument('--max-bytes', type=int, help="Maximum size in bytes of every report")
+        self.parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                                 help="Rows sent to a worker at once")
+        self.parser.add_argument('--workers', type=int, default=None,
+                                 help="Worker processes (default: number of CPUs, 0: no pool)")
+        self.parser.add_argument('--skip-invalid', action='store_true', help="Skip invalid rows instead of failing")
+        self.parser.add_argument('--output-dir', help="Directory to write the reports to")
+        self.parser.add_argument('--upload', action='store_true', help="Upload the reports")
+        self.parser.add_argument('--compression', choices=['gzip', 'zstd'],
+                                 help="Compress written reports, and the request body of uploads")
+        self.parser.add_argument('--progress-interval', type=float, default=5.0,
+                                 help="Seconds between progress logs")
+
+    def main(self):
+        if not self.args.output_dir and not self.args.upload:
+            self._critical_exit('Nothing to do: use --output-dir and/or --upload')
+
+        if self.args.upload:
+            super().main()
+        else:
+            self.run()
+
+    def after_login(self):
+        self.run()
+
+    def _columns(self) -> Dict[str, str]:
+        columns = {}
+        for item in self.args.column:
+            field, sep, column = item.partition('=')
+            if not sep or field not in FIELDS:
+                self._critical_exit('Invalid column mapping {}: expected FIELD=COLUMN, FIELD one of {}'.format(
+                    item, ', '.join(FIELDS)))
+            columns[field] = column
+        return columns
+
+    def _rows(self) -> Iterator[dict]:
+        for path in self.args.inputs:
+            fmt = self.args.format or detect_format(path)
+            if path == '-':
+                yield from iter_rows(io.TextIOWrapper(sys.stdin.buffer, newline=''), fmt)
+                continue
+            with open(path, 'r', newline='') as infile:
+                yield from iter_rows(infile, fmt)
+
+    def run(self):
+        """Build, write and upload the reports."""
+        if self.args.output_dir:
+            os.makedirs(self.args.output_dir, exist_ok=True)
+
+        progress = _Progress(self.args.progress_interval)
+        index = 0
+        warned = False
+        try:
+            for chunk in build_reports(self._rows(), self.args.device, self._columns(), stream=self.args.stream,
+                                       streamer=self.args.streamer, selector=self.args.selector,
+                                       max_events=self.args.max_events, max_bytes=self.args.max_bytes,
+                                       chunk_rows=self.args.chunk_rows, max_workers=self.args.workers,
+                                       skip_invalid=self.args.skip_invalid):
+                size = 0
+                for report in chunk.reports:
+                    if report.report_id == ArchFXDataPoint.InvalidReadingID:
+                        if self.args.upload:
+                            self._critical_exit('Readings have no seqid, so their reports can\'t be deduplicated '
+                                                'by the cloud: map a seqid column with --column seqid=COLUMN')
+                        if not warned:
+                            logger.warning("Readings have no seqid: reports are written with seqid 0")
+                            warned = True
+                    size += len(report.encode())
+                    index += 1
+                    if self.args.output_dir:
+                        name = '{:x}-{}-{}-{:06d}.mp'.format(report.origin, report.origin_streamer, report.report_id,
+                                                             index)
+                        report.write(os.path.join(self.args.output_dir, name), compression=self.args.compression)
+                    if self.args.upload:
+                        count = report.upload(self.api, compression=self.args.compression)
+                        logger.debug("Uploaded report %s: %d new readings", report.report_id, count)
+                progress.update(chunk, size)
+        except DataError as err:
+            self._critical_exit(str(err))
+        progress.log()
+
+
+def main():
+    """Entry point of the archfx-build-reports console script."""
+    BuildReportsMain().main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Decode many saved reports in parallel.
+
+Reports saved with ArchFXReport.save() or write() (plain, compact or compressed)
+are read and decoded by a pool of worker processes, a chunk of files at a time.
+Only a bounded number of chunks is in flight, so memory stays proportional to
+max_in_flight * chunk_size reports no matter how many files are loaded, and
+results are yielded in file order. A file that can't be read or decoded yields
+a result with an error instead of stopping the run.
+
+Usage:
+    for result in iter_reports('/data/reports', max_workers=8):
+        if result.error:
+            logger.warning('{0}: {1}'.format(result.path, result.error))
+            continue
+        process(result.origin, result.data)
+"""
+
+import glob
+import logging
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
+
+from .flexible_dictionary import ArchFXFlexibleDictionaryReport
+
+DEFAULT_PATTERN = '*.mp'
+DEFAULT_CHUNK_SIZE = 16
+
+logger = logging.getLogger(__name__)
+
+BulkResult = namedtuple('BulkResult', ['path', 'origin', 'data', 'error'])
+BulkResult.__doc__ = """Decoded report file: device ID, data (list of ArchFXDataPoint or a DataPointBatch)
+and error (None, or a description of why the file could not be decoded)."""
+
+
+def find_reports(source: str, pattern: str = DEFAULT_PATTERN, recursive: bool = False) -> List[str]:
+    """List the report files of a directory, or matching a glob.
+    Args:
+        source: A directory, or a glob pattern like '/data/**/*.mp'
+        pattern: File name pattern, when source is a directory
+        recursive: Whether to also look into subdirectories of a directory (or expand ** in a glob)
+    Returns:
+        list(str): The sorted paths of all matching files
+    """
+    if os.path.isdir(source):
+        source = os.path.join(source, '**', pattern) if recursive else os.path.join(source, pattern)
+    return sorted(path for path in glob.glob(source, recursive=recursive) if os.path.isfile(path))
+
+
+def decode_file(path: str, batches: bool = False) -> BulkResult:
+    """Read and decode a single report file, catching any error."""
+    try:
+        with ArchFXFlexibleDictionaryReport.FromFile(path) as report:
+            if batches:
+                from .batch import DataPointBatch  # pylint: disable=import-outside-toplevel
+                data = DataPointBatch.FromReport(report)
+            else:
+                data = report.visible_data
+            return BulkResult(path, report.origin, data, None)
+    except Exception as err:  # pylint: disable=broad-except
+        return BulkResult(path, None, None, '{}: {}'.format(type(err).__name__, err))
+
+
+def _decode_chunk(paths: List[str], batches: bool) -> List[BulkResult]:
+    return [decode_file(path, batches) for path in paths]
+
+
+def iter_reports(source,
+                 pattern: str = DEFAULT_PATTERN,
+                 recursive: bool = False,
+                 batches: bool = False,
+                 max_workers: Optional[int] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_in_flight: Optional[int] = None) -> Iterator[BulkResult]:
+    """Decode report files across a pool of processes.
+    Args:
+        source: A directory, a glob pattern (see find_reports()) or a list of file paths
+        pattern: File name pattern, when source is a directory
+        recursive: Whether to look into subdirectories
+        batches: Whether to decode into DataPointBatch (requires numpy) instead of lists of ArchFXDataPoint
+        max_workers: Number of worker processes. None uses the number of CPUs, 0 decodes in this process.
+        chunk_size: Number of files sent to a worker at once
+        max_in_flight: Maximum number of chunks submitted and not yet yielded. Defaults to twice the workers.
+    Returns:
+        Iterator over BulkResult, in file order
+    """
+    paths = find_reports(source, pattern, recursive) if isinstance(source, str) else list(source)
+    chunks = (paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size))
+
+    if max_workers == 0:
+        for chunk in chunks:
+            yield from _decode_chunk(chunk, batches)
+        return
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_in_flight is None:
+        max_in_flight = 2 * max_workers
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, executor.submit(_decode_chunk, chunk, batches)))
+            if len(pending) >= max_in_flight:
+                yield from _chunk_results(*pending.popleft())
+
+        while pending:
+            yield from _chunk_results(*pending.popleft())
+
+
+def _chunk_results(chunk: List[str], future) -> List[BulkResult]:
+    try:
+        return future.result()
+    except Exception as err:  # pylint: disable=broad-except
+        # The worker itself failed (e.g. it was killed), not the decoding of a file
+        logger.warning('Failed to decode %d reports starting at %s: %s', len(chunk), chunk[0], err)
+        error = '{}: {}'.format(type(err).__name__, err)
+        return [BulkResult(path, None, None, error) for path in chunk]
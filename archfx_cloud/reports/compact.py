@@ -0,0 +1,216 @@
+"""A compact, column oriented report format.
+
+The v300 format stores the same information as the v200 flexible dictionary
+format, but instead of a list of event dictionaries (repeating every key name and
+storing timestamps as ISO strings) it stores one column per field:
+- stream: index of every event's stream in a per-report table of stream IDs
+- timestamp: int64 microseconds since the epoch, delta encoded
+- dev_seqid: reading IDs, delta encoded
+- value: little endian float64 values packed as a single binary blob
+- extra_data: per event list of alternating (key index, value) pairs, with key names
+    stored once in a per-report table
+- data: sparse list of (event index, raw data) pairs
+
+Both formats are decoded by ArchFXFlexibleDictionaryReport.decode(), which detects
+the format automatically.
+"""
+
+import datetime
+import sys
+from array import array
+from typing import Iterable, List, Tuple, Union
+
+import msgpack
+
+from ..utils.columnar import datetime_to_us, us_to_datetime
+from ..utils.slugs import ArchFxDeviceSlug
+from .exceptions import DataError
+from .flexible_dictionary import ArchFXFlexibleDictionaryReport, _encode_datetime
+from .report import ArchFXDataPoint
+
+
+def _delta_encode(values: List[int]) -> List[int]:
+    previous = 0
+    deltas = []
+    for value in values:
+        deltas.append(value - previous)
+        previous = value
+    return deltas
+
+
+def _delta_decode(deltas: List[int]) -> List[int]:
+    current = 0
+    values = []
+    for delta in deltas:
+        current += delta
+        values.append(current)
+    return values
+
+
+def _pack_floats(values: List[float]) -> bytes:
+    packed = array('d', values)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack_floats(data: bytes) -> array:
+    values = array('d')
+    values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def encode_columns(data: Iterable[ArchFXDataPoint]) -> Tuple[dict, int, int]:
+    """Encode readings into the v300 column dictionary.
+    Returns:
+        (dict, int, int): The columns, and the lowest and highest valid reading IDs
+    """
+    lowest_id = ArchFXDataPoint.InvalidReadingID
+    highest_id = ArchFXDataPoint.InvalidReadingID
+    stream_index = {}
+    key_index = {}
+    stream = []
+    timestamp = []
+    reading_id = []
+    value = []
+    extra_data = []
+    raw_data = []
+
+    for i, reading in enumerate(data):
+        index = stream_index.get(reading.stream)
+        if index is None:
+            index = stream_index[reading.stream] = len(stream_index)
+        stream.append(index)
+
+        timestamp.append(datetime_to_us(reading.timestamp))
+        reading_id.append(reading.reading_id)
+        if reading.reading_id != ArchFXDataPoint.InvalidReadingID:
+            if lowest_id == ArchFXDataPoint.InvalidReadingID or reading.reading_id < lowest_id:
+                lowest_id = reading.reading_id
+            if highest_id == ArchFXDataPoint.InvalidReadingID or reading.reading_id > highest_id:
+                highest_id = reading.reading_id
+        value.append(reading.value)
+
+        if reading.summary_data:
+            pairs = []
+            for key, item in reading.summary_data.items():
+                index = key_index.get(key)
+                if index is None:
+                    index = key_index[key] = len(key_index)
+                pairs.append(index)
+                pairs.append(item)
+            extra_data.append(pairs)
+        else:
+            extra_data.append(None)
+
+        if reading.raw_data is not None:
+            raw_data.append([i, reading.raw_data])
+
+    columns = {
+        "streams": list(stream_index),
+        "keys": list(key_index),
+        "stream": stream,
+        "timestamp": _delta_encode(timestamp),
+        "dev_seqid": _delta_encode(reading_id),
+        "value": _pack_floats(value),
+        "extra_data": extra_data,
+        "data": raw_data,
+    }
+    return columns, lowest_id, highest_id
+
+
+def decode_columns(columns: dict) -> List[ArchFXDataPoint]:
+    """Decode the v300 column dictionary into a list of readings."""
+    streams = columns.get("streams", [])
+    keys = columns.get("keys", [])
+    stream = columns.get("stream", [])
+    timestamp = _delta_decode(columns.get("timestamp", []))
+    reading_id = _delta_decode(columns.get("dev_seqid", []))
+    value = _unpack_floats(columns.get("value", b''))
+    extra_data = columns.get("extra_data", [])
+    raw_data = dict((index, raw) for index, raw in columns.get("data", []))
+
+    count = len(stream)
+    if any(len(column) != count for column in (timestamp, reading_id, value, extra_data)):
+        raise DataError("Invalid v300 report: all columns must have the same number of events")
+
+    data = []
+    for i in range(count):
+        pairs = extra_data[i]
+        summary_data = {keys[pairs[j]]: pairs[j + 1] for j in range(0, len(pairs), 2)} if pairs else None
+        data.append(ArchFXDataPoint(
+            us_to_datetime(timestamp[i]),
+            streams[stream[i]],
+            value[i],
+            summary_data,
+            raw_data.get(i),
+            reading_id=reading_id[i]
+        ))
+
+    return data
+
+
+class ArchFXCompactReport(ArchFXFlexibleDictionaryReport):
+    """A list of readings encoded in the compact, column oriented v300 format.
+    Decoding (including lazy decoding and header attributes) is shared with
+    ArchFXFlexibleDictionaryReport, which detects the format of the raw report.
+    Note that ArchFX Cloud needs to support the v300 format for these reports to be uploaded.
+    Args:
+        rawreport: The raw data of this report
+        signed: Whether this report is signed to specify who it is from
+        encrypted: Whether this report is encrypted
+        received_time: The time in UTC when this report was received from a device.
+            If not received, the time is assumed to be utcnow().
+        lazy: Whether to defer decoding until the data or header attributes are accessed
+        memory_mode: One of ArchFXReport.KEEP_ALL, DROP_RAW or DROP_DECODED
+    """
+
+    FORMAT_TAG = "v300"
+
+    @classmethod
+    def FromReadings(cls,
+                     device: Union[str, int],
+                     data: Iterable[ArchFXDataPoint],
+                     report_id: int = ArchFXDataPoint.InvalidReadingID,
+                     selector: int = 0xFFFF,
+                     streamer: int = 0x100,
+                     sent_timestamp: datetime.datetime = None,
+                     received_time: datetime.datetime = None,
+                     seqid_index=None):
+        """Create a compact report from a list of readings and events.
+        Args:
+            device: The uuid or slug of the device that this report came from
+            data: A list (or any iterable) of the events contained in the report.
+            report_id: The id of the report.
+            selector: The streamer selector of this report.
+            streamer: The streamer id that this reading was sent from.
+            sent_timestamp: The device's uptime that sent this report.
+            received_time: The UTC time when this report was received from an IOTile device.  If it is being
+                created now, received_time defaults to datetime.utcnow().
+            seqid_index: Optional SeqidIndex. Readings it lists as already accepted are left out.
+        Returns:
+            ArchFXCompactReport: A report containing the data passed in.
+        """
+
+        device = ArchFxDeviceSlug(device).get_id()
+        if seqid_index is not None:
+            data = seqid_index.filter(device, streamer, data)
+
+        columns, lowest_id, highest_id = encode_columns(data)
+
+        report_dict = {
+            "format": cls.FORMAT_TAG,
+            "device": device,
+            "streamer_index": streamer,
+            "streamer_selector": selector,
+            "seqid": report_id,
+            "lowest_id": lowest_id,
+            "highest_id": highest_id,
+            "sent_timestamp": sent_timestamp,
+            "columns": columns,
+        }
+
+        encoded = msgpack.packb(report_dict, default=_encode_datetime, use_bin_type=True)
+        return ArchFXCompactReport(encoded, signed=False, encrypted=False, received_time=received_time)
@@ -0,0 +1,256 @@
+"""Merge many small reports into fewer large ones.
+
+Reports are grouped by (device, streamer_index). The events of every group are
+merged in seqid (dev_seqid) order, events with a seqid that was already seen
+are dropped, and the result is split into reports bounded by number of events
+and/or size, with recomputed lowest_id, highest_id and seqid (see
+ArchFXFlexibleDictionaryReport.ChunkedFromReadings()).
+
+Compaction is an external merge sort: events are buffered in memory (as encoded
+msgpack, without decoding them into ArchFXDataPoint) until run_size events were
+added, then every group's buffer is sorted and spilled to a temporary run file.
+finish() merges the runs of each group with heapq.merge, so memory only depends
+on run_size and the number of runs, not on the total number of events. At most
+max_fan_in runs are open at once: groups with more runs are first merged in
+passes, max_fan_in runs at a time, into fewer, larger runs.
+
+Usage:
+    for report in compact_reports(reports, max_events=100000):
+        report.upload(api)
+"""
+
+import heapq
+import logging
+import os
+import struct
+import tempfile
+from collections import OrderedDict
+from typing import Iterable, Iterator, Optional
+
+from ..utils.framing import encode_frame, iter_frames
+from .exceptions import DataError
+from .flexible_dictionary import (
+    ArchFXFlexibleDictionaryReport,
+    ArchFXFlexibleDictionaryReportWriter,
+    _chunk_encoded,
+    _new_packer,
+)
+from .report import ArchFXDataPoint, ArchFXReport
+
+DEFAULT_RUN_SIZE = 100000
+DEFAULT_MAX_FAN_IN = 64
+
+logger = logging.getLogger(__name__)
+
+# Sort key of a spilled event: reading id and arrival order
+_RUN_KEY = struct.Struct('<qQ')
+
+
+class _Group:
+    """Events and report attributes of a single (device, streamer_index)."""
+
+    __slots__ = ('device', 'streamer', 'selector', 'report_id', 'sent_timestamp', 'buffer', 'runs')
+
+    def __init__(self, device: int, streamer: int, selector: int):
+        self.device = device
+        self.streamer = streamer
+        self.selector = selector
+        self.report_id = ArchFXDataPoint.InvalidReadingID
+        self.sent_timestamp = None
+        self.buffer = []
+        self.runs = []
+
+
+class ReportCompactor:
+    """Merge and deduplicate the events of many reports.
+    Args:
+        max_events: Maximum number of events per compacted report.
+        max_bytes: Maximum size in bytes of every compacted report.
+        run_size: Number of events kept in memory before they are spilled to a temporary file.
+        tmp_dir: Directory for the temporary run files. Defaults to the system temporary directory.
+        max_fan_in: Maximum number of run files merged (so open) at once. At least 2.
+    """
+
+    def __init__(self,
+                 max_events: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 run_size: int = DEFAULT_RUN_SIZE,
+                 tmp_dir: Optional[str] = None,
+                 max_fan_in: int = DEFAULT_MAX_FAN_IN):
+        if max_fan_in < 2:
+            raise DataError("max_fan_in must be at least 2", max_fan_in=max_fan_in)
+
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.run_size = run_size
+        self.tmp_dir = tmp_dir
+        self.max_fan_in = max_fan_in
+
+        self.events = 0
+        self.duplicates = 0
+
+        self._groups = OrderedDict()
+        self._buffered = 0
+        self._sequence = 0
+        self._run_count = 0
+        self._tmp = None
+        self._packer = _new_packer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, report: ArchFXReport):
+        """Add the events of a report."""
+        key = (report.origin, report.origin_streamer)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _Group(report.origin, report.origin_streamer, report.streamer_selector)
+
+        if report.report_id is not None and report.report_id >= group.report_id:
+            group.report_id = report.report_id
+            group.sent_timestamp = report.sent_timestamp
+
+        for event in _iter_events(report):
+            reading_id = event.get('dev_seqid') or ArchFXDataPoint.InvalidReadingID
+            group.buffer.append((reading_id, self._sequence, self._packer.pack(event)))
+            self._sequence += 1
+            self._buffered += 1
+            self.events += 1
+            if self._buffered >= self.run_size:
+                self._spill()
+
+    def extend(self, reports: Iterable[ArchFXReport]):
+        """Add the events of several reports."""
+        for report in reports:
+            self.add(report)
+
+    def _write_run(self, events: Iterable) -> str:
+        if self._tmp is None:
+            self._tmp = tempfile.TemporaryDirectory(prefix='archfx-compaction-', dir=self.tmp_dir)
+
+        path = os.path.join(self._tmp.name, 'run-{}.bin'.format(self._run_count))
+        self._run_count += 1
+        with open(path, 'wb') as outfile:
+            for reading_id, sequence, encoded in events:
+                outfile.write(encode_frame(_RUN_KEY.pack(reading_id, sequence) + encoded))
+        return path
+
+    def _spill(self):
+        for group in self._groups.values():
+            if not group.buffer:
+                continue
+
+            group.buffer.sort(key=lambda item: item[:2])
+            group.runs.append(self._write_run(group.buffer))
+            group.buffer = []
+
+        logger.debug("Spilled %d events to temporary runs", self._buffered)
+        self._buffered = 0
+
+    def _reduce_runs(self, group: _Group):
+        """Merge the runs of a group, max_fan_in at a time, until they can all be merged at once."""
+        while len(group.runs) > self.max_fan_in:
+            runs = []
+            for i in range(0, len(group.runs), self.max_fan_in):
+                batch = group.runs[i:i + self.max_fan_in]
+                if len(batch) == 1:
+                    runs.extend(batch)
+                    continue
+
+                runs.append(self._write_run(heapq.merge(*(_iter_run(path) for path in batch),
+                                                        key=lambda item: item[:2])))
+                for path in batch:
+                    os.remove(path)
+
+            logger.debug("Merged %d temporary runs into %d", len(group.runs), len(runs))
+            group.runs = runs
+
+    def _merged_events(self, group: _Group) -> Iterator:
+        self._reduce_runs(group)
+        group.buffer.sort(key=lambda item: item[:2])
+        sources = [_iter_run(path) for path in group.runs]
+        sources.append(iter(group.buffer))
+
+        last_id = None
+        for reading_id, _, encoded in heapq.merge(*sources, key=lambda item: item[:2]):
+            # Events without a reading id can't be deduplicated
+            if reading_id != ArchFXDataPoint.InvalidReadingID and reading_id == last_id:
+                self.duplicates += 1
+                continue
+            last_id = reading_id
+            yield encoded, reading_id
+
+    def finish(self, received_time=None) -> Iterator[ArchFXFlexibleDictionaryReport]:
+        """Merge the events added so far into compacted reports, group by group.
+        The last report of a group gets the highest seqid (and the sent_timestamp) of
+        the group's input reports, and previous reports use their highest_id + 1.
+        Temporary files are deleted once all reports were yielded.
+        Returns:
+            Iterator over ArchFXFlexibleDictionaryReport
+        """
+        try:
+            for group in self._groups.values():
+                yield from _chunk_encoded(
+                    lambda group=group: _new_writer(group),
+                    self._merged_events(group),
+                    self.max_events,
+                    self.max_bytes,
+                    received_time,
+                )
+        finally:
+            self.close()
+
+    def close(self):
+        """Delete the temporary run files."""
+        self._groups = OrderedDict()
+        self._buffered = 0
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
+
+
+def compact_reports(reports: Iterable[ArchFXReport],
+                    max_events: Optional[int] = None,
+                    max_bytes: Optional[int] = None,
+                    run_size: int = DEFAULT_RUN_SIZE,
+                    tmp_dir: Optional[str] = None,
+                    received_time=None,
+                    max_fan_in: int = DEFAULT_MAX_FAN_IN) -> Iterator[ArchFXFlexibleDictionaryReport]:
+    """Merge reports into fewer, larger ones (see ReportCompactor).
+    Args:
+        reports: The reports to compact (any iterable, e.g. reports lazily loaded from files)
+        max_events: Maximum number of events per compacted report.
+        max_bytes: Maximum size in bytes of every compacted report.
+        run_size: Number of events kept in memory before they are spilled to a temporary file.
+        tmp_dir: Directory for the temporary run files.
+        received_time: The received time of the compacted reports.
+        max_fan_in: Maximum number of run files merged (so open) at once.
+    Returns:
+        Iterator over the compacted ArchFXFlexibleDictionaryReport
+    """
+    compactor = ReportCompactor(max_events=max_events, max_bytes=max_bytes, run_size=run_size, tmp_dir=tmp_dir,
+                                max_fan_in=max_fan_in)
+    compactor.extend(reports)
+    return compactor.finish(received_time=received_time)
+
+
+def _iter_run(path: str) -> Iterator:
+    with open(path, 'rb') as infile:
+        for _, payload in iter_frames(infile):
+            reading_id, sequence = _RUN_KEY.unpack_from(payload)
+            yield reading_id, sequence, payload[_RUN_KEY.size:]
+
+
+def _iter_events(report: ArchFXReport) -> Iterator[dict]:
+    if isinstance(report, ArchFXFlexibleDictionaryReport):
+        return report.iter_events()
+    return (reading.asdict() for reading in report.iter_data())
+
+
+def _new_writer(group: _Group) -> ArchFXFlexibleDictionaryReportWriter:
+    return ArchFXFlexibleDictionaryReportWriter(group.device, report_id=group.report_id, selector=group.selector,
+                                                streamer=group.streamer, sent_timestamp=group.sent_timestamp,
+                                                spool_size=None)
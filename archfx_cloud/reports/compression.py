@@ -0,0 +1,138 @@
+"""Optional compression of encoded reports.
+
+Compressed reports are framed so they describe themselves: a 4 byte magic
+(b'AFXZ'), one byte identifying the codec, then the compressed report.
+msgpack encoded reports always start with a map header, so a framed report
+can never be mistaken for an uncompressed one (and vice versa).
+
+Supported codecs:
+- gzip: from the standard library
+- zstd: requires zstandard (`pip install archfx_cloud[zstd]`)
+
+The framing is only used for reports stored on disk or in a spool: uploads
+always send the plain report, and compress the HTTP request body with the
+same codecs and a standard Content-Encoding header (see compress_content()).
+"""
+
+import gzip
+import zlib
+from io import BytesIO
+from typing import Optional
+
+from .exceptions import DataError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'AFXZ'
+GZIP = 'gzip'
+ZSTD = 'zstd'
+
+_CODEC_IDS = {GZIP: 1, ZSTD: 2}
+_CODEC_NAMES = {value: key for key, value in _CODEC_IDS.items()}
+_HEADER_SIZE = len(MAGIC) + 1
+_ERRORS = (OSError, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+def _require_zstd():
+    if zstandard is None:
+        raise ImportError("zstandard is required for zstd compression. "
+                          "Install with `pip install archfx_cloud[zstd]`")
+
+
+def _header(codec: str) -> bytes:
+    if codec not in _CODEC_IDS:
+        raise DataError("Unknown compression codec: {}".format(codec))
+    return MAGIC + bytes([_CODEC_IDS[codec]])
+
+
+def is_compressed(data) -> bool:
+    """Return whether an encoded report is compressed (framed by compress())."""
+    return len(data) >= _HEADER_SIZE and bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def get_codec(data) -> Optional[str]:
+    """Return the codec of a compressed report, or None if it is not compressed."""
+    if not is_compressed(data):
+        return None
+
+    codec = _CODEC_NAMES.get(data[len(MAGIC)])
+    if codec is None:
+        raise DataError("Unknown compression codec id: {}".format(data[len(MAGIC)]))
+    return codec
+
+
+def compress_content(data, codec: str = ZSTD, level: Optional[int] = None) -> bytes:
+    """Compress data in the standard gzip or zstd format, without the report framing.
+    The codec name is also the HTTP Content-Encoding of the result.
+    Args:
+        data: The data to compress
+        codec: GZIP or ZSTD
+        level: The compression level. None uses the codec's default.
+    Returns:
+        bytes: The compressed data
+    """
+    _header(codec)
+    if codec == GZIP:
+        # gzip.compress() only accepts mtime from Python 3.8
+        out = BytesIO()
+        with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=9 if level is None else level, mtime=0) as writer:
+            writer.write(data)
+        return out.getvalue()
+
+    _require_zstd()
+    compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+    return compressor.compress(data)
+
+
+def compress(data, codec: str = ZSTD, level: Optional[int] = None) -> bytes:
+    """Compress an encoded report.
+    Args:
+        data: The encoded report
+        codec: GZIP or ZSTD
+        level: The compression level. None uses the codec's default.
+    Returns:
+        bytes: The framed, compressed report
+    """
+    return _header(codec) + compress_content(data, codec, level)
+
+
+def decompress(data) -> bytes:
+    """Decompress a report compressed with compress() or written by open_writer()."""
+    codec = get_codec(data)
+    if codec is None:
+        raise DataError("Report is not compressed")
+
+    payload = memoryview(data)[_HEADER_SIZE:]
+    try:
+        if codec == GZIP:
+            return gzip.decompress(payload)
+
+        _require_zstd()
+        # Streamed frames don't record their content size, so always use a decompression object
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        decompressed = decompressor.decompress(payload)
+        if not decompressor.eof:
+            raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+        return decompressed
+    except _ERRORS as err:
+        raise DataError("Invalid {} compressed report: {}".format(codec, err)) from err
+
+
+def open_writer(out, codec: str = ZSTD, level: Optional[int] = None):
+    """Write the frame header to a binary file like object and return a compressing writer over it.
+    Everything written to the returned object is compressed into out. Closing it
+    finishes the compressed stream but leaves out open.
+    """
+    header = _header(codec)
+    if codec == ZSTD:
+        _require_zstd()
+
+    out.write(header)
+    if codec == GZIP:
+        return gzip.GzipFile(fileobj=out, mode='wb', compresslevel=9 if level is None else level, mtime=0)
+
+    compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+    return compressor.stream_writer(out, closefd=False)
@@ -1,12 +1,30 @@
 """A flexible dictionary based report format suitable for msgpack and json serialization."""
 
 import datetime
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from collections import namedtuple
 from io import BytesIO
-from typing import List, Union
+from typing import Iterable, Iterator, Optional, Union
 import msgpack
 from ..utils.slugs import ArchFxDeviceSlug
+from . import compression as _compression
 from .exceptions import DataError
-from .report import ArchFXDataPoint, ArchFXReport
+from .report import ArchFXDataPoint, ArchFXReport, LazyRawData
+
+logger = logging.getLogger(__name__)
+
+# Key of the optional raw data section, written before the events (see ArchFXFlexibleDictionaryReportWriter)
+RAW_DATA_KEY = 'raw_data'
+_BIN32_HEADER = struct.Struct('>BI')
+
+ReportHeader = namedtuple('ReportHeader', ['format', 'device', 'streamer_index', 'streamer_selector', 'seqid',
+                                           'lowest_id', 'highest_id', 'sent_timestamp'])
+ReportHeader.__doc__ = """The attributes of a report, as encoded in its header (see read_header())."""
 
 
 class ArchFXFlexibleDictionaryReport(ArchFXReport):
@@ -14,29 +32,62 @@ class ArchFXFlexibleDictionaryReport(ArchFXReport):
     This report format is designed to be suitable for storing in any
     format that supports key/value objects like json, msgpack, yaml,
     etc.
+    Reports with a raw data section (see ArchFXFlexibleDictionaryReportWriter)
+    decode into data points whose raw_data is only unpacked when accessed.
+    Reports in the compact v300 format (see ArchFXCompactReport) are
+    detected and decoded as well, and so are compressed reports (see
+    archfx_cloud.reports.compression): they are decompressed on creation,
+    with the codec and compression ratio kept in the compression and
+    compression_ratio attributes.
     Args:
         rawreport: The raw data of this report
         signed: Whether this report is signed to specify who it is from
         encrypted: Whether this report is encrypted
         received_time: The time in UTC when this report was received from a device.
             If not received, the time is assumed to be utcnow().
+        lazy: Whether to defer decoding until the data or header attributes are accessed
+        memory_mode: One of ArchFXReport.KEEP_ALL, DROP_RAW or DROP_DECODED
     """
 
     FORMAT_TAG = "v200"
+    HEADER_ATTRIBUTES = ('origin', 'report_id', 'sent_timestamp', 'origin_streamer', 'streamer_selector',
+                         'lowest_id', 'highest_id')
+
+    def __init__(self,
+                 rawreport: bytearray,
+                 signed: bool,
+                 encrypted: bool,
+                 received_time: datetime.datetime = None,
+                 lazy: bool = False,
+                 memory_mode: str = ArchFXReport.KEEP_ALL):
+        self.compression = None
+        self.compression_ratio = None
+        self._mmap = None
+        self._asdict = None
+        if rawreport is not None and _compression.is_compressed(rawreport):
+            self.compression = _compression.get_codec(rawreport)
+            decompressed = _compression.decompress(rawreport)
+            self.compression_ratio = len(decompressed) / len(rawreport)
+            rawreport = decompressed
+
+        super().__init__(rawreport, signed, encrypted, received_time=received_time, lazy=lazy,
+                         memory_mode=memory_mode)
 
     @classmethod
     def FromReadings(cls,
                      device: Union[str, int],
-                     data: List[ArchFXDataPoint],
+                     data: Iterable[ArchFXDataPoint],
                      report_id: int = ArchFXDataPoint.InvalidReadingID,
                      selector: int = 0xFFFF,
                      streamer: int = 0x100,
                      sent_timestamp: datetime.datetime = None,
-                     received_time: datetime.datetime = None):
+                     received_time: datetime.datetime = None,
+                     seqid_index=None,
+                     raw_data_section: bool = False):
         """Create a flexible dictionary report from a list of readings and events.
         Args:
             device: The uuid or slug of the device that this report came from
-            events: A list of the events contained in the report.
+            data: A list (or any iterable) of the events contained in the report.
             report_id: The id of the report.  If not provided it defaults to IOTileReading.InvalidReadingID.
                 Note that you can specify anything you want for the report id but for actual IOTile devices
                 the report id will always be greater than the id of all of the readings contained in the report
@@ -47,46 +98,220 @@ class ArchFXFlexibleDictionaryReport(ArchFXReport):
             sent_timestamp: The device's uptime that sent this report.
             received_time: The UTC time when this report was received from an IOTile device.  If it is being
                 created now, received_time defaults to datetime.utcnow().
+            seqid_index: Optional SeqidIndex (see archfx_cloud.reports.seqid_index). Readings it lists as
+                already accepted by the cloud are left out of the report.
+            raw_data_section: Whether to store raw_data in a separate section of the report, so it is only
+                decoded when accessed (see ArchFXFlexibleDictionaryReportWriter).
         Returns:
             ArchFXFlexibleDictionaryReport: A report containing the data passed in.
         """
 
-        lowest_id = ArchFXDataPoint.InvalidReadingID
-        highest_id = ArchFXDataPoint.InvalidReadingID
+        if seqid_index is not None:
+            data = seqid_index.filter(ArchFxDeviceSlug(device).get_id(), streamer, data)
+
+        writer = ArchFXFlexibleDictionaryReportWriter(
+            device,
+            report_id=report_id,
+            selector=selector,
+            streamer=streamer,
+            sent_timestamp=sent_timestamp,
+            spool_size=None,
+            raw_data_section=raw_data_section,
+        )
+        writer.extend(data)
+        return writer.finish(received_time=received_time)
+
+    @classmethod
+    def FromFile(cls,
+                 path: str,
+                 received_time: datetime.datetime = None,
+                 lazy: bool = True,
+                 memory_mode: str = ArchFXReport.KEEP_ALL) -> 'ArchFXFlexibleDictionaryReport':
+        """Load a report saved with save() or write() by memory mapping the file.
+        The raw report is a memoryview over the mapped file, so the report is
+        decoded, saved and uploaded without reading the whole file into memory
+        first. Compressed reports are decompressed into memory. Call close() (or
+        use the report as a context manager) to unmap the file.
+        Args:
+            path: The path of the report file
+            received_time: The UTC time when this report was received from an IOTile device.
+            lazy: Whether to defer decoding until the data or header attributes are accessed
+            memory_mode: One of ArchFXReport.KEEP_ALL, DROP_RAW or DROP_DECODED
+        Returns:
+            ArchFXFlexibleDictionaryReport: The report stored in the file
+        """
+        with open(path, 'rb') as infile:
+            if os.fstat(infile.fileno()).st_size == 0:
+                raise DataError("Empty report file: {}".format(path))
+            mapped = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(mapped)
+        if _compression.is_compressed(view):
+            try:
+                return cls(view, signed=False, encrypted=False, received_time=received_time, lazy=lazy,
+                           memory_mode=memory_mode)
+            finally:
+                view.release()
+                mapped.close()
 
-        for item in iter(data):
-            if item.reading_id == ArchFXDataPoint.InvalidReadingID:
-                continue
+        report = cls(view, signed=False, encrypted=False, received_time=received_time, lazy=lazy,
+                     memory_mode=memory_mode)
+        report._mmap = mapped
+        return report
 
-            if lowest_id == ArchFXDataPoint.InvalidReadingID or item.reading_id < lowest_id:
-                lowest_id = item.reading_id
-            if highest_id == ArchFXDataPoint.InvalidReadingID or item.reading_id > highest_id:
-                highest_id = item.reading_id
+    def close(self):
+        """Release the memory mapped file of a report loaded with FromFile().
+        The report can't be encoded (nor decoded, if lazy) once closed.
+        """
+        if self._mmap is None:
+            return
 
-        data_list = [x.asdict() for x in data]
+        if isinstance(self.raw_report, memoryview):
+            self.raw_report.release()
+        self.raw_report = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Views handed out (e.g. to an upload) keep the file mapped until they are released
+            pass
+        self._mmap = None
 
-        report_dict = {
-            "format": cls.FORMAT_TAG,
-            "device": ArchFxDeviceSlug(device).get_id(),
-            "streamer_index": streamer,
-            "streamer_selector": selector,
-            "seqid": report_id,
-            "lowest_id": lowest_id,
-            "highest_id": highest_id,
-            "sent_timestamp": sent_timestamp,
-            "events": data_list  # Still using 'event' for backwards compatibility with old reports
-        }
+    def __enter__(self):
+        return self
 
-        encoded = msgpack.packb(report_dict, default=_encode_datetime, use_bin_type=True)
-        return ArchFXFlexibleDictionaryReport(encoded, signed=False, encrypted=False, received_time=received_time)
+    def __exit__(self, *args):
+        self.close()
+
+    @classmethod
+    def ChunkedFromReadings(cls,
+                            device: Union[str, int],
+                            data: Iterable[ArchFXDataPoint],
+                            max_events: Optional[int] = None,
+                            max_bytes: Optional[int] = None,
+                            report_id: int = ArchFXDataPoint.InvalidReadingID,
+                            selector: int = 0xFFFF,
+                            streamer: int = 0x100,
+                            sent_timestamp: datetime.datetime = None,
+                            received_time: datetime.datetime = None,
+                            seqid_index=None) -> Iterator['ArchFXFlexibleDictionaryReport']:
+        """Split a sequence of readings into several flexible dictionary reports.
+        Readings keep their order, so every report covers a contiguous part of the
+        sequence. Each report gets its own lowest_id/highest_id. The last report
+        uses report_id as its seqid, while the previous ones use their highest_id + 1
+        (so a report id is always greater than the ids of the readings in it). Without
+        a report_id, the last report also uses its highest_id + 1.
+        Reports whose readings have no reading_id use report_id, so several reports
+        may share the same seqid: give readings IDs if the reports are uploaded.
+        Args:
+            device: The uuid or slug of the device that this report came from
+            data: A list (or any iterable) of the events to split into reports.
+            max_events: Maximum number of events per report.
+            max_bytes: Maximum size in bytes of every encoded report.
+            report_id: The id of the last report. Defaults to its highest_id + 1.
+            selector: The streamer selector of the reports.
+            streamer: The streamer id that the readings were sent from.
+            sent_timestamp: The device's uptime that sent the reports.
+            received_time: The UTC time when the reports were received from an IOTile device.
+            seqid_index: Optional SeqidIndex. Readings it lists as already accepted are left out.
+        Returns:
+            Iterator over ArchFXFlexibleDictionaryReport, in order.
+        """
+
+        if seqid_index is not None:
+            data = seqid_index.filter(ArchFxDeviceSlug(device).get_id(), streamer, data)
+
+        def _new_writer():
+            return ArchFXFlexibleDictionaryReportWriter(device, report_id=report_id, selector=selector,
+                                                        streamer=streamer, sent_timestamp=sent_timestamp,
+                                                        spool_size=None)
+
+        packer = _new_packer()
+        events = ((packer.pack(reading.asdict()), reading.reading_id) for reading in data)
+        return _chunk_encoded(_new_writer, events, max_events, max_bytes, received_time)
 
     def decode(self):
         """Decode this report from a msgpack encoded binary blob."""
 
-        report_dict = msgpack.unpackb(self.raw_report, raw=False)
+        encoded = self.encode()
+        if _find_raw_section(encoded) is not None:
+            # Walk the events, so the raw data section is referenced instead of unpacked
+            return list(self.iter_decode())
+
+        report_dict = msgpack.unpackb(encoded, raw=False)
+
+        if 'columns' in report_dict:
+            data = _decode_columns(report_dict['columns'])
+        else:
+            data = [ArchFXDataPoint.FromDict(x) for x in report_dict.get('events', [])]
+
+        self._set_header(report_dict)
+
+        return data
+
+    def decode_header(self):
+        """Decode the report attributes, skipping over the events without decoding them."""
+
+        self._set_header(_unpack_header(self.encode()))
+
+    def header(self) -> ReportHeader:
+        """Return the header attributes of this report, read from the encoded report (see read_header())."""
 
-        data = [ArchFXDataPoint.FromDict(x) for x in report_dict.get('events', [])]
+        if self.raw_report is not None:
+            return read_header(self.raw_report)
+        return ReportHeader(self.FORMAT_TAG, self.origin, self.origin_streamer, self.streamer_selector,
+                            self.report_id, self.lowest_id, self.highest_id, self.sent_timestamp)
 
+    def iter_decode(self):
+        """Decode this report one event at a time, without keeping the decoded events.
+        The report attributes (origin, report_id...) are set before the first event is yielded.
+        """
+
+        encoded = self.encode()
+        # Header keys may follow the events, so read them first
+        self._set_header(_unpack_header(encoded))
+        unpacker = msgpack.Unpacker(_BufferReader(encoded), raw=False)
+        section = None
+        for _ in range(unpacker.read_map_header()):
+            key = unpacker.unpack()
+            if key == RAW_DATA_KEY:
+                section = _read_raw_section(unpacker, encoded)
+            elif key == 'events':
+                for _ in range(unpacker.read_array_header()):
+                    yield ArchFXDataPoint.FromDict(_resolve_raw_data(unpacker.unpack(), section))
+            elif key == 'columns':
+                # Column oriented (v300) reports can only be decoded as a whole
+                yield from _decode_columns(unpacker.unpack())
+            else:
+                unpacker.skip()
+
+    def iter_events(self) -> Iterator[dict]:
+        """Iterate over the events of this report, as dictionaries (see ArchFXDataPoint.asdict()).
+        Events of v200 reports are unpacked one at a time, without creating any ArchFXDataPoint.
+        Raw data stored in a raw data section is returned as LazyRawData, which packs like the
+        dictionary it refers to.
+        """
+
+        if self.raw_report is not None:
+            encoded = self.encode()
+            unpacker = msgpack.Unpacker(_BufferReader(encoded), raw=False)
+            section = None
+            for _ in range(unpacker.read_map_header()):
+                key = unpacker.unpack()
+                if key == RAW_DATA_KEY:
+                    section = _read_raw_section(unpacker, encoded)
+                    continue
+                if key == 'events':
+                    for _ in range(unpacker.read_array_header()):
+                        yield _resolve_raw_data(unpacker.unpack(), section)
+                    return
+                if key == 'columns':
+                    break
+                unpacker.skip()
+
+        for reading in self.iter_data():
+            yield reading.asdict()
+
+    def _set_header(self, report_dict: dict):
         if 'device' not in report_dict:
             raise DataError("Invalid encoded ArchFXFlexibleDictionaryReport that did not "
                             "have a device key set with the device uuid")
@@ -99,39 +324,433 @@ class ArchFXFlexibleDictionaryReport(ArchFXReport):
         self.lowest_id = report_dict.get('lowest_id')
         self.highest_id = report_dict.get('highest_id')
 
-        return data
+    def encode(self, compression: Optional[str] = None, level: Optional[int] = None):
+        """Encode this report into a msgpack encoded binary blob.
+        Args:
+            compression: Optional codec (compression.GZIP or compression.ZSTD) to compress the report with.
+                Uncompressed reports are the default, as not every consumer supports compressed ones.
+            level: The compression level. None uses the codec's default.
+        """
+        encoded = super().encode()
+        if compression is None:
+            return encoded
+
+        compressed = _compression.compress(encoded, compression, level)
+        self.compression_ratio = len(encoded) / len(compressed)
+        logger.debug("Compressed report from %d to %d bytes with %s", len(encoded), len(compressed), compression)
+        return compressed
 
     def asdict(self):
-        """ Return this report as a dictionary """
-        return msgpack.unpackb(self.raw_report)
+        """ Return this report as a dictionary. It is only unpacked once: every call returns the same dictionary
+        Raises:
+            DataError: The raw report was dropped (memory_mode=DROP_RAW) or closed.
+        """
+        if self._asdict is None:
+            self._asdict = msgpack.unpackb(self.encode())
+        return self._asdict
 
     def serialize(self):
-        """Serialize this report including the received time."""
+        """Serialize this report including the received time.
+        The encoded report is not copied: for a report loaded with FromFile() it is a memoryview
+        of the mapped file, only valid until the report is closed. Use bytes() on it to keep it longer
+        or to pickle it.
+        Returns:
+            dict: received_time, encoded_report, report_format (the format tag of the header) and origin
+        """
 
-        raise NotImplementedError("This report format (ArchFXFlexibleDictionaryReport) does not support serialization")
+        info = super().serialize()
+        info['report_format'] = self.header().format
+        return info
 
-    def write(self, file_path: str):
-        """Write Streamer Report to disk as a msgpack file"""
+    def write(self, file_path: str, compression: Optional[str] = None, level: Optional[int] = None):
+        """Write Streamer Report to disk as a msgpack file, optionally compressed (see encode())"""
         with open(file_path, "wb") as outfile:
-            outfile.write(self.encode())
+            outfile.write(self.encode(compression, level))
 
-    def upload(self, cloud):
+    def upload(self, cloud, compression: Optional[str] = None, level: Optional[int] = None, seqid_index=None):
         """Uploads this report into ArchFX cloud
 
         Args:
             cloud: an instance of archfx_cloud.api.connection.Api. Must be authenticated.
+            compression: Optional codec (GZIP or ZSTD) to compress the request body with. The report itself is
+                always uploaded uncompressed (v200), and the body is sent with a Content-Encoding header.
+            level: The compression level. None uses the codec's default.
+            seqid_index: Optional SeqidIndex to record the readings of this report in, once accepted.
 
         Returns:
             int: The number of new readings that were accepted by the cloud as novel.
         """
-        return cloud("streamer/report").upload_fp(
-            ("report.mp", BytesIO(self.encode())),
+        encoded = self.encode()
+        if _find_raw_section(encoded) is not None:
+            # The cloud expects raw data inline in the events
+            encoded = self._inlined().encode()
+        # BytesIO shares bytes objects without copying them, but would copy a memory mapped report.
+        # The request body then streams the report a chunk at a time (see RestResource.upload_fp()).
+        fp = BytesIO(encoded) if isinstance(encoded, bytes) else _BufferReader(encoded)
+        options = {} if compression is None else {'content_encoding': compression, 'compression_level': level}
+        count = cloud("streamer/report").upload_fp(
+            ("report.mp", fp),
             timestamp=self.sent_timestamp,
+            **options,
         )['count']
 
+        if seqid_index is not None:
+            seqid_index.record(self)
+        return count
+
+    def _inlined(self) -> 'ArchFXFlexibleDictionaryReport':
+        """Return a copy of this report with its raw data section inlined in the events."""
+        writer = ArchFXFlexibleDictionaryReportWriter(self.origin, report_id=self.report_id,
+                                                      selector=self.streamer_selector, streamer=self.origin_streamer,
+                                                      sent_timestamp=self.sent_timestamp)
+        for event in self.iter_events():
+            writer.add_dict(event)
+        return writer.finish(received_time=self.received_time)
+
+
+class ArchFXFlexibleDictionaryReportWriter:
+    """Incrementally build an ArchFXFlexibleDictionaryReport.
+    Readings are encoded as soon as they are added (one at a time, through a
+    reused msgpack.Packer) into an events buffer, while lowest_id/highest_id
+    are tracked on the fly. The report header and the events array length are
+    only written by finish()/write(), so neither the readings nor their
+    dictionaries need to be kept around. With a spool_size, the events buffer
+    moves to a temporary file once it grows past that size, so peak memory is
+    bounded by the output buffer rather than by the number of readings.
+    With raw_data_section, the raw_data of every reading is encoded into a
+    separate section of the report (also spooled) and its event only keeps a
+    reference to it, so decoding the events never unpacks raw data that is not
+    accessed. Reports with a raw data section are meant for local storage:
+    upload() inlines the raw data again, as the cloud does not support them.
+    Args:
+        device: The uuid or slug of the device that this report came from
+        report_id: The id of the report.
+        selector: The streamer selector of this report.
+        streamer: The streamer id that this reading was sent from.
+        sent_timestamp: The device's uptime that sent this report.
+        spool_size: Size in bytes after which encoded events are spooled to a temporary
+            file. If None, events are always kept in memory.
+        raw_data_section: Whether to store raw_data in a separate section of the report.
+    """
+
+    DEFAULT_SPOOL_SIZE = 16 * 1024 * 1024
+
+    def __init__(self,
+                 device: Union[str, int],
+                 report_id: int = ArchFXDataPoint.InvalidReadingID,
+                 selector: int = 0xFFFF,
+                 streamer: int = 0x100,
+                 sent_timestamp: datetime.datetime = None,
+                 spool_size: Optional[int] = DEFAULT_SPOOL_SIZE,
+                 raw_data_section: bool = False):
+        self.device = ArchFxDeviceSlug(device).get_id()
+        self.report_id = report_id
+        self.selector = selector
+        self.streamer = streamer
+        self.sent_timestamp = sent_timestamp
+
+        self.count = 0
+        self.events_size = 0
+        self.raw_data_size = 0
+        self.lowest_id = ArchFXDataPoint.InvalidReadingID
+        self.highest_id = ArchFXDataPoint.InvalidReadingID
+
+        self._max_header_size = None
+        self._packer = _new_packer()
+        self._events = self._new_buffer(spool_size)
+        self._raw_data = self._new_buffer(spool_size) if raw_data_section else None
+
+    @staticmethod
+    def _new_buffer(spool_size: Optional[int]):
+        if spool_size is None:
+            return BytesIO()
+        return tempfile.SpooledTemporaryFile(max_size=spool_size)
+
+    def _track_id(self, reading_id: int):
+        if reading_id == ArchFXDataPoint.InvalidReadingID:
+            return
+
+        if self.lowest_id == ArchFXDataPoint.InvalidReadingID or reading_id < self.lowest_id:
+            self.lowest_id = reading_id
+        if self.highest_id == ArchFXDataPoint.InvalidReadingID or reading_id > self.highest_id:
+            self.highest_id = reading_id
+
+    def add(self, reading: ArchFXDataPoint) -> int:
+        """Encode a single reading into the report.
+        Returns:
+            int: The size in bytes of the encoded reading
+        """
+        return self.add_dict(reading.asdict())
+
+    def add_dict(self, event: dict) -> int:
+        """Encode a single event given in the dictionary form produced by ArchFXDataPoint.asdict().
+        Returns:
+            int: The size in bytes of the encoded event (without its raw data)
+        """
+        if self._raw_data is not None and event.get('data') is not None:
+            if self._events is None:
+                raise DataError("Cannot add readings to a report that was already finished")
+            encoded = self._packer.pack(event['data'])
+            event = dict(event, data=None, data_ref=[self.raw_data_size, len(encoded)])
+            self._raw_data.write(encoded)
+            self.raw_data_size += len(encoded)
+        return self.add_encoded(self.encode_event(event), event.get('dev_seqid'))
+
+    def encode_event(self, event: dict) -> bytes:
+        """Encode an event without adding it to the report."""
+        return self._packer.pack(event)
+
+    def add_encoded(self, encoded: bytes, reading_id: Optional[int]) -> int:
+        """Add an event previously encoded with encode_event().
+        Returns:
+            int: The size in bytes of the encoded event
+        """
+        if self._events is None:
+            raise DataError("Cannot add readings to a report that was already finished")
+
+        self._events.write(encoded)
+        self._track_id(reading_id or ArchFXDataPoint.InvalidReadingID)
+        self.count += 1
+        self.events_size += len(encoded)
+        return len(encoded)
+
+    def extend(self, readings: Iterable[ArchFXDataPoint]):
+        """Encode all readings from a list, generator or any other iterable."""
+        for reading in readings:
+            self.add(reading)
+
+    @property
+    def size(self) -> int:
+        """Upper bound of the size in bytes of the finished report."""
+        if self._max_header_size is None:
+            largest = 0xFFFFFFFFFFFFFFFF
+            self._max_header_size = len(self._header(largest, largest, largest, 0xFFFFFFFF))
+        return self._max_header_size + self.events_size + self.raw_data_size
+
+    def _header(self, report_id: int, lowest_id: int, highest_id: int, count: int) -> bytes:
+        packer = self._packer
+        header = [packer.pack_map_header(9 if self._raw_data is None else 10)]
+        for key, value in (("format", ArchFXFlexibleDictionaryReport.FORMAT_TAG),
+                           ("device", self.device),
+                           ("streamer_index", self.streamer),
+                           ("streamer_selector", self.selector),
+                           ("seqid", report_id),
+                           ("lowest_id", lowest_id),
+                           ("highest_id", highest_id),
+                           ("sent_timestamp", self.sent_timestamp)):
+            header.append(packer.pack(key))
+            header.append(packer.pack(value))
+
+        if self._raw_data is not None:
+            # Followed by the content of the raw data section, always as a bin 32
+            header.append(packer.pack(RAW_DATA_KEY))
+            header.append(_BIN32_HEADER.pack(0xc6, self.raw_data_size))
+        return b''.join(header)
+
+    def _events_header(self, count: int) -> bytes:
+        # Still using 'event' for backwards compatibility with old reports
+        return self._packer.pack("events") + self._packer.pack_array_header(count)
+
+    def write_to(self, out, compression: Optional[str] = None, level: Optional[int] = None):
+        """Write the encoded report to a binary file like object and release the events buffer.
+        Args:
+            out: The binary file like object to write to
+            compression: Optional codec (compression.GZIP or compression.ZSTD) to compress the report with,
+                as it is written.
+            level: The compression level. None uses the codec's default.
+        """
+        if self._events is None:
+            raise DataError("Report was already finished")
+
+        if compression is not None:
+            with _compression.open_writer(out, compression, level) as compressed:
+                self.write_to(compressed)
+            return
+
+        out.write(self._header(self.report_id, self.lowest_id, self.highest_id, self.count))
+        if self._raw_data is not None:
+            _copy_buffer(self._raw_data, out)
+            self._raw_data = None
+        out.write(self._events_header(self.count))
+        events, self._events = self._events, None
+        _copy_buffer(events, out)
+
+    def write(self, file_path: str, compression: Optional[str] = None, level: Optional[int] = None):
+        """Write the Streamer Report to disk as a msgpack file without assembling it in memory.
+        The report is compressed on the fly if a compression codec is given (see write_to()).
+        """
+        with open(file_path, "wb") as outfile:
+            self.write_to(outfile, compression, level)
+
+    def finish(self, received_time: datetime.datetime = None) -> 'ArchFXFlexibleDictionaryReport':
+        """Assemble the encoded report.
+        Args:
+            received_time: The UTC time when this report was received from an IOTile device.
+        Returns:
+            ArchFXFlexibleDictionaryReport: A report containing all readings added so far.
+        """
+        out = BytesIO()
+        self.write_to(out)
+        return ArchFXFlexibleDictionaryReport(out.getvalue(), signed=False, encrypted=False,
+                                              received_time=received_time)
+
+
+def read_header(data) -> ReportHeader:
+    """Read the header of an encoded report, without decoding its events.
+    The msgpack map is walked key by key and the events (or columns) are skipped over,
+    so only the few header values are unpacked, however large the report is.
+    Args:
+        data: The encoded report (bytes, bytearray, memoryview or mmap), compressed or not
+    Returns:
+        ReportHeader: The header attributes. Missing attributes are None.
+    Raises:
+        DataError: If the report has no device
+    """
+    if _compression.is_compressed(data):
+        data = _compression.decompress(data)
+
+    report_dict = _unpack_header(data)
+    if 'device' not in report_dict:
+        raise DataError("Invalid encoded ArchFXFlexibleDictionaryReport that did not "
+                        "have a device key set with the device uuid")
+
+    return ReportHeader(*(report_dict.get(field) for field in ReportHeader._fields))
+
+
+def _unpack_header(data) -> dict:
+    unpacker = msgpack.Unpacker(_BufferReader(data), raw=False)
+    report_dict = {}
+    for _ in range(unpacker.read_map_header()):
+        key = unpacker.unpack()
+        if key in ('events', 'columns', RAW_DATA_KEY):
+            unpacker.skip()
+        else:
+            report_dict[key] = unpacker.unpack()
+    return report_dict
+
+
+def _read_raw_section(unpacker: msgpack.Unpacker, data) -> memoryview:
+    """Return a view of the raw data section the unpacker is at, and skip over it."""
+    position = unpacker.tell()
+    view = memoryview(data)
+    marker = view[position]
+    if marker == 0xc4:
+        start, size = position + 2, view[position + 1]
+    elif marker == 0xc5:
+        start, size = position + 3, int.from_bytes(view[position + 1:position + 3], 'big')
+    elif marker == 0xc6:
+        start, size = position + 5, int.from_bytes(view[position + 1:position + 5], 'big')
+    else:
+        raise DataError("Invalid raw data section in ArchFXFlexibleDictionaryReport")
+
+    unpacker.skip()
+    return view[start:start + size]
+
+
+def _find_raw_section(data) -> Optional[memoryview]:
+    """Return the raw data section of an encoded report, only unpacking the keys before it."""
+    unpacker = msgpack.Unpacker(_BufferReader(data), raw=False)
+    try:
+        for _ in range(unpacker.read_map_header()):
+            key = unpacker.unpack()
+            if key == RAW_DATA_KEY:
+                return _read_raw_section(unpacker, data)
+            if key in ('events', 'columns'):
+                return None
+            unpacker.skip()
+    except (ValueError, msgpack.OutOfData):
+        # Not a map, let the decoder report it
+        pass
+    return None
+
+
+def _resolve_raw_data(event: dict, section: Optional[memoryview]) -> dict:
+    reference = event.pop('data_ref', None)
+    if reference is not None:
+        if section is None:
+            raise DataError("Event references raw data, but the report has no raw data section")
+        event['data'] = LazyRawData(section, *reference)
+    return event
+
+
+def _copy_buffer(buffer, out):
+    if isinstance(buffer, BytesIO):
+        out.write(buffer.getbuffer())
+    else:
+        buffer.seek(0)
+        shutil.copyfileobj(buffer, out)
+    buffer.close()
+
+
+def _new_packer() -> msgpack.Packer:
+    return msgpack.Packer(default=_encode_datetime, use_bin_type=True)
+
+
+def _chunk_encoded(new_writer,
+                   events: Iterable,
+                   max_events: Optional[int],
+                   max_bytes: Optional[int],
+                   received_time: datetime.datetime = None) -> Iterator[ArchFXFlexibleDictionaryReport]:
+    """Split (encoded event, reading_id) pairs into reports (see ChunkedFromReadings()).
+    new_writer() must return a writer whose report_id is the seqid of the last report,
+    or InvalidReadingID to use its highest_id + 1.
+    """
+    writer = new_writer()
+    for encoded, reading_id in events:
+        if max_bytes is not None and writer.size - writer.events_size + len(encoded) > max_bytes:
+            raise DataError("Reading {} does not fit in a report of {} bytes".format(reading_id, max_bytes))
+
+        if writer.count and ((max_events is not None and writer.count >= max_events) or
+                             (max_bytes is not None and writer.size + len(encoded) > max_bytes)):
+            if writer.highest_id != ArchFXDataPoint.InvalidReadingID:
+                writer.report_id = writer.highest_id + 1
+            yield writer.finish(received_time=received_time)
+            writer = new_writer()
+
+        writer.add_encoded(encoded, reading_id)
+
+    if writer.count:
+        if writer.report_id == ArchFXDataPoint.InvalidReadingID and \
+                writer.highest_id != ArchFXDataPoint.InvalidReadingID:
+            writer.report_id = writer.highest_id + 1
+        yield writer.finish(received_time=received_time)
+
+
+def _decode_columns(columns: dict):
+    # The compact format module builds on this one, so only import it when needed
+    from .compact import decode_columns  # pylint: disable=import-outside-toplevel
+    return decode_columns(columns)
+
+
+class _BufferReader:
+    """Minimal read-only file over a bytes-like object, for msgpack.Unpacker and uploads.
+    Only the chunks requested by the reader are copied.
+    """
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer)
+        self._pos = 0
+
+    def __len__(self):
+        return len(self._view)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            end = len(self._view)
+        else:
+            end = min(self._pos + size, len(self._view))
+        chunk = bytes(self._view[self._pos:end])
+        self._pos = end
+        return chunk
+
 
 def _encode_datetime(obj):
-    """Pack a datetime into an isoformat string."""
+    """Pack a datetime into an isoformat string, and LazyRawData as the raw data it refers to."""
+    if isinstance(obj, LazyRawData):
+        return obj.load()
     if isinstance(obj, datetime.datetime):
         if obj.tzinfo:
             obj = obj.astimezone(datetime.timezone.utc)
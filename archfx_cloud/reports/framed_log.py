@@ -0,0 +1,221 @@
+"""Append-only file holding many encoded reports, with a random access index.
+
+Storing every report in its own file means millions of small files on
+gateways. A ReportLog appends reports to a single data file instead, each one
+framed with its length and CRC32 (see archfx_cloud.utils.framing), and keeps a
+sidecar index file (the data file path with an `.idx` suffix) with a fixed size
+record per report: its position in the data file and its device, streamer,
+seqid and reading ID range. A report is fetched with a single seek and read.
+
+Both files are only ever appended to. A crash can leave a torn frame at the end
+of the data file, which is truncated away when the log is opened again, and
+index records past the last valid frame are dropped. The index is a cache of
+the data file: records that are missing (e.g. the index was deleted or the
+crash happened between both writes) are rebuilt by reading the headers of the
+remaining frames.
+
+Usage:
+    with ReportLog('/data/reports.log') as log:
+        log.append(report)
+        for entry in log.find(0x1234, 0x100, reading_id=1000):
+            report = log.get(entry)
+"""
+
+import logging
+import os
+import struct
+import threading
+from collections import namedtuple
+from typing import Iterator, List, Optional
+
+from ..utils.framing import FRAME_HEADER, encode_frame, iter_frames, read_frame, truncate_invalid_tail
+from ..utils.slugs import ArchFxDeviceSlug
+from .exceptions import DataError
+from .flexible_dictionary import ArchFXFlexibleDictionaryReport, read_header
+from .report import ArchFXDataPoint, ArchFXReport
+
+INDEX_SUFFIX = '.idx'
+READ_BUFFER_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+# offset, frame length, device, streamer, seqid, lowest_id, highest_id
+_INDEX_RECORD = struct.Struct('<QIQIqqq')
+
+LogEntry = namedtuple('LogEntry', ['offset', 'length', 'device', 'streamer', 'seqid', 'lowest_id', 'highest_id'])
+LogEntry.__doc__ = """The index record of a report: its frame position and length, and its header attributes."""
+
+
+def _id(value: Optional[int]) -> int:
+    return ArchFXDataPoint.InvalidReadingID if value is None else value
+
+
+class ReportLog:
+    """An append-only log of encoded reports with a sidecar index.
+    Appended reports are written (and flushed) immediately, but only fsynced when
+    flush() or close() is called.
+    Args:
+        path: Path of the data file, created if needed. The index is stored next to it.
+        compression: Optional codec to compress appended reports with (see archfx_cloud.reports.compression)
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = None):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.compression = compression
+
+        self._lock = threading.Lock()
+        self._entries = []
+        self._streamers = {}
+        self._recover()
+
+        self._data = open(self.path, 'ab')
+        self._index = open(self.index_path, 'ab')
+        self._reader = open(self.path, 'rb')
+
+    def _recover(self):
+        if os.path.exists(self.path):
+            removed = truncate_invalid_tail(self.path)
+            if removed:
+                logger.warning("Removed %d bytes of incomplete data from report log %s", removed, self.path)
+        else:
+            open(self.path, 'ab').close()
+        size = os.path.getsize(self.path)
+
+        index_size = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as infile:
+                while True:
+                    record = infile.read(_INDEX_RECORD.size)
+                    if len(record) < _INDEX_RECORD.size:
+                        break
+                    entry = LogEntry(*_INDEX_RECORD.unpack(record))
+                    if entry.offset + entry.length > size:
+                        break
+                    self._add_entry(entry)
+                    index_size += _INDEX_RECORD.size
+
+        # Drop torn records and records of frames that were truncated away, then index the frames left
+        with open(self.index_path, 'ab') as outfile:
+            outfile.truncate(index_size)
+            end = self._end()
+            if end < size:
+                count = 0
+                with open(self.path, 'rb') as infile:
+                    for offset, payload in iter_frames(infile, end):
+                        entry = self._entry_from_header(offset, payload)
+                        outfile.write(_INDEX_RECORD.pack(*entry))
+                        self._add_entry(entry)
+                        count += 1
+                logger.info("Rebuilt %d index records of report log %s", count, self.path)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+
+    def _end(self) -> int:
+        if not self._entries:
+            return 0
+        return self._entries[-1].offset + self._entries[-1].length
+
+    @staticmethod
+    def _entry_from_header(offset: int, payload: bytes) -> LogEntry:
+        header = read_header(payload)
+        return LogEntry(offset, FRAME_HEADER.size + len(payload), ArchFxDeviceSlug(header.device).get_id(),
+                        header.streamer_index or 0, _id(header.seqid), _id(header.lowest_id), _id(header.highest_id))
+
+    def _add_entry(self, entry: LogEntry):
+        self._entries.append(entry)
+        self._streamers.setdefault((entry.device, entry.streamer), []).append(entry)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, report: ArchFXReport) -> LogEntry:
+        """Append a report to the log.
+        Returns:
+            LogEntry: The index record of the report
+        """
+        if self.compression is not None:
+            payload = report.encode(self.compression)
+        else:
+            payload = report.encode()
+        frame = encode_frame(payload)
+
+        with self._lock:
+            if self._data is None:
+                raise DataError("Cannot append reports to a closed report log", path=self.path)
+
+            entry = LogEntry(self._end(), len(frame), ArchFxDeviceSlug(report.origin).get_id(),
+                             report.origin_streamer or 0, _id(report.report_id),
+                             _id(getattr(report, 'lowest_id', None)), _id(getattr(report, 'highest_id', None)))
+            self._data.write(frame)
+            self._data.flush()
+            self._index.write(_INDEX_RECORD.pack(*entry))
+            self._index.flush()
+            self._add_entry(entry)
+            return entry
+
+    def flush(self):
+        """fsync all reports appended so far."""
+        with self._lock:
+            if self._data is not None:
+                os.fsync(self._data.fileno())
+                os.fsync(self._index.fileno())
+
+    def close(self):
+        """fsync and close the log."""
+        self.flush()
+        with self._lock:
+            if self._data is not None:
+                for fp in (self._data, self._index, self._reader):
+                    fp.close()
+                self._data = self._index = self._reader = None
+
+    def entries(self) -> List[LogEntry]:
+        """Return the index records of all reports, in append order."""
+        return list(self._entries)
+
+    def find(self, device, streamer: int, reading_id: Optional[int] = None,
+             seqid: Optional[int] = None) -> List[LogEntry]:
+        """Return the index records of the reports of a device streamer, in append order.
+        Args:
+            device: The device slug or ID
+            streamer: The streamer index
+            reading_id: Optional reading ID the reports must include (between their lowest_id and highest_id)
+            seqid: Optional seqid the reports must have
+        """
+        entries = self._streamers.get((ArchFxDeviceSlug(device).get_id(), streamer), [])
+        if reading_id is not None:
+            entries = [entry for entry in entries if entry.lowest_id <= reading_id <= entry.highest_id]
+        if seqid is not None:
+            entries = [entry for entry in entries if entry.seqid == seqid]
+        return list(entries)
+
+    def get(self, entry: LogEntry) -> ArchFXFlexibleDictionaryReport:
+        """Read a single report, seeking straight to it.
+        Raises:
+            DataError: If the report is corrupt
+        """
+        with self._lock:
+            if self._reader is None:
+                raise DataError("Cannot read reports from a closed report log", path=self.path)
+            self._reader.seek(entry.offset)
+            payload = read_frame(self._reader)
+
+        if payload is None or FRAME_HEADER.size + len(payload) != entry.length:
+            raise DataError("Corrupt report in report log", path=self.path, offset=entry.offset)
+        return ArchFXFlexibleDictionaryReport(payload, False, False, lazy=True)
+
+    def __iter__(self) -> Iterator[ArchFXFlexibleDictionaryReport]:
+        """Iterate over all reports in append order, reading the data file sequentially."""
+        end = self._end()
+        with open(self.path, 'rb', buffering=READ_BUFFER_SIZE) as infile:
+            for offset, payload in iter_frames(infile):
+                if offset >= end:
+                    return
+                yield ArchFXFlexibleDictionaryReport(payload, False, False, lazy=True)
@@ -1,13 +1,62 @@
 """Base class for data streamed from an IOTile device"""
 
 import datetime
+from functools import lru_cache
 from typing import Union, Dict, Optional
-import dateutil.parser
+import msgpack
 from typedargs.exceptions import NotFoundError
+from ..utils.basic import str_to_datetime
 from ..utils.slugs import ArchFxVariableID
 from .exceptions import DataError
 
 
+def _stream_id(stream: Union[str, int]) -> int:
+    """Return the integer variable ID of a stream."""
+    if type(stream) is int and 0 <= stream <= 0xFFFFFFFF:  # pylint: disable=unidiomatic-typecheck
+        return stream
+    try:
+        return _parse_stream_id(stream)
+    except TypeError:
+        # Unhashable, let ArchFxVariableID report the invalid type
+        return ArchFxVariableID(stream).get_id()
+
+
+@lru_cache(maxsize=1024)
+def _parse_stream_id(stream: Union[str, int]) -> int:
+    return ArchFxVariableID(stream).get_id()
+
+
+class LazyRawData:
+    """Handle to the raw data of a data point, stored in the raw data section of its report.
+    The handle only keeps a view of the report buffer and the position of the encoded raw
+    data: it is unpacked by load(), which ArchFXDataPoint.raw_data calls on first access.
+    Args:
+        buffer: The raw data section of the report (a memoryview, not copied)
+        offset: Offset of the encoded raw data in the section
+        size: Size in bytes of the encoded raw data
+    """
+
+    __slots__ = ('_buffer', 'offset', 'size')
+
+    def __init__(self, buffer, offset: int, size: int):
+        if offset < 0 or size < 0 or offset + size > len(buffer):
+            raise DataError("Raw data reference out of bounds", offset=offset, size=size)
+        self._buffer = buffer
+        self.offset = offset
+        self.size = size
+
+    def load(self) -> Dict:
+        """Unpack the raw data."""
+        return msgpack.unpackb(self._buffer[self.offset:self.offset + self.size], raw=False)
+
+    def __reduce__(self):
+        # The report buffer can't be pickled (e.g. to leave a worker process): only copy this raw data
+        return LazyRawData, (bytes(self._buffer[self.offset:self.offset + self.size]), 0, self.size)
+
+    def __repr__(self):
+        return "LazyRawData(offset={}, size={})".format(self.offset, self.size)
+
+
 class ArchFXDataPoint:
     """Base class for all ArchFX Data records.
     An event is a dictionary with a small summary section and an arbitrarily
@@ -27,12 +76,15 @@ class ArchFXDataPoint:
             may pass None if there is no summary data.
         raw_data: A dictionary (possibly very large) of all data associated
             with this event.  You may pass None if all data is contained in the
-            summary_data member.
+            summary_data member.  Data points decoded from a report with a raw
+            data section get a LazyRawData instead, loaded on first access.
     """
 
     InvalidRawTime = 0xFFFFFFFF
     InvalidReadingID = 0
 
+    __slots__ = ('stream', 'reading_id', 'timestamp', 'value', 'summary_data', '_raw_data')
+
     def __init__(self,
                  timestamp: datetime.datetime,
                  stream: Union[str, int],
@@ -42,7 +94,7 @@ class ArchFXDataPoint:
                  reading_id: int = None):
 
         # Always store stream as variable ID
-        self.stream = ArchFxVariableID(stream).get_id()
+        self.stream = _stream_id(stream)
 
         if reading_id is None:
             reading_id = ArchFXDataPoint.InvalidReadingID
@@ -58,7 +110,24 @@ class ArchFXDataPoint:
             # We used to add 'value' as part of summary_data so checking we don't
             raise DataError('value is not a valid field for summary_data')
         self.summary_data = summary_data
-        self.raw_data = raw_data
+        self._raw_data = raw_data
+
+    @property
+    def raw_data(self) -> Optional[Dict]:
+        """The raw data dictionary. Raw data stored in a raw data section is only loaded here."""
+        raw_data = self._raw_data
+        if isinstance(raw_data, LazyRawData):
+            raw_data = self._raw_data = raw_data.load()
+        return raw_data
+
+    @raw_data.setter
+    def raw_data(self, value: Optional[Dict]):
+        self._raw_data = value
+
+    @property
+    def has_raw_data(self) -> bool:
+        """Whether this data point has raw data, without loading it."""
+        return self._raw_data is not None
 
     def asdict(self):
         """Encode the data in this event into a dictionary.
@@ -87,7 +156,7 @@ class ArchFXDataPoint:
             ArchFXDataPoint: The converted ArchFXDataPoint object.
         """
 
-        timestamp = dateutil.parser.parse(obj['timestamp'])
+        timestamp = str_to_datetime(obj['timestamp'])
 
         return ArchFXDataPoint(
             timestamp,
@@ -119,22 +188,46 @@ class ArchFXReport:
     - instance method serialize(self):
         function that should turn the report into a serialized bytearray that could be
         decoded with decode().
+    Reports decode all their readings when they are created, unless lazy is
+    set. Lazy reports parse nothing until their data (or a header attribute
+    like origin) is first accessed, which makes routing or re-uploading a report
+    cheap. The memory_mode decides what a report keeps once it is decoded:
+    - KEEP_ALL: both the raw report and the decoded readings (default)
+    - DROP_RAW: only the decoded readings. The report can no longer be encoded.
+    - DROP_DECODED: only the raw report. visible_data decodes the report on every access,
+        and iter_data() streams the readings without keeping them.
     Args:
         rawreport: The raw data of this report
         signed: Whether this report is signed to specify who it is from
         encrypted: Whether this report is encrypted
         received_time: The time in UTC when this report was received from a device.
             If not received, the time is assumed to be utcnow().
+        lazy: Whether to defer decoding until the data is accessed
+        memory_mode: One of KEEP_ALL, DROP_RAW or DROP_DECODED
     """
 
+    KEEP_ALL = 'keep_all'
+    DROP_RAW = 'drop_raw'
+    DROP_DECODED = 'drop_decoded'
+
+    # Attributes set while decoding, that lazy reports decode on first access
+    HEADER_ATTRIBUTES = ('origin',)
+
     def __init__(self,
                  rawreport: bytearray,
                  signed: bool,
                  encrypted: bool,
-                 received_time: datetime.datetime = None):
-        self.visible_data = []
+                 received_time: datetime.datetime = None,
+                 lazy: bool = False,
+                 memory_mode: str = KEEP_ALL):
+        if memory_mode not in (self.KEEP_ALL, self.DROP_RAW, self.DROP_DECODED):
+            raise DataError("Unknown memory mode: {}".format(memory_mode))
 
-        self.origin = None
+        self._visible_data = None
+        self.memory_mode = memory_mode
+
+        if not lazy:
+            self.origin = None
 
         if received_time is None:
             self.received_time = datetime.datetime.utcnow()
@@ -148,7 +241,37 @@ class ArchFXReport:
 
         # We may not have any visible readings if our report is encrypted
         # and we do not have access to the decryption key.
-        self.visible_data = self.decode()
+        if not lazy:
+            self._load_visible_data()
+
+    def __getattr__(self, name):
+        # Only called for missing attributes: decode the header of lazy reports on first access
+        if name in type(self).HEADER_ATTRIBUTES and self.__dict__.get('raw_report') is not None:
+            self.decode_header()
+            if name in self.__dict__:
+                return self.__dict__[name]
+        raise AttributeError(name)
+
+    def _load_visible_data(self):
+        data = self.decode()
+        if self.memory_mode == self.DROP_DECODED:
+            return data
+
+        self._visible_data = data
+        if self.memory_mode == self.DROP_RAW:
+            self.raw_report = None
+        return data
+
+    @property
+    def visible_data(self):
+        """The list of readings in this report, decoded on first access for lazy reports."""
+        if self._visible_data is None:
+            return self._load_visible_data()
+        return self._visible_data
+
+    @visible_data.setter
+    def visible_data(self, value):
+        self._visible_data = value
 
     def decode(self):
         """Decode a raw report into a series of readings
@@ -156,9 +279,33 @@ class ArchFXReport:
 
         raise NotFoundError("ArchFXReport decode needs to be overriden")
 
+    def decode_header(self):
+        """Decode the report attributes (like origin) without keeping its readings.
+        Report formats should override this to avoid decoding the readings at all.
+        """
+
+        self.decode()
+
+    def iter_data(self):
+        """Iterate over the readings of this report.
+        Report formats can override iter_decode() so that readings are decoded one at a
+        time instead of all at once.
+        """
+
+        if self._visible_data is not None:
+            return iter(self._visible_data)
+        return self.iter_decode()
+
+    def iter_decode(self):
+        """Decode a raw report into a generator of readings"""
+
+        yield from self.decode()
+
     def encode(self):
         """Encode this report into a binary blob that could be decoded by a report format's decode method."""
 
+        if self.raw_report is None:
+            raise DataError("Cannot encode a report whose raw data was dropped (memory_mode=DROP_RAW) or closed")
         return self.raw_report
 
     def save(self, path: str):
@@ -173,11 +320,14 @@ class ArchFXReport:
             out.write(data)
 
     def serialize(self):
-        """Turn this report into a dictionary that encodes all information including received timestamp"""
+        """Turn this report into a dictionary that encodes all information including received timestamp.
+        encoded_report is the buffer returned by encode(), not a copy, so it may be a memoryview.
+        """
 
         info = {}
         info['received_time'] = self.received_time
-        info['encoded_report'] = bytes(self.encode())
+        # Not copied into bytes, so memory mapped reports stay memory mapped
+        info['encoded_report'] = self.encode()
 
         # Handle python 2 / python 3 differences
         report_format = info['encoded_report'][0]
@@ -202,5 +352,6 @@ class ArchFXReport:
             enc = "encrypted"
         else:
             enc = "not encrypted"
+        length = len(self.raw_report) if self.raw_report is not None else 0
         return "ArchFX Report (length: {}, visible data: {}, {} and {})".format(
-            len(self.raw_report), len(self.visible_data), verified, enc)
+            length, len(self.visible_data), verified, enc)
@@ -0,0 +1,163 @@
+"""Aggregate data points into per-stream windows before uploading them.
+
+High rate sensors (e.g. 100 Hz) often only need per-second (or per-minute)
+statistics in the cloud. rollup() groups data points by stream and time window
+and computes min, max, mean, count and/or last of every window, in a few NumPy
+passes over a DataPointBatch, so millions of points are reduced without a
+Python loop per point.
+
+Windows are aligned on origin (the epoch by default) and identified by their
+start time, which is the timestamp of their rollup point:
+- tumbling windows (step is None): every point is in exactly one window
+- sliding windows (step < window): a new window starts every step, so every
+  point is in up to window / step windows
+
+Every rollup point has one aggregate as its value and the other aggregates in
+its summary_data, and no reading ID. Requires numpy (`pip install archfx_cloud[numpy]`).
+
+Usage:
+    points = rollup(readings, window=timedelta(seconds=1), output_streams={'5001': '5101'})
+    report = ArchFXFlexibleDictionaryReport.FromReadings('d--1234', points)
+"""
+
+import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+from ..utils.columnar import datetime_to_us, np, require_numpy
+from .batch import DataPointBatch
+from .exceptions import DataError
+from .report import ArchFXDataPoint, _stream_id
+
+AGGREGATES = ('min', 'max', 'mean', 'count', 'last')
+
+Duration = Union[datetime.timedelta, float]
+
+
+def _duration_us(value: Duration) -> int:
+    if isinstance(value, datetime.timedelta):
+        return value // datetime.timedelta(microseconds=1)
+    return int(round(value * 1000000))
+
+
+def _window_rows(timestamp: 'np.ndarray', window: int, step: int):
+    """Return the window index and row of every (window, point) pair."""
+    first = np.floor_divide(timestamp, step)
+    copies = -(-window // step)
+    if copies == 1:
+        rows = np.arange(len(timestamp))
+        keep = timestamp < first * step + window
+        return first[keep], rows[keep]
+
+    windows = (first[np.newaxis, :] - np.arange(copies)[:, np.newaxis]).ravel()
+    rows = np.tile(np.arange(len(timestamp)), copies)
+    keep = timestamp[rows] < windows * step + window
+    return windows[keep], rows[keep]
+
+
+def rollup_batch(batch: DataPointBatch,
+                 window: Duration,
+                 step: Optional[Duration] = None,
+                 aggregates: Sequence[str] = AGGREGATES,
+                 value: str = 'mean',
+                 output_streams: Optional[Dict] = None,
+                 origin: Optional[datetime.datetime] = None) -> DataPointBatch:
+    """Aggregate a batch of data points per stream and time window.
+    Args:
+        batch: The data points
+        window: Length of the windows, as a timedelta or in seconds
+        step: Time between the start of two sliding windows. None for tumbling windows.
+        aggregates: The aggregates to compute, among AGGREGATES
+        value: The aggregate used as the value of the rollup points. The others are stored in summary_data.
+        output_streams: Optional mapping of input stream to the stream of its rollup points.
+            Streams that are not mapped keep their ID.
+        origin: The time windows are aligned on. Defaults to the epoch.
+    Returns:
+        DataPointBatch: One data point per stream and (non empty) window, ordered by stream and time
+    """
+    require_numpy()
+
+    window = _duration_us(window)
+    step = window if step is None else _duration_us(step)
+    if window <= 0 or step <= 0:
+        raise DataError("Rollup window and step must be positive", window=window, step=step)
+    unknown = set(aggregates) - set(AGGREGATES)
+    if unknown:
+        raise DataError("Unknown rollup aggregates: {}".format(', '.join(sorted(unknown))))
+    if value not in AGGREGATES:
+        raise DataError("Unknown rollup aggregate: {}".format(value))
+
+    if not len(batch):
+        return DataPointBatch([], [], [], [])
+
+    origin = 0 if origin is None else datetime_to_us(origin)
+    windows, rows = _window_rows(batch.timestamp - origin, window, step)
+
+    # Group by stream then window, keeping points in time (then input) order within groups
+    stream = batch.stream[rows]
+    order = np.lexsort((batch.timestamp[rows], windows, stream))
+    windows, rows, stream = windows[order], rows[order], stream[order]
+    values = batch.value[rows]
+
+    changes = (stream[1:] != stream[:-1]) | (windows[1:] != windows[:-1])
+    starts = np.concatenate(([0], np.flatnonzero(changes) + 1))
+    ends = np.concatenate((starts[1:], [len(rows)]))
+
+    columns = {}
+    needed = set(aggregates) | {value}
+    if needed & {'count', 'mean'}:
+        columns['count'] = ends - starts
+    if 'mean' in needed:
+        columns['mean'] = np.add.reduceat(values, starts) / columns['count']
+    if 'min' in needed:
+        columns['min'] = np.minimum.reduceat(values, starts)
+    if 'max' in needed:
+        columns['max'] = np.maximum.reduceat(values, starts)
+    if 'last' in needed:
+        columns['last'] = values[ends - 1]
+
+    out_stream = stream[starts]
+    if output_streams:
+        mapping = {_stream_id(key): _stream_id(other) for key, other in output_streams.items()}
+        unique, inverse = np.unique(out_stream, return_inverse=True)
+        out_stream = np.array([mapping.get(item, item) for item in unique.tolist()], dtype=np.uint32)[inverse]
+
+    summary_names = [name for name in aggregates if name != value]
+    summary_data = None
+    if summary_names:
+        summary_columns = [columns[name].tolist() for name in summary_names]
+        summary_data = [dict(zip(summary_names, row)) for row in zip(*summary_columns)]
+
+    return DataPointBatch(
+        windows[starts] * step + origin,
+        out_stream,
+        columns[value].astype(np.float64),
+        np.full(len(starts), ArchFXDataPoint.InvalidReadingID, dtype=np.int64),
+        summary_data,
+    )
+
+
+def rollup(points: Union[DataPointBatch, Iterable[ArchFXDataPoint]],
+           window: Duration,
+           step: Optional[Duration] = None,
+           aggregates: Sequence[str] = AGGREGATES,
+           value: str = 'mean',
+           output_streams: Optional[Dict] = None,
+           origin: Optional[datetime.datetime] = None) -> List[ArchFXDataPoint]:
+    """Aggregate data points per stream and time window (see rollup_batch()).
+    Raw data is ignored, and never loaded.
+    Returns:
+        list(ArchFXDataPoint): The rollup points, ready for ArchFXFlexibleDictionaryReport.FromReadings()
+    """
+    require_numpy()
+
+    if not isinstance(points, DataPointBatch):
+        points = list(points)
+        points = DataPointBatch(
+            [datetime_to_us(point.timestamp) for point in points],
+            [point.stream for point in points],
+            [point.value for point in points],
+            [point.reading_id for point in points],
+        )
+
+    return rollup_batch(points, window, step, aggregates, value, output_streams, origin).to_points()
+
@@ -0,0 +1,171 @@
+"""Local index of the readings already accepted by the cloud.
+
+For every (device, streamer_index), the index keeps the reading IDs (dev_seqid)
+of the reports that were successfully uploaded, as a set of inclusive
+intervals. Devices generate IDs sequentially, so the index stays a handful of
+intervals per streamer even after millions of readings.
+
+The index is used to avoid uploading the same readings again, for instance when
+a gateway re-sends overlapping ranges after a restart: FromReadings() and
+ChunkedFromReadings() drop acknowledged readings before encoding, and
+upload_reports() skips reports whose readings were all acknowledged. Uploads
+record the readings of their report once the cloud accepted it.
+
+Usage:
+    index = SeqidIndex('accepted.json')
+    report = ArchFXFlexibleDictionaryReport.FromReadings(device, readings, seqid_index=index)
+    report.upload(api, seqid_index=index)
+"""
+
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, List, Tuple
+
+from ..utils.files import atomic_write
+from .report import ArchFXDataPoint, ArchFXReport
+
+
+class IntervalSet:
+    """A set of integers stored as sorted, disjoint, inclusive intervals."""
+
+    __slots__ = ('_starts', '_ends')
+
+    def __init__(self, intervals: Iterable[Tuple[int, int]] = ()):
+        self._starts = []
+        self._ends = []
+        for start, end in intervals:
+            self.add(start, end)
+
+    def __contains__(self, value: int) -> bool:
+        index = bisect_right(self._starts, value) - 1
+        return index >= 0 and value <= self._ends[index]
+
+    def __len__(self):
+        """Number of intervals (not of values)."""
+        return len(self._starts)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return zip(self._starts, self._ends)
+
+    def add(self, start: int, end: int):
+        """Add all values from start to end (inclusive), merging overlapping or adjacent intervals."""
+        if end < start:
+            return
+
+        first = bisect_left(self._ends, start - 1)
+        last = bisect_right(self._starts, end + 1)
+        if first < last:
+            start = min(start, self._starts[first])
+            end = max(end, self._ends[last - 1])
+        self._starts[first:last] = [start]
+        self._ends[first:last] = [end]
+
+    def add_values(self, values: Iterable[int]):
+        """Add individual values, grouped into intervals of consecutive values first."""
+        start = end = None
+        for value in sorted(set(values)):
+            if end is not None and value == end + 1:
+                end = value
+                continue
+            if start is not None:
+                self.add(start, end)
+            start = end = value
+        if start is not None:
+            self.add(start, end)
+
+    def covers(self, start: int, end: int) -> bool:
+        """Return whether every value from start to end (inclusive) is in the set."""
+        index = bisect_right(self._starts, start) - 1
+        return index >= 0 and end <= self._ends[index]
+
+
+class SeqidIndex:
+    """Accepted reading IDs per (device, streamer_index), persisted as a json file.
+    Every update rewrites the file atomically (see archfx_cloud.utils.files.atomic_write),
+    unless autosave is disabled, in which case save() must be called.
+    Args:
+        path: Path of the json file holding the index
+        autosave: Whether to save the index after every update
+    """
+
+    def __init__(self, path: str, autosave: bool = True):
+        self.path = path
+        self.autosave = autosave
+        self._lock = threading.Lock()
+        self._sets = self._load()
+
+    @staticmethod
+    def _key(device: int, streamer: int) -> str:
+        return '{}/{}'.format(device, streamer)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return {}
+
+        return {key: IntervalSet(intervals) for key, intervals in data.items()}
+
+    def save(self):
+        """Atomically write the index to disk."""
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        data = {key: [list(interval) for interval in intervals] for key, intervals in self._sets.items()}
+        atomic_write(self.path, json.dumps(data, sort_keys=True).encode())
+
+    def ranges(self, device: int, streamer: int) -> List[Tuple[int, int]]:
+        """Return the intervals of accepted reading IDs of a device streamer."""
+        intervals = self._sets.get(self._key(device, streamer))
+        return list(intervals) if intervals is not None else []
+
+    def contains(self, device: int, streamer: int, reading_id: int) -> bool:
+        """Return whether a reading was already accepted. Readings without an ID never are."""
+        if reading_id == ArchFXDataPoint.InvalidReadingID:
+            return False
+        intervals = self._sets.get(self._key(device, streamer))
+        return intervals is not None and reading_id in intervals
+
+    def filter(self, device: int, streamer: int, readings: Iterable[ArchFXDataPoint]) -> Iterator[ArchFXDataPoint]:
+        """Yield the readings that were not accepted yet."""
+        intervals = self._sets.get(self._key(device, streamer))
+        for reading in readings:
+            if intervals is None or reading.reading_id == ArchFXDataPoint.InvalidReadingID or \
+                    reading.reading_id not in intervals:
+                yield reading
+
+    def covers(self, report: ArchFXReport) -> bool:
+        """Return whether all readings of a report were already accepted.
+        Only the lowest_id/highest_id of the report header are needed, so lazy reports are not decoded.
+        Events without a reading ID are not taken into account.
+        """
+        lowest_id = getattr(report, 'lowest_id', None)
+        highest_id = getattr(report, 'highest_id', None)
+        if not lowest_id or not highest_id:
+            return False
+
+        intervals = self._sets.get(self._key(report.origin, report.origin_streamer))
+        return intervals is not None and intervals.covers(lowest_id, highest_id)
+
+    def add(self, device: int, streamer: int, reading_ids: Iterable[int]):
+        """Record readings as accepted."""
+        reading_ids = [reading_id for reading_id in reading_ids if reading_id != ArchFXDataPoint.InvalidReadingID]
+        if not reading_ids:
+            return
+
+        with self._lock:
+            self._sets.setdefault(self._key(device, streamer), IntervalSet()).add_values(reading_ids)
+            if self.autosave:
+                self._save()
+
+    def record(self, report: ArchFXReport):
+        """Record the readings of a report that was accepted by the cloud."""
+        if hasattr(report, 'iter_events'):
+            reading_ids = (event.get('dev_seqid') or ArchFXDataPoint.InvalidReadingID for event in report.iter_events())
+        else:
+            reading_ids = (reading.reading_id for reading in report.iter_data())
+        self.add(report.origin, report.origin_streamer, reading_ids)
+
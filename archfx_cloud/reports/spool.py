@@ -0,0 +1,359 @@
+"""Durable on-disk spool of reports waiting to be uploaded.
+
+Reports are appended to a write-ahead log made of numbered segment files in a
+spool directory. Every entry is framed with its length and CRC32 (see
+archfx_cloud.utils.framing), so a crash can only leave a torn entry at the end
+of the last segment, which is truncated away when the spool is opened again.
+The position of the next entry to upload (the cursor) is stored in a small
+json file, rewritten atomically every time an entry is acknowledged. Fully
+acknowledged segments are deleted.
+
+A background thread drains the spool through the Api, retrying failures with
+exponential backoff, so producers only ever write to the local disk. Entries
+are only acknowledged once the cloud replied with the number of accepted
+readings. Reports the cloud rejects as invalid (400, 413 and 422 errors) are
+dropped with an error log, as retrying them would block the spool forever.
+Any other error (e.g. 401 or 403 with an expired token, or 429) is retried.
+
+Usage:
+    spool = ReportSpool('/var/spool/archfx', api, max_bytes=512 * 1024 * 1024)
+    spool.start()
+    spool.enqueue(report)
+    ...
+    spool.close()
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from typing import Optional
+
+from ..api.exceptions import HttpClientError
+from ..utils.files import atomic_write, fsync_directory
+from ..utils.framing import FRAME_HEADER, encode_frame, iter_frames, read_frame, truncate_invalid_tail
+from .exceptions import DataError
+from .flexible_dictionary import ArchFXFlexibleDictionaryReport
+from .report import ArchFXReport
+
+DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024
+DEFAULT_FSYNC_BATCH = 16
+DEFAULT_FSYNC_INTERVAL = 1.0
+# Status codes of reports the cloud will never accept
+REJECTED_STATUS_CODES = (400, 413, 422)
+
+logger = logging.getLogger(__name__)
+
+SpoolEntry = namedtuple('SpoolEntry', ['segment', 'offset', 'end', 'report'])
+SpoolEntry.__doc__ = """An entry of the spool: its position (segment, offset and end offset) and its lazy report."""
+
+
+class ReportSpool:
+    """A durable queue of reports, with an optional background uploader.
+    Entries are written (and flushed) immediately, but only fsynced every
+    fsync_batch entries or fsync_interval seconds, whichever comes first, or when
+    flush() or close() is called. The disk quota is enforced by deleting whole
+    segments, oldest first, so it is only accurate to segment_size.
+    Args:
+        directory: The spool directory, created if needed
+        api: an instance of archfx_cloud.api.connection.Api used by the uploader. Must be authenticated.
+        max_bytes: Optional disk quota. Once exceeded, the oldest entries are dropped even if not uploaded.
+        segment_size: Size in bytes after which a new segment file is started
+        fsync_batch: Maximum number of entries written between two fsyncs
+        fsync_interval: Maximum time in seconds between an entry being written and fsynced
+        retry_delay: Delay in seconds before retrying a failed upload, doubled after every failure
+        max_retry_delay: Maximum delay in seconds between two upload attempts
+        compression: Optional codec to compress the spooled reports with (see archfx_cloud.reports.compression)
+    """
+
+    CURSOR_FILE = 'cursor.json'
+    SEGMENT_SUFFIX = '.log'
+
+    def __init__(self,
+                 directory: str,
+                 api=None,
+                 max_bytes: Optional[int] = None,
+                 segment_size: int = DEFAULT_SEGMENT_SIZE,
+                 fsync_batch: int = DEFAULT_FSYNC_BATCH,
+                 fsync_interval: float = DEFAULT_FSYNC_INTERVAL,
+                 retry_delay: float = 1.0,
+                 max_retry_delay: float = 60.0,
+                 compression: Optional[str] = None):
+        self.directory = directory
+        self.api = api
+        self.max_bytes = max_bytes
+        self.segment_size = segment_size
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.compression = compression
+
+        self.uploaded = 0
+        self.rejected = 0
+        self.evicted = 0
+
+        self._cond = threading.Condition()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, '{:08d}{}'.format(segment, self.SEGMENT_SUFFIX))
+
+    def _cursor_path(self) -> str:
+        return os.path.join(self.directory, self.CURSOR_FILE)
+
+    def _recover(self):
+        segments = sorted(
+            int(name[:-len(self.SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(self.SEGMENT_SUFFIX) and name[:-len(self.SEGMENT_SUFFIX)].isdigit()
+        )
+
+        # Only the last segment can have been appended to when the process stopped
+        if segments:
+            removed = truncate_invalid_tail(self._segment_path(segments[-1]))
+            if removed:
+                logger.warning("Removed %d bytes of incomplete data from spool segment %d", removed, segments[-1])
+
+        try:
+            with open(self._cursor_path(), 'r') as fp:
+                cursor = json.load(fp)
+            self._cursor = (cursor['segment'], cursor['offset'])
+        except FileNotFoundError:
+            self._cursor = (segments[0], 0) if segments else (0, 0)
+
+        # Segments before the cursor were fully uploaded, but may not have been deleted yet
+        for segment in segments:
+            if segment < self._cursor[0]:
+                os.remove(self._segment_path(segment))
+        segments = [segment for segment in segments if segment >= self._cursor[0]]
+        if segments and segments[0] != self._cursor[0]:
+            # The cursor segment was evicted
+            self._cursor = (segments[0], 0)
+
+        self._active = segments[-1] if segments else self._cursor[0]
+        self._sizes = {segment: os.path.getsize(self._segment_path(segment)) for segment in segments}
+        if self._cursor[0] in self._sizes and self._cursor[1] > self._sizes[self._cursor[0]]:
+            # Entries acknowledged before being fsynced were lost with the tail of the segment
+            self._cursor = (self._cursor[0], self._sizes[self._cursor[0]])
+
+        self._pending = sum(self._count_pending(segment) for segment in segments)
+        self._open_active()
+
+    def _open_active(self):
+        self._file = open(self._segment_path(self._active), 'ab')
+        self._sizes.setdefault(self._active, 0)
+        fsync_directory(self.directory)
+
+    def _count_pending(self, segment: int) -> int:
+        offset = self._cursor[1] if segment == self._cursor[0] else 0
+        with open(self._segment_path(segment), 'rb') as fp:
+            return sum(1 for _ in iter_frames(fp, offset))
+
+    def _save_cursor(self):
+        data = {'segment': self._cursor[0], 'offset': self._cursor[1]}
+        atomic_write(self._cursor_path(), json.dumps(data).encode())
+
+    def _sync(self):
+        if self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _rotate(self):
+        self._sync()
+        self._file.close()
+        self._active += 1
+        self._open_active()
+
+    def _remove_segment(self, segment: int):
+        os.remove(self._segment_path(segment))
+        del self._sizes[segment]
+
+    def _next_segment(self, segment: int) -> int:
+        return min(other for other in self._sizes if other > segment)
+
+    def _enforce_quota(self):
+        if self.max_bytes is None:
+            return
+
+        while sum(self._sizes.values()) > self.max_bytes:
+            oldest = min(self._sizes)
+            if oldest == self._active:
+                break
+
+            dropped = self._count_pending(oldest) if oldest >= self._cursor[0] else 0
+            self._remove_segment(oldest)
+            self._pending -= dropped
+            self.evicted += dropped
+            if self._cursor[0] <= oldest:
+                self._cursor = (self._next_segment(oldest), 0)
+                self._save_cursor()
+            logger.warning("Spool over quota of %d bytes: dropped %d reports that were not uploaded",
+                           self.max_bytes, dropped)
+
+    def __len__(self):
+        """Number of entries that were not acknowledged yet."""
+        return self._pending
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def enqueue(self, report: ArchFXReport):
+        """Append a report to the spool. Never blocks on the network."""
+        if self.compression is not None:
+            payload = report.encode(self.compression)
+        else:
+            payload = report.encode()
+        frame = encode_frame(payload)
+
+        with self._cond:
+            if self._file is None:
+                raise DataError("Cannot enqueue reports into a closed spool")
+
+            if self._sizes[self._active] and self._sizes[self._active] + len(frame) > self.segment_size:
+                self._rotate()
+
+            self._file.write(frame)
+            self._file.flush()
+            self._sizes[self._active] += len(frame)
+            self._pending += 1
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_batch or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+            self._enforce_quota()
+            self._cond.notify_all()
+
+    def flush(self):
+        """fsync all entries written so far."""
+        with self._cond:
+            if self._file is not None:
+                self._sync()
+
+    def peek(self) -> Optional[SpoolEntry]:
+        """Return the oldest entry that was not acknowledged, or None if the spool is empty."""
+        with self._cond:
+            while True:
+                segment, offset = self._cursor
+                with open(self._segment_path(segment), 'rb') as fp:
+                    fp.seek(offset)
+                    payload = read_frame(fp)
+
+                if payload is not None:
+                    report = ArchFXFlexibleDictionaryReport(payload, False, False, lazy=True)
+                    return SpoolEntry(segment, offset, offset + FRAME_HEADER.size + len(payload), report)
+
+                if segment == self._active:
+                    return None
+
+                # Every entry of this segment was acknowledged
+                next_segment = self._next_segment(segment)
+                self._cursor = (next_segment, 0)
+                self._save_cursor()
+                self._remove_segment(segment)
+
+    def ack(self, entry: SpoolEntry) -> bool:
+        """Acknowledge an entry returned by peek(), so it is never returned again.
+        Returns:
+            bool: False if the entry was already acknowledged or evicted
+        """
+        with self._cond:
+            if (entry.segment, entry.offset) != self._cursor:
+                return False
+
+            self._cursor = (entry.segment, entry.end)
+            self._pending -= 1
+            self._save_cursor()
+            return True
+
+    def upload_next(self) -> bool:
+        """Upload and acknowledge the oldest entry, raising any upload error.
+        Returns:
+            bool: False if the spool was empty
+        """
+        entry = self.peek()
+        if entry is None:
+            return False
+
+        self._upload(entry)
+        return True
+
+    def start(self):
+        """Start uploading entries from a background thread."""
+        if self.api is None:
+            raise DataError("An Api is required to upload spooled reports")
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='archfx-report-spool', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the background uploader, waiting for at most timeout seconds for an upload in progress."""
+        self._stopping.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def close(self):
+        """Stop the uploader and fsync the spool. Entries that were not uploaded are kept for the next run."""
+        self.stop()
+        with self._cond:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+    def _run(self):
+        delay = self.retry_delay
+        while not self._stopping.is_set():
+            with self._cond:
+                if time.monotonic() - self._last_sync >= self.fsync_interval:
+                    self._sync()
+                entry = self.peek()
+                if entry is None:
+                    self._cond.wait(self.fsync_interval)
+                    continue
+
+            try:
+                self._upload(entry)
+            except HttpClientError as err:
+                response = getattr(err, 'response', None)
+                if response is None or response.status_code not in REJECTED_STATUS_CODES:
+                    logger.warning("Spooled report upload refused, retrying in %.1fs: %s", delay, err)
+                    self._stopping.wait(delay)
+                    delay = min(delay * 2, self.max_retry_delay)
+                    continue
+                logger.error("Dropping spooled report rejected by the cloud: %s", err)
+                if self.ack(entry):
+                    self.rejected += 1
+            except Exception as err:  # pylint: disable=broad-except
+                logger.warning("Failed to upload spooled report, retrying in %.1fs: %s", delay, err)
+                self._stopping.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+
+            delay = self.retry_delay
+
+    def _upload(self, entry: SpoolEntry):
+        count = entry.report.upload(self.api)
+        logger.debug("Uploaded spooled report %s: %d new readings", entry.report.report_id, count)
+        # Entries evicted by the quota while uploading are not counted
+        if self.ack(entry):
+            self.uploaded += 1
@@ -0,0 +1,130 @@
+"""Upload many reports concurrently.
+
+Reports are sharded by (device, streamer_index). The reports of a shard are
+uploaded one after the other in seqid order, so the cloud sees each streamer's
+reports in the order the device generated them, while different shards are
+uploaded in parallel over a shared Api. If an upload fails, the remaining
+reports of its shard are skipped (uploading them first could make the cloud
+discard the failed one as already received), but other shards carry on.
+
+Usage:
+    api = Api(pool_size=8)
+    api.login(email='user1@test.com', password='user1')
+    summary = upload_reports(api, reports, max_workers=8)
+    logger.info('{0} new readings, {1} failures'.format(summary.accepted, len(summary.failures)))
+"""
+
+import logging
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional
+
+from .report import ArchFXReport
+
+DEFAULT_MAX_WORKERS = 8
+
+logger = logging.getLogger(__name__)
+
+UploadFailure = namedtuple('UploadFailure', ['report', 'error'])
+UploadFailure.__doc__ = """A report that could not be uploaded and the exception that was raised."""
+
+
+class UploadSummary:
+    """Result of upload_reports().
+    Attributes:
+        accepted: Total number of new readings accepted by the cloud
+        uploaded: Reports that were uploaded
+        failures: UploadFailure of every report whose upload raised an exception
+        skipped: Reports that were not uploaded because an earlier report of their shard failed
+        already_accepted: Reports that were not uploaded because the seqid index lists all their readings
+    """
+
+    __slots__ = ('accepted', 'uploaded', 'failures', 'skipped', 'already_accepted')
+
+    def __init__(self):
+        self.accepted = 0
+        self.uploaded = []
+        self.failures = []
+        self.skipped = []
+        self.already_accepted = []
+
+    @property
+    def ok(self) -> bool:
+        """Whether every report was uploaded."""
+        return not self.failures and not self.skipped
+
+    def __str__(self):
+        return "UploadSummary ({} reports uploaded, {} new readings, {} failed, {} skipped)".format(
+            len(self.uploaded), self.accepted, len(self.failures), len(self.skipped))
+
+
+def shard_reports(reports: Iterable[ArchFXReport]) -> List[List[ArchFXReport]]:
+    """Group reports by (device, streamer_index), each group sorted by seqid.
+    Shards are returned in order of first appearance, and reports with the same seqid keep their order.
+    """
+    shards = OrderedDict()
+    for report in reports:
+        shards.setdefault((report.origin, report.origin_streamer), []).append(report)
+
+    return [sorted(shard, key=lambda report: report.report_id) for shard in shards.values()]
+
+
+def _upload_shard(api, shard: List[ArchFXReport], compression: Optional[str], seqid_index) -> UploadSummary:
+    summary = UploadSummary()
+    for index, report in enumerate(shard):
+        if seqid_index is not None and seqid_index.covers(report):
+            summary.already_accepted.append(report)
+            continue
+
+        kwargs = {}
+        if compression is not None:
+            kwargs['compression'] = compression
+        if seqid_index is not None:
+            kwargs['seqid_index'] = seqid_index
+        try:
+            count = report.upload(api, **kwargs)
+        except Exception as err:  # pylint: disable=broad-except
+            logger.warning("Failed to upload report %s of device %s (streamer %s): %s",
+                           report.report_id, report.origin, report.origin_streamer, err)
+            summary.failures.append(UploadFailure(report, err))
+            summary.skipped.extend(shard[index + 1:])
+            break
+
+        summary.accepted += count
+        summary.uploaded.append(report)
+    return summary
+
+
+def upload_reports(api,
+                   reports: Iterable[ArchFXReport],
+                   max_workers: int = DEFAULT_MAX_WORKERS,
+                   compression: Optional[str] = None,
+                   seqid_index=None) -> UploadSummary:
+    """Upload reports concurrently, keeping the seqid order of each device's streamer.
+    Args:
+        api: an instance of archfx_cloud.api.connection.Api. Must be authenticated. Create it with
+            a pool_size of at least max_workers, so every thread gets its own connection.
+        reports: The reports to upload (for instance ArchFXFlexibleDictionaryReport)
+        max_workers: Maximum number of concurrent uploads
+        compression: Optional codec to compress the reports with (see archfx_cloud.reports.compression)
+        seqid_index: Optional SeqidIndex (see archfx_cloud.reports.seqid_index). Reports whose readings
+            were all accepted already are not uploaded, and uploaded reports are recorded in it.
+    Returns:
+        UploadSummary: The accepted readings, uploaded reports and failures
+    """
+    shards = shard_reports(reports)
+    summary = UploadSummary()
+    if not shards:
+        return summary
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(shards)))) as executor:
+        futures = [executor.submit(_upload_shard, api, shard, compression, seqid_index) for shard in shards]
+        for future in futures:
+            result = future.result()
+            summary.accepted += result.accepted
+            summary.uploaded.extend(result.uploaded)
+            summary.failures.extend(result.failures)
+            summary.skipped.extend(result.skipped)
+            summary.already_accepted.extend(result.already_accepted)
+
+    return summary
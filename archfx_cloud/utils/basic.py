@@ -1,3 +1,24 @@
+from datetime import datetime
+from functools import lru_cache
+
+import dateutil.parser
+
 
 def datetime_to_str(dt):
-    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
\ No newline at end of file
+    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+@lru_cache(maxsize=1024)
+def str_to_datetime(value: str) -> datetime:
+    """
+    Parse an ISO-8601 timestamp.
+    The formats produced by datetime.isoformat() (with a `+00:00` or `Z` offset, with or
+    without microseconds) take a fast path through datetime.fromisoformat(). Anything
+    else falls back to dateutil. Results are cached, as reports often repeat timestamps.
+    """
+    try:
+        if value.endswith('Z'):
+            return datetime.fromisoformat(value[:-1] + '+00:00')
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return dateutil.parser.parse(value)
@@ -0,0 +1,101 @@
+"""Helpers shared by the columnar (NumPy based) APIs. NumPy is an optional dependency."""
+import datetime
+from typing import List
+
+import dateutil.parser
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+ONE_US = datetime.timedelta(microseconds=1)
+
+
+def require_numpy():
+    """Raise an ImportError if NumPy is not installed."""
+    if np is None:
+        raise ImportError("numpy is required for columnar data. Install with `pip install archfx_cloud[numpy]`")
+
+
+def _to_naive_utc(text: str) -> str:
+    value = dateutil.parser.isoparse(text)
+    if value.tzinfo:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value.isoformat()
+
+
+def timestamps_to_us(values: List[str]) -> 'np.ndarray':
+    """
+    Convert a list of ISO-8601 strings into int64 microseconds since the epoch.
+
+    UTC strings (`Z`, `+00:00` or no offset) are converted in a single vectorized
+    pass. Strings with any other offset are normalized to UTC first.
+    """
+    require_numpy()
+
+    naive = []
+    for text in values:
+        if text.endswith('Z'):
+            text = text[:-1]
+        elif text.endswith('+00:00'):
+            text = text[:-6]
+        elif len(text) > 6 and text[-6] in '+-' and text[-3] == ':':
+            text = _to_naive_utc(text)
+        naive.append(text)
+
+    return np.array(naive, dtype='datetime64[us]').astype(np.int64)
+
+
+class GrowableColumn:
+    """A preallocated NumPy buffer that doubles its capacity when full."""
+
+    __slots__ = ('_buffer', '_size')
+
+    def __init__(self, dtype, capacity: int):
+        self._buffer = np.empty(max(capacity, 1), dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def extend(self, values):
+        end = self._size + len(values)
+        if end > len(self._buffer):
+            capacity = len(self._buffer)
+            while capacity < end:
+                capacity *= 2
+            buffer = np.empty(capacity, dtype=self._buffer.dtype)
+            buffer[:self._size] = self._buffer[:self._size]
+            self._buffer = buffer
+
+        self._buffer[self._size:end] = values
+        self._size = end
+
+    def finalize(self) -> 'np.ndarray':
+        """Return the filled part of the buffer, releasing any unused capacity."""
+        if self._size == len(self._buffer):
+            return self._buffer
+        return self._buffer[:self._size].copy()
+
+
+def us_to_isoformat(values) -> 'np.ndarray':
+    """Convert int64 microseconds since the epoch into ISO-8601 UTC strings (with a `+00:00` offset)."""
+    require_numpy()
+
+    text = np.datetime_as_string(np.asarray(values, dtype=np.int64).astype('datetime64[us]'), unit='us')
+    return np.char.add(text, '+00:00')
+
+
+def datetime_to_us(value: datetime.datetime) -> int:
+    """Convert a datetime into microseconds since the epoch. Naive datetimes are assumed to be UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return (value - EPOCH) // ONE_US
+
+
+def us_to_datetime(value: int) -> datetime.datetime:
+    """Convert microseconds since the epoch into a UTC datetime."""
+    return EPOCH + datetime.timedelta(microseconds=int(value))
@@ -0,0 +1,42 @@
+"""Helpers to write files that survive crashes."""
+import os
+import tempfile
+
+
+def fsync_directory(directory: str):
+    """Make a rename durable. Not supported (nor needed) on every platform."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: str, data: bytes):
+    """
+    Atomically replace the content of a file.
+    The data is written to a temporary file in the same directory, fsynced and
+    renamed over path, so a crash leaves either the old or the new content on
+    disk, never a partial file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    prefix = '.{}-'.format(os.path.basename(path))
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    fsync_directory(directory)
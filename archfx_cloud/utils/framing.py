@@ -0,0 +1,75 @@
+"""
+Length and checksum framed records, for append-only files.
+Every frame is an 8 byte header (payload length and CRC32 of the payload, both
+little endian uint32) followed by the payload. A crash while appending can only
+leave a torn frame at the end of a file, which is detected by its length or
+checksum, so readers stop at the last complete frame and writers truncate the
+file back to it before appending again.
+"""
+import os
+import struct
+import zlib
+from typing import Iterator, Optional, Tuple
+
+FRAME_HEADER = struct.Struct('<II')
+MAX_FRAME_SIZE = 0xFFFFFFFF
+
+
+def encode_frame(payload) -> bytes:
+    """Return the framed payload."""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ValueError("Frame payload too large: {} bytes".format(len(payload)))
+    return FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + bytes(payload)
+
+
+def read_frame(fp) -> Optional[bytes]:
+    """
+    Read the frame at the current position of a binary file.
+    Returns:
+        The payload, or None at the end of the file or if the frame is torn or corrupt
+    """
+    header = fp.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+
+    length, crc = FRAME_HEADER.unpack(header)
+    payload = fp.read(length)
+    if len(payload) < length or zlib.crc32(payload) != crc:
+        return None
+    return payload
+
+
+def iter_frames(fp, offset: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """Yield the (offset, payload) of every valid frame from offset, up to the first torn or corrupt one."""
+    fp.seek(offset)
+    while True:
+        payload = read_frame(fp)
+        if payload is None:
+            return
+        yield offset, payload
+        offset += FRAME_HEADER.size + len(payload)
+
+
+def valid_length(path: str) -> int:
+    """Return the size of a framed file up to the end of its last valid frame."""
+    end = 0
+    with open(path, 'rb') as fp:
+        for offset, payload in iter_frames(fp):
+            end = offset + FRAME_HEADER.size + len(payload)
+    return end
+
+
+def truncate_invalid_tail(path: str) -> int:
+    """
+    Remove any torn or corrupt data after the last valid frame of a file.
+    Returns:
+        The number of bytes removed
+    """
+    size = os.path.getsize(path)
+    end = valid_length(path)
+    if end < size:
+        with open(path, 'r+b') as fp:
+            fp.truncate(end)
+            fp.flush()
+            os.fsync(fp.fileno())
+    return size - end
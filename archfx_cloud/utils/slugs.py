@@ -1,7 +1,6 @@
 import re
 import unicodedata
 from datetime import datetime
-from functools import lru_cache
 
 from .convert import (
     gid_join,
@@ -33,17 +32,43 @@ def slugify(value: str, allow_unicode: bool = False) -> str:
 
 
 class ArchFxCloudSlug(object):
-    _slug = None
+    """
+    Base class of the ArchFX Cloud slugs.
+    Single ID slugs are stored as their canonical integer ID and type tag (e.g. 'pl' or 'd'),
+    and only formatted to a string the first time it is needed. Hashing and equality
+    compare the type tag and integer, so slugs are cheap to create, compare and use as keys.
+    """
+    __slots__ = ('_type', '_id', '_str')
+
+    def _init(self, stype, id_, slug=None):
+        self._type = stype
+        self._id = id_
+        self._str = slug
+
+    def _format(self):
+        """Return the slug string. Only called once, the result is cached."""
+        return None
+
+    @property
+    def _slug(self):
+        if self._str is None:
+            self._str = self._format()
+        return self._str
+
+    def _key(self):
+        if self._id is None:
+            return self._type, self._slug
+        return self._type, self._id
 
     def __str__(self):
         return self._slug or ''
 
     def __hash__(self):
-        return hash(self._slug)
+        return hash(self._key())
 
     def __eq__(self, other):
         if isinstance(other, ArchFxCloudSlug):
-            return self._slug == other._slug
+            return self._key() == other._key()
         return super().__eq__(other)
 
     def formatted_id(self):
@@ -60,15 +85,14 @@ class ArchFxCloudSlug(object):
         if parts[0] in ['pl', 'ps', 'pa', 'm', 'd', 'b', 'g']:
             id_ = parts[1]
         id_ = fix_gid(id_, terms)
-        self._slug = gid_join([stype, id_])
+        self._init(stype, gid2int(id_), gid_join([stype, id_]))
 
     def get_id(self):
-        parts = gid_split(self._slug)
-        if len(parts) != 2:
+        if self._id is None:
             raise ValueError('Cannot call get_id() for IDs with more than one term')
-        if parts[0] not in ['ps', 'pa', 'pl', 'd', ]:
+        if self._type not in ['ps', 'pa', 'pl', 'd', ]:
             raise ValueError('Only Devices/DataBlocks/Fleets have single IDs')
-        return gid2int(parts[1])
+        return self._id
 
 
 class ArchFxParentSlug(ArchFxCloudSlug):
@@ -76,19 +100,13 @@ class ArchFxParentSlug(ArchFxCloudSlug):
     Formatted Global Site, Area or Line ID:
        ps--0000-0001, pa--0000-0001, pl--0000-0001
     """
-    _type = 'pl'
+    __slots__ = ()
 
     def __init__(self, id, ptype='pl'):
-        self._type = ptype
         if isinstance(id, ArchFxParentSlug):
-            self._slug = id._slug
-            self._type = id.get_type()
+            self._init(id._type, id._id, id._str)
             return
-        elif isinstance(id, int):
-            if id < 0 or id >= pow(16, 8):
-                raise ValueError('ArchFxProjectSlug: UUID should be greater or equal than zero and less than 16^8')
-            pid = int2pid(id)
-        else:
+        elif not isinstance(id, int):
             parts = gid_split(id)
             if len(parts) == 1:
                 pid = parts[0]
@@ -96,15 +114,20 @@ class ArchFxParentSlug(ArchFxCloudSlug):
                 if parts[0] not in ['pl', 'ps', 'pa']:
                     raise ValueError('ArchFxProjectSlug: must start with a "p"')
                 pid = gid_join(parts[1:])
-                self._type = parts[0]
+                ptype = parts[0]
 
-            # Convert to int and back to get rid of anything above 48 bits
-            id = gid2int(pid)
-            if id < 0 or id >= pow(16, 8):
-                raise ValueError('ArchFxProjectSlug: UUID should be greater or equal than zero and less than 16^8')
-            pid = int2pid(id)
+            id = gid2int(pid)  # Canonicalize to int
 
-        self.set_from_single_id_slug(self._type, 2, pid)
+        if id < 0 or id >= pow(16, 8):
+            raise ValueError('ArchFxProjectSlug: UUID should be greater or equal than zero and less than 16^8')
+
+        self._init(ptype, id)
+
+    def _format(self):
+        return gid_join([self._type, int2pid(self._id)])
+
+    def formatted_id(self):
+        return int2pid(self._id)
 
     def get_type(self):
         return self._type
@@ -112,6 +135,7 @@ class ArchFxParentSlug(ArchFxCloudSlug):
 
 class ArchFxDeviceSlug(ArchFxCloudSlug):
     """Formatted Global Device ID: d--0000-0000-0000-0001"""
+    __slots__ = ()
 
     def __init__(self, id, allow_64bits=True):
         # For backwards compatibility, allow 64 bit IDs if required
@@ -119,7 +143,7 @@ class ArchFxDeviceSlug(ArchFxCloudSlug):
         hex_count = 16 if allow_64bits else 12
 
         if isinstance(id, ArchFxDeviceSlug):
-            self._slug = id._slug
+            self._init(id._type, id._id, id._str)
             return
 
         if isinstance(id, str):
@@ -139,7 +163,13 @@ class ArchFxDeviceSlug(ArchFxCloudSlug):
         if id < 0 or id >= pow(16, hex_count):
             raise ValueError('ArchFxDeviceSlug: UUID should be greater or equal than zero and less than 16^12')
 
-        self.set_from_single_id_slug('d', 4, int2did(id))
+        self._init('d', id)
+
+    def _format(self):
+        return gid_join(['d', int2did(self._id)])
+
+    def formatted_id(self):
+        return int2did(self._id)
 
 
 class ArchFxVariableID(ArchFxCloudSlug):
@@ -154,10 +184,11 @@ class ArchFxVariableID(ArchFxCloudSlug):
         id: string, integer, a single int/string pair (tuple) or another VariableID version of a variable ID. If pair
             version is used, it must be (scope, var) (so scope is at index 0).
     """
+    __slots__ = ()
 
     def __init__(self, id_):
         if isinstance(id_, ArchFxVariableID):
-            self._slug = id_._slug
+            self._init(None, id_._id, id_._str)
             return
 
         if isinstance(id_, tuple):
@@ -185,12 +216,15 @@ class ArchFxVariableID(ArchFxCloudSlug):
             id_ = gid2int(vid)  # Canonicalize to int
 
         if not isinstance(id_, int):
-            raise ValueError(f"ArchFxDeviceSlug: not convertible from {type(id_)}")
+            raise ValueError(f"ArchFxVariableID: not convertible from {type(id_)}")
 
         if id_ < 0 or id_ >= pow(16, 8):
             raise ValueError('ArchFxVariableID: ID should be greater or equal than zero and less than 16^8')
 
-        self.set_from_single_id_slug(None, None, int2vid(id_))
+        self._init(None, id_)
+
+    def _format(self):
+        return int2vid(self._id)
 
     def formatted_id(self):
         """Formatted ID is the same as a Slug for a VariableID"""
@@ -198,39 +232,31 @@ class ArchFxVariableID(ArchFxCloudSlug):
 
     def set_from_single_id_slug(self, stype, terms, id_):
         """Create slug, and ensure it is formatted XXXX-YYYYY"""
-        self._slug = fix_gid(id_, 2)
+        self._init(None, gid2int(fix_gid(id_, 2)))
 
-    @lru_cache()
     def get_id(self):
         """Return integer representation of ID"""
-        parts = gid_split(self._slug)
-        if len(parts) != 1:
-            raise ValueError('ArchFxVariableID should not have stype')
-        return gid2int(parts[0])
+        return self._id
 
     @property
-    @lru_cache()
     def var_hex(self):
         """Return HEX representation of the variable id (no scope)"""
-        return self._slug[5:9]
+        return int16gid(self._id)
 
     @property
-    @lru_cache()
     def scope_hex(self):
         """Return HEX representation of the scope (no scope)"""
-        return self._slug[0:4]
+        return int16gid(self._id >> 16)
 
     @property
-    @lru_cache()
     def var_id(self):
         """Return the 16 Least significant bits representing the variable id"""
-        return 0xFFFF & self.get_id()
+        return 0xFFFF & self._id
 
     @property
-    @lru_cache()
     def scope(self):
         """Return the 16 Most significant bits representing the variable scope"""
-        return (0xFFFF0000 & self.get_id()) >> 16
+        return (0xFFFF0000 & self._id) >> 16
 
 
 class ArchFxStreamSlug(ArchFxCloudSlug):
@@ -248,6 +274,7 @@ class ArchFxStreamSlug(ArchFxCloudSlug):
     }
 
     def __init__(self, sid=None):
+        self._init('sd', None)
         if not sid:
             self.stype = 'sd'
             return
@@ -273,7 +300,7 @@ class ArchFxStreamSlug(ArchFxCloudSlug):
 
         # Make sure we expand to ensure we end up with a 63 char string
         # expanding with any missing zeros
-        self._slug = gid_join(parts)
+        self._init(parts[0], None, gid_join(parts))
         self.stype = parts[0]
 
     def from_parts(self, parent, device, variable, start=None):
@@ -316,7 +343,7 @@ class ArchFxStreamSlug(ArchFxCloudSlug):
 
             parts.append(f'{start:016}')
 
-        self._slug = gid_join(parts)
+        self._init(self.stype, None, gid_join(parts))
 
     def get_parts(self):
         """
@@ -351,6 +378,7 @@ class ArchFxStreamerSlug(ArchFxCloudSlug):
         device (str, int or ArchFxDeviceSlug): The device that this streamer corresponds with.
         index (int): The sub-index of the stream in the device, typically a small number in [0, 8)
     """
+    __slots__ = ('_device', '_index')
 
     def __init__(self, device, index):
         if isinstance(device, int):
@@ -362,20 +390,20 @@ class ArchFxStreamerSlug(ArchFxCloudSlug):
         else:
             raise ValueError("ArchFxStreamerSlug: Unknown device specifier, must be string, int or ArchFxDeviceSlug")
 
-        index = int(index)
+        self._init('t', None)
+        self._device = device_id & 0xFFFFFFFFFFFFFFFF
+        self._index = int(index) & 0xFFFF
 
-        device_gid48 = int2did(device_id)
-        index_gid = int16gid(index)
-        device_gid = fix_gid(device_gid48, 4)
+    def _format(self):
+        return gid_join(['t', int2did(self._device), int16gid(self._index)])
 
-        self._slug = gid_join(['t', device_gid, index_gid])
-        self._device = gid_join(['d', device_gid])
-        self._index = index_gid
+    def _key(self):
+        return self._type, self._device, self._index
 
     def get_device(self):
         """Get the device slug as a string."""
-        return self._device
+        return gid_join(['d', int2did(self._device)])
 
     def get_index(self):
         """Get the streamer index in the device as a padded string."""
-        return self._index
+        return int16gid(self._index)
@@ -0,0 +1,64 @@
+"""
+Compare ArchFXFlexibleDictionaryReport decoding with the fast timestamp parser
+against the previous dateutil based parsing.
+Usage:
+    python -m benchmarks.bench_decode --events 100000
+"""
+import argparse
+import datetime
+import time
+from unittest import mock
+
+import dateutil.parser
+
+from archfx_cloud.reports.flexible_dictionary import ArchFXFlexibleDictionaryReport
+from archfx_cloud.reports.report import ArchFXDataPoint
+from archfx_cloud.utils.basic import str_to_datetime
+
+
+def build_report(events: int) -> bytes:
+    start = datetime.datetime(2021, 1, 20, tzinfo=datetime.timezone.utc)
+    readings = (
+        ArchFXDataPoint(
+            timestamp=start + datetime.timedelta(milliseconds=10 * i),
+            stream='0001-5030',
+            value=float(i),
+            summary_data={'axis': 'z', 'peak': 45.4},
+            reading_id=i + 1,
+        )
+        for i in range(events)
+    )
+    return ArchFXFlexibleDictionaryReport.FromReadings('d--1234', readings, report_id=events + 1).encode()
+
+
+def time_decode(encoded: bytes, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        str_to_datetime.cache_clear()
+        begin = time.perf_counter()
+        ArchFXFlexibleDictionaryReport(encoded, False, False)
+        elapsed = time.perf_counter() - begin
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=100000, help='Number of events in the report')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs (best is reported)')
+    args = parser.parse_args()
+
+    encoded = build_report(args.events)
+
+    with mock.patch('archfx_cloud.reports.report.str_to_datetime', dateutil.parser.parse):
+        baseline = time_decode(encoded, args.repeat)
+    fast = time_decode(encoded, args.repeat)
+
+    print(f'{args.events} events ({len(encoded)} bytes)')
+    print(f'dateutil.parser.parse: {baseline:.3f}s ({args.events / baseline:,.0f} events/s)')
+    print(f'str_to_datetime:       {fast:.3f}s ({args.events / fast:,.0f} events/s)')
+    print(f'speedup:               {baseline / fast:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+Benchmark encoding and decoding of ArchFXFlexibleDictionaryReport.
+For every report size and reading shape (plain, with extra_data, with extra_data
+and raw_data), measure the throughput (events/s), encoded size (bytes/event)
+and peak memory (tracemalloc) of:
+- encode: ArchFXFlexibleDictionaryReport.FromReadings() and encode()
+- decode: ArchFXFlexibleDictionaryReport(encoded) and its readings
+- asdict: ArchFXFlexibleDictionaryReport.asdict()
+- upload: building the multipart request of upload(), without sending it
+- datetime: _encode_datetime() of every reading's timestamp
+Results can be saved as a baseline json file and later runs compared against
+it, failing (exit code 1) if any throughput drops, or encoded size or peak
+memory grows, by more than the tolerance.
+Usage:
+    python -m benchmarks.bench_reports --sizes 100 10000 1000000 --save-baseline baseline.json
+    python -m benchmarks.bench_reports --sizes 100 10000 1000000 --baseline baseline.json
+"""
+import argparse
+import datetime
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+import requests
+
+from archfx_cloud.reports.flexible_dictionary import ArchFXFlexibleDictionaryReport, _encode_datetime
+from archfx_cloud.reports.report import ArchFXDataPoint
+from archfx_cloud.utils.basic import str_to_datetime
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000, 1000000]
+SHAPES = ['plain', 'extra', 'raw']
+OPERATIONS = ['encode', 'decode', 'asdict', 'upload', 'datetime']
+START = datetime.datetime(2021, 1, 20, tzinfo=datetime.timezone.utc)
+
+
+def build_readings(events: int, shape: str) -> list:
+    return [
+        ArchFXDataPoint(
+            timestamp=START + datetime.timedelta(milliseconds=10 * i),
+            stream='0001-5030',
+            value=float(i),
+            summary_data={'axis': 'z', 'peak': 45.4, 'rms': 12.5} if shape != 'plain' else None,
+            raw_data={'samples': [float(i + j) for j in range(16)]} if shape == 'raw' else None,
+            reading_id=i + 1,
+        )
+        for i in range(events)
+    ]
+
+
+def _mock_cloud():
+    def upload_fp(fp, data=None, **kwargs):
+        request = requests.Request('POST', 'http://localhost/api/v1/streamer/report/', data=data,
+                                   files={'file': fp}, params=kwargs).prepare()
+        return {'count': len(request.body)}
+
+    cloud = mock.MagicMock()
+    cloud.return_value.upload_fp.side_effect = upload_fp
+    return cloud
+
+
+def operations(readings: list) -> dict:
+    """Return the benchmarked callables, given the readings of a report."""
+    encoded = ArchFXFlexibleDictionaryReport.FromReadings('d--1234', readings, report_id=len(readings) + 1).encode()
+    report = ArchFXFlexibleDictionaryReport(encoded, False, False, lazy=True)
+    timestamps = [reading.timestamp for reading in readings]
+    cloud = _mock_cloud()
+
+    def decode():
+        str_to_datetime.cache_clear()
+        return ArchFXFlexibleDictionaryReport(encoded, False, False).visible_data
+
+    def asdict():
+        return ArchFXFlexibleDictionaryReport(encoded, False, False, lazy=True).asdict()
+
+    return {
+        'encode': lambda: ArchFXFlexibleDictionaryReport.FromReadings(
+            'd--1234', readings, report_id=len(readings) + 1).encode(),
+        'decode': decode,
+        'asdict': asdict,
+        'upload': lambda: report.upload(cloud),
+        'datetime': lambda: [_encode_datetime(timestamp) for timestamp in timestamps],
+    }, len(encoded)
+
+
+def measure(func, repeat: int) -> dict:
+    """Return the best time of repeat runs, and the peak memory of one more traced run."""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        begin = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - begin
+        best = elapsed if best is None else min(best, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': best, 'peak_bytes': peak}
+
+
+def run(sizes: list, shapes: list, names: list, repeat: int) -> dict:
+    results = {}
+    for shape in shapes:
+        for size in sizes:
+            readings = build_readings(size, shape)
+            funcs, encoded_size = operations(readings)
+            for name in names:
+                # Large reports take long enough to be timed once
+                result = measure(funcs[name], repeat if size < 100000 else 1)
+                result['events_per_s'] = size / result['seconds']
+                result['bytes_per_event'] = encoded_size / size
+                key = '{}/{}/{}'.format(name, shape, size)
+                results[key] = result
+                print('{:<24} {:>14,.0f} events/s {:>8.1f} bytes/event {:>12,} peak bytes'.format(
+                    key, result['events_per_s'], result['bytes_per_event'], result['peak_bytes']))
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return a description of every regression against the baseline results."""
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+
+        if result['events_per_s'] < previous['events_per_s'] * (1 - tolerance):
+            regressions.append('{}: {:,.0f} events/s, baseline {:,.0f}'.format(
+                key, result['events_per_s'], previous['events_per_s']))
+        if result['bytes_per_event'] > previous['bytes_per_event'] * (1 + tolerance):
+            regressions.append('{}: {:.1f} bytes/event, baseline {:.1f}'.format(
+                key, result['bytes_per_event'], previous['bytes_per_event']))
+        if result['peak_bytes'] > previous['peak_bytes'] * (1 + tolerance):
+            regressions.append('{}: {:,} peak bytes, baseline {:,}'.format(
+                key, result['peak_bytes'], previous['peak_bytes']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Number of events per report')
+    parser.add_argument('--shapes', nargs='+', choices=SHAPES, default=SHAPES, help='Reading shapes')
+    parser.add_argument('--operations', nargs='+', choices=OPERATIONS, default=OPERATIONS,
+                        help='Operations to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs (best is reported)')
+    parser.add_argument('--save-baseline', help='Save the results to this json file')
+    parser.add_argument('--baseline', help='Compare the results against this json file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative regression against the baseline (default 0.2)')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.shapes, args.operations, args.repeat)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as outfile:
+            json.dump(results, outfile, indent=2, sort_keys=True)
+        print(f'Saved baseline to {args.save_baseline}')
+
+    if args.baseline:
+        with open(args.baseline, 'r') as infile:
+            baseline = json.load(infile)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -19,7 +19,11 @@ setup(name='archfx_cloud',
     author_email="info@archsys.io",
     license='MIT',
     packages=find_packages(exclude=("tests",)),
-    entry_points={},
+    entry_points={
+        'console_scripts': [
+            'archfx-build-reports=archfx_cloud.reports.build:main',
+        ],
+    },
     python_requires=">=3.7,<4",
     install_requires=[
         'requests>=2.21.0',
@@ -27,6 +31,12 @@ setup(name='archfx_cloud',
         'msgpack>=1.0.2,<1.1',
         'typedargs>=1.1.2,<2',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+        'pandas': ['numpy', 'pandas'],
+        'zstd': ['zstandard'],
+        'arrow': ['numpy', 'pyarrow'],
+    },
     keywords=["iotile", "archfx", "arch", "iiot", "automation"],
     classifiers=[
         "Programming Language :: Python",
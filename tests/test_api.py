@@ -1,10 +1,11 @@
 from io import BytesIO
 import json
+import mock
 import requests
 import requests_mock
 import unittest
 
-from archfx_cloud.api.connection import Api
+from archfx_cloud.api.connection import Api, _MultipartBody
 from archfx_cloud.api.exceptions import HttpClientError, HttpServerError, ImproperlyConfigured
 
 
@@ -49,6 +50,12 @@ class ApiTestCase(unittest.TestCase):
         with self.assertRaises(requests.exceptions.ConnectTimeout):
             api.timeout.get()
 
+    def test_pool_size(self):
+        api = Api(domain='http://archfx.test', pool_size=16)
+        adapter = api.session.get_adapter('http://archfx.test/api/v1/')
+        self.assertEqual(adapter._pool_maxsize, 16)
+        self.assertEqual(adapter.max_retries.total, 0)
+
     @requests_mock.Mocker()
     def test_login(self, m):
         payload = {
@@ -161,9 +168,39 @@ class ApiTestCase(unittest.TestCase):
         resp = api.test.upload_fp(BytesIO(b"test"))  # "No mock address" means content-type is broken!
         self.assertEqual(resp['result'], 'ok')
 
-        request_body = m.request_history[0]._request.body
+        # The body is streamed, requests_mock doesn't read it
+        request_body = m.request_history[0]._request.body.read()
         self.assertIn(b'Content-Disposition: form-data; name="file"; filename=', request_body)
 
+    def test_multipart_body(self):
+        """Testing that the upload body matches requests' multipart encoding, and is read in chunks"""
+        class Reader(BytesIO):
+            sizes = []
+
+            def read(self, size=-1):
+                self.sizes.append(size)
+                return super().read(size)
+
+        content = bytes(range(256)) * 1000
+        with mock.patch('urllib3.filepost.choose_boundary', return_value='b0undary'), \
+                mock.patch('archfx_cloud.api.connection.choose_boundary', return_value='b0undary'):
+            expected = requests.Request('POST', 'http://archfx.test/', data={'a': 1, 'b': 'c'},
+                                        files={'file': ('report.mp', BytesIO(content))}).prepare()
+            body = _MultipartBody({'a': 1, 'b': 'c'}, 'file', ('report.mp', Reader(content)))
+
+        self.assertEqual(body.content_type, expected.headers['Content-Type'])
+        self.assertEqual(len(body), len(expected.body))
+        chunks = list(iter(lambda: body.read(1000), b''))
+        self.assertEqual(b''.join(chunks), expected.body)
+        self.assertTrue(all(0 <= size <= 1000 for size in Reader.sizes))
+        self.assertEqual(max(len(chunk) for chunk in chunks), 1000)
+
+        # Files of unknown size are read up front
+        pipe = mock.Mock(spec=['read'])
+        pipe.read.return_value = b'data'
+        body = _MultipartBody(None, 'file', pipe)
+        self.assertIn(b'\r\n\r\ndata\r\n', body.read())
+
     @requests_mock.Mocker()
     def test_get_list(self, m):
         payload = {
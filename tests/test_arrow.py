@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+import io
+import os
+import tempfile
+import unittest
+
+import pytest
+
+from archfx_cloud.reports.flexible_dictionary import ArchFXFlexibleDictionaryReport
+from archfx_cloud.reports.report import ArchFXDataPoint
+
+pytest.importorskip('numpy')
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+from archfx_cloud.reports.arrow import (  # noqa: E402
+    SCHEMA,
+    to_record_batches,
+    to_table,
+    write_arrow,
+    write_parquet,
+)
+
+START = datetime(2021, 1, 20, tzinfo=timezone.utc)
+
+
+def _report(device, streamer, reading_ids):
+    readings = [
+        ArchFXDataPoint(START + timedelta(seconds=i), 0x5051, float(i),
+                        summary_data={'id': i, 'axis': 'z'} if i % 2 else None, reading_id=i)
+        for i in reading_ids
+    ]
+    return ArchFXFlexibleDictionaryReport.FromReadings(device, readings, report_id=max(reading_ids) + 1,
+                                                       streamer=streamer)
+
+
+class ArrowExportTests(unittest.TestCase):
+
+    def _reports(self):
+        return [_report('d--1234', 0x100, range(1, 6)), _report(0x20, 3, range(10, 13))]
+
+    def test_record_batches(self):
+        batches = list(to_record_batches(self._reports(), batch_size=2))
+        self.assertEqual([batch.num_rows for batch in batches], [2, 2, 1, 2, 1])
+        for batch in batches:
+            self.assertEqual(batch.schema, SCHEMA)
+
+        table = to_table(self._reports())
+        self.assertEqual(table.column('device').to_pylist(), [0x1234] * 5 + [0x20] * 3)
+        self.assertEqual(table.column('streamer_index').to_pylist(), [0x100] * 5 + [3] * 3)
+        self.assertEqual(table.column('stream').to_pylist(), [0x5051] * 8)
+        self.assertEqual(table.column('seqid').to_pylist(), [1, 2, 3, 4, 5, 10, 11, 12])
+        self.assertEqual(table.column('value').to_pylist(), [1.0, 2.0, 3.0, 4.0, 5.0, 10.0, 11.0, 12.0])
+        self.assertEqual(table.column('timestamp').to_pylist()[0], START + timedelta(seconds=1))
+        self.assertEqual(table.column('summary_data').to_pylist()[:2], [[('id', '1'), ('axis', '"z"')], None])
+
+        single = to_table(_report(1, 0, [7]))
+        self.assertEqual(single.num_rows, 1)
+
+    def test_write_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'readings.parquet')
+            self.assertEqual(write_parquet(self._reports(), path, batch_size=4), 8)
+            table = pq.read_table(path)
+            self.assertEqual(table.schema, SCHEMA)
+            self.assertEqual(table.to_pylist(), to_table(self._reports()).to_pylist())
+
+        sink = io.BytesIO()
+        self.assertEqual(write_arrow(self._reports(), sink), 8)
+        table = pa.ipc.open_file(sink.getvalue()).read_all()
+        self.assertEqual(table.to_pylist(), to_table(self._reports()).to_pylist())
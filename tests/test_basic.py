@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta, timezone
+import unittest
+
+from archfx_cloud.utils.basic import datetime_to_str, str_to_datetime
+
+
+class BasicTests(unittest.TestCase):
+
+    def test_datetime_to_str(self):
+        self.assertEqual(datetime_to_str(datetime(2021, 1, 20, 1, 2, 3)), '2021-01-20T01:02:03Z')
+
+    def test_str_to_datetime(self):
+        utc = timezone.utc
+        cases = [
+            ('2021-01-20T00:00:00.100000+00:00', datetime(2021, 1, 20, 0, 0, 0, 100000, utc)),
+            ('2021-01-20T00:00:00+00:00', datetime(2021, 1, 20, tzinfo=utc)),
+            ('2021-01-20T00:00:00.100000Z', datetime(2021, 1, 20, 0, 0, 0, 100000, utc)),
+            ('2021-01-20T01:12:00Z', datetime(2021, 1, 20, 1, 12, tzinfo=utc)),
+            ('2021-01-20T01:12:00', datetime(2021, 1, 20, 1, 12)),
+            ('2021-01-20T01:12:00-02:00', datetime(2021, 1, 20, 1, 12, tzinfo=timezone(timedelta(hours=-2)))),
+            # Unusual formats fall back to dateutil
+            ('2021-01-20T00:00:00.1Z', datetime(2021, 1, 20, 0, 0, 0, 100000, utc)),
+            ('Jan 20 2021 01:12:00 UTC', datetime(2021, 1, 20, 1, 12, tzinfo=utc)),
+        ]
+        for text, expected in cases:
+            result = str_to_datetime(text)
+            self.assertEqual(result, expected, text)
+            self.assertEqual(result.utcoffset(), expected.utcoffset(), text)
+
+        with self.assertRaises(ValueError):
+            str_to_datetime('not a timestamp')
@@ -0,0 +1,170 @@
+from datetime import datetime, timezone
+import sys
+import unittest
+
+import mock
+import pytest
+
+from archfx_cloud.reports.compact import ArchFXCompactReport
+from archfx_cloud.reports.exceptions import DataError
+from archfx_cloud.reports.flexible_dictionary import ArchFXFlexibleDictionaryReport
+from archfx_cloud.reports.report import ArchFXDataPoint
+
+np = pytest.importorskip('numpy')
+
+from archfx_cloud.reports.batch import DataPointBatch  # noqa: E402
+
+
+def _points():
+    return [
+        ArchFXDataPoint(
+            timestamp=datetime(2021, 1, 20, 0, 0, i, 1000 * i, timezone.utc),
+            stream='0001-5030' if i % 2 else 0x5051,
+            value=float(i),
+            summary_data={'foo': i} if i % 3 == 0 else None,
+            raw_data={'samples': [i, i]} if i == 4 else None,
+            reading_id=100 + i,
+        )
+        for i in range(6)
+    ]
+
+
+class DataPointBatchTestCase(unittest.TestCase):
+
+    def _assert_points(self, points):
+        expected = _points()
+        self.assertEqual(len(points), len(expected))
+        for point, other in zip(points, expected):
+            self.assertEqual(point.timestamp, other.timestamp)
+            self.assertEqual(point.stream, other.stream)
+            self.assertEqual(point.value, other.value)
+            self.assertEqual(point.reading_id, other.reading_id)
+            self.assertEqual(point.summary_data, other.summary_data)
+            self.assertEqual(point.raw_data, other.raw_data)
+
+    def test_slots(self):
+        point = _points()[0]
+        self.assertFalse(hasattr(point, '__dict__'))
+        with self.assertRaises(AttributeError):
+            point.foo = 1
+
+    def test_from_points(self):
+        batch = DataPointBatch.FromPoints(_points())
+        self.assertEqual(len(batch), 6)
+        self.assertEqual(batch.timestamp.dtype, np.int64)
+        self.assertEqual(batch.stream.dtype, np.uint32)
+        self.assertEqual(batch.value.dtype, np.float64)
+        self.assertEqual(batch.reading_id.dtype, np.int64)
+        self.assertEqual(batch.timestamp[1], 1611100801001000)
+        self.assertEqual(batch.stream.tolist(), [0x5051, 0x15030] * 3)
+        self.assertEqual(batch.summary_data, [{'foo': 0}, None, None, {'foo': 3}, None, None])
+        self.assertEqual(batch.raw_data[4], {'samples': [4, 4]})
+        self._assert_points(batch.to_points())
+
+    def test_report_round_trip(self):
+        batch = DataPointBatch.FromPoints(_points())
+        report = batch.to_report('d--1234', report_id=200)
+        self.assertEqual(report.lowest_id, 100)
+        self.assertEqual(report.highest_id, 105)
+        self._assert_points(report.visible_data)
+
+        other = DataPointBatch.FromReport(report)
+        self.assertEqual(other.timestamp.tolist(), batch.timestamp.tolist())
+        self.assertEqual(other.stream.tolist(), batch.stream.tolist())
+        self.assertEqual(other.value.tolist(), batch.value.tolist())
+        self.assertEqual(other.reading_id.tolist(), batch.reading_id.tolist())
+        self.assertEqual(other.summary_data, batch.summary_data)
+        self.assertEqual(other.raw_data, batch.raw_data)
+
+        empty = ArchFXFlexibleDictionaryReport.FromReadings('d--1234', [])
+        self.assertEqual(len(DataPointBatch.FromReport(empty)), 0)
+        self.assertIsNone(DataPointBatch.FromReport(empty).summary_data)
+
+    def test_compact_report(self):
+        batch = DataPointBatch.FromPoints(_points())
+        other = DataPointBatch.FromReport(ArchFXCompactReport.FromReadings('d--1234', _points()))
+        self.assertEqual(other.timestamp.tolist(), batch.timestamp.tolist())
+        self.assertEqual(other.stream.tolist(), batch.stream.tolist())
+        self.assertEqual(other.value.tolist(), batch.value.tolist())
+        self.assertEqual(other.reading_id.tolist(), batch.reading_id.tolist())
+        self.assertEqual(other.summary_data, batch.summary_data)
+        self.assertEqual(other.raw_data, batch.raw_data)
+
+    def test_dataframe_round_trip(self):
+        pytest.importorskip('pandas')
+
+        batch = DataPointBatch.FromPoints(_points())
+        df = batch.to_dataframe()
+        self.assertEqual(list(df.columns), ['timestamp', 'stream', 'value', 'reading_id', 'summary_data', 'raw_data'])
+
+        other = DataPointBatch.FromDataFrame(df)
+        self.assertEqual(other.timestamp.tolist(), batch.timestamp.tolist())
+        self.assertEqual(other.stream.tolist(), batch.stream.tolist())
+        self.assertEqual(other.summary_data, batch.summary_data)
+        self._assert_points(other.to_points())
+
+    def test_dataframe_without_pandas(self):
+        batch = DataPointBatch.FromPoints(_points())
+        with mock.patch.dict(sys.modules, {'pandas': None}):
+            with self.assertRaisesRegex(ImportError, r'archfx_cloud\[pandas\]'):
+                batch.to_dataframe()
+            with self.assertRaisesRegex(ImportError, r'archfx_cloud\[pandas\]'):
+                DataPointBatch.FromDataFrame({})
+
+    def test_column_lengths(self):
+        with self.assertRaises(DataError):
+            DataPointBatch([1, 2], [1], [1.0, 2.0], [1, 2])
+
+    def test_from_arrays(self):
+        batch = DataPointBatch.FromArrays(
+            ['2021-01-20T00:00:00Z', '2021-01-20T00:00:01.500000+00:00'],
+            ['5001', '0001-5030'],
+            ['1.5', 2],
+            reading_id=[10, None],
+            summary_data=[{'min': 1}, None],
+        )
+        self.assertEqual(batch.stream.tolist(), [0x5001, 0x15030])
+        self.assertEqual(batch.value.tolist(), [1.5, 2.0])
+        self.assertEqual(batch.reading_id.tolist(), [10, ArchFXDataPoint.InvalidReadingID])
+        self.assertEqual(batch.summary_data, [{'min': 1}, None])
+        self.assertEqual(batch.to_points()[1].timestamp, datetime(2021, 1, 20, 0, 0, 1, 500000, tzinfo=timezone.utc))
+
+        arrays = DataPointBatch.FromArrays(
+            np.array(['2021-01-20T00:00:00', '2021-01-20T00:00:01.5'], dtype='datetime64[ms]'),
+            np.array([0x5001, 0x15030]),
+            np.array([1.5, 2.0]),
+        )
+        self.assertEqual(arrays.timestamp.tolist(), batch.timestamp.tolist())
+        self.assertEqual(arrays.stream.tolist(), batch.stream.tolist())
+        self.assertEqual(arrays.reading_id.tolist(), [0, 0])
+
+    def test_from_arrays_errors(self):
+        with self.assertRaises(DataError) as ctx:
+            DataPointBatch.FromArrays(
+                [datetime(2021, 1, 20, tzinfo=timezone.utc), None, '2021-01-20T00:00:00Z', 'soon'],
+                ['5001', 'zz', 2 ** 40, '5001'],
+                [1.0, 2.0, 'abc', 4.0],
+                summary_data=[None, None, None, {'value': 1}],
+            )
+        rows = ctx.exception.params['rows']
+        self.assertEqual(sorted(rows), [1, 2, 3])
+        self.assertIn('missing timestamp', rows[1])
+        self.assertIn('invalid stream', rows[1])
+        self.assertIn('invalid stream', rows[2])
+        self.assertIn('invalid value', rows[2])
+        self.assertIn('invalid timestamp', rows[3])
+        self.assertIn('summary_data', rows[3])
+
+        with self.assertRaises(DataError) as ctx:
+            DataPointBatch.FromArrays(np.array([0, 1]), np.array([1, -1]), np.array([1.0, 2.0]))
+        self.assertEqual(list(ctx.exception.params['rows']), [1])
+
+        with self.assertRaises(DataError):
+            DataPointBatch.FromArrays([0, 1], [1], [1.0, 2.0])
+
+    def test_raw_data_section(self):
+        report = ArchFXFlexibleDictionaryReport.FromReadings('d--1234', _points(), raw_data_section=True)
+        batch = DataPointBatch.FromReport(report)
+        self.assertEqual(batch.raw_data[4].load(), {'samples': [4, 4]})
+        self._assert_points(batch.to_points())
+        self._assert_points(batch.to_report('d--1234').visible_data)
@@ -0,0 +1,103 @@
+from datetime import datetime, timezone
+import io
+import os
+import tempfile
+import unittest
+from argparse import Namespace
+
+import mock
+
+from archfx_cloud.reports.build import NDJSON, BuildReportsMain, build_reports, detect_format, iter_rows
+from archfx_cloud.reports.exceptions import DataError
+from archfx_cloud.reports.flexible_dictionary import ArchFXFlexibleDictionaryReport
+
+CSV_DATA = """tag,time,val,id
+5001,2021-01-20T00:00:00Z,1.5,1
+0001-5002,1611100801,2.5,2
+5001,2021-01-20T00:00:02+00:00,3.5,3
+5001,2021-01-20T00:00:03Z,4.5,4
+5001,2021-01-20T00:00:04Z,5.5,5
+"""
+COLUMNS = {'stream': 'tag', 'timestamp': 'time', 'value': 'val', 'seqid': 'id'}
+
+
+class BuildReportsTests(unittest.TestCase):
+
+    def test_build_reports(self):
+        chunks = list(build_reports(iter_rows(io.StringIO(CSV_DATA)), 'd--1234', COLUMNS, max_events=2, chunk_rows=4))
+        self.assertEqual([(chunk.rows, chunk.skipped, len(chunk.reports)) for chunk in chunks], [(4, 0, 2), (1, 0, 1)])
+        reports = [report for chunk in chunks for report in chunk.reports]
+        self.assertEqual([report.report_id for report in reports], [3, 5, 6])
+        self.assertEqual([(report.lowest_id, report.highest_id) for report in reports], [(1, 2), (3, 4), (5, 5)])
+
+        points = [point for report in reports for point in report.visible_data]
+        self.assertEqual([point.stream for point in points], [0x5001, 0x15002, 0x5001, 0x5001, 0x5001])
+        self.assertEqual([point.value for point in points], [1.5, 2.5, 3.5, 4.5, 5.5])
+        self.assertEqual(points[1].timestamp, datetime(2021, 1, 20, 0, 0, 1, tzinfo=timezone.utc))
+
+        pooled = list(build_reports(iter_rows(io.StringIO(CSV_DATA)), 'd--1234', COLUMNS, max_events=2,
+                                    chunk_rows=4, max_workers=1))
+        self.assertEqual([report.encode() for chunk in pooled for report in chunk.reports],
+                         [report.encode() for report in reports])
+
+    def test_ndjson_and_errors(self):
+        data = '{"timestamp": 1611100800, "value": 1}\n\n{"timestamp": "soon", "value": 2}\n{"value": 3}\n'
+        self.assertEqual(detect_format('export.ndjson'), NDJSON)
+
+        chunks = list(build_reports(iter_rows(io.StringIO(data), NDJSON), 0x1234, stream='5001', skip_invalid=True))
+        self.assertEqual((chunks[0].rows, chunks[0].skipped), (3, 2))
+        self.assertEqual(chunks[0].reports[0].visible_data[0].value, 1.0)
+
+        with self.assertRaises(DataError):
+            list(build_reports(iter_rows(io.StringIO(data), NDJSON), 0x1234, stream='5001'))
+        with self.assertRaises(DataError):
+            list(build_reports([], 0x1234, {'foo': 'bar'}))
+
+    @mock.patch('archfx_cloud.utils.main.argparse.ArgumentParser.parse_args')
+    def test_main(self, mock_parse_args):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'export.csv')
+            with open(path, 'w') as outfile:
+                outfile.write(CSV_DATA)
+
+            output_dir = os.path.join(tmp_dir, 'reports')
+            mock_parse_args.return_value = Namespace(
+                customer='test', server_type='prod', email=None, inputs=[path], format=None, device='d--1234',
+                streamer=0x100, selector=0xFFFF, column=['{}={}'.format(*item) for item in COLUMNS.items()],
+                stream=None, max_events=2, max_bytes=None, chunk_rows=10, workers=0, skip_invalid=False,
+                output_dir=output_dir, upload=False, compression='gzip', progress_interval=0,
+            )
+            BuildReportsMain().main()
+
+            names = sorted(os.listdir(output_dir))
+            self.assertEqual(names, ['1234-256-3-000001.mp', '1234-256-5-000002.mp', '1234-256-6-000003.mp'])
+            report = ArchFXFlexibleDictionaryReport.FromFile(os.path.join(output_dir, names[1]))
+            self.assertEqual(report.compression, 'gzip')
+            self.assertEqual([point.value for point in report.visible_data], [3.5, 4.5])
+
+    @mock.patch('archfx_cloud.utils.main.argparse.ArgumentParser.parse_args')
+    def test_main_without_seqid(self, mock_parse_args):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'export.csv')
+            with open(path, 'w') as outfile:
+                outfile.write(CSV_DATA)
+
+            output_dir = os.path.join(tmp_dir, 'reports')
+            args = Namespace(
+                customer='test', server_type='prod', email=None, inputs=[path], format=None, device='d--12',
+                streamer=0x100, selector=0xFFFF, column=['stream=tag', 'timestamp=time', 'value=val'], stream=None,
+                max_events=3, max_bytes=None, chunk_rows=10, workers=0, skip_invalid=False, output_dir=output_dir,
+                upload=False, compression=None, progress_interval=0,
+            )
+            mock_parse_args.return_value = args
+            with self.assertLogs('archfx_cloud.reports.build', 'WARNING'):
+                BuildReportsMain().main()
+            self.assertEqual(sorted(os.listdir(output_dir)), ['12-256-0-000001.mp', '12-256-0-000002.mp'])
+
+            # Reports without a seqid are never uploaded
+            mock_parse_args.return_value = Namespace(**dict(vars(args), output_dir=None, upload=True))
+            with mock.patch.object(BuildReportsMain, 'login', return_value=True), \
+                    mock.patch.object(ArchFXFlexibleDictionaryReport, 'upload') as upload:
+                with self.assertRaises(SystemExit):
+                    BuildReportsMain().main()
+            upload.assert_not_called()
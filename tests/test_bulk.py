@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+import os
+import tempfile
+import unittest
+
+import pytest
+
+from archfx_cloud.reports import compression
+from archfx_cloud.reports.bulk import find_reports, iter_reports
+from archfx_cloud.reports.compact import ArchFXCompactReport
+from archfx_cloud.reports.flexible_dictionary import ArchFXFlexibleDictionaryReport
+from archfx_cloud.reports.report import ArchFXDataPoint
+
+
+def _readings(first, count):
+    return [
+        ArchFXDataPoint(datetime(2021, 1, 20, 0, 0, i, tzinfo=timezone.utc), 0x5051, float(i), reading_id=first + i)
+        for i in range(count)
+    ]
+
+
+class BulkLoaderTests(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_dir = self._tmp_dir.name
+
+        for i in range(7):
+            readings = _readings(100 * i, i + 1)
+            if i % 3 == 1:
+                report = ArchFXCompactReport.FromReadings(i + 1, readings)
+            else:
+                report = ArchFXFlexibleDictionaryReport.FromReadings(i + 1, readings)
+            report.write(os.path.join(self.tmp_dir, 'report-{}.mp'.format(i)),
+                         compression=compression.GZIP if i == 2 else None)
+
+        with open(os.path.join(self.tmp_dir, 'report-3.mp'), 'wb') as outfile:
+            outfile.write(b'not a report')
+        with open(os.path.join(self.tmp_dir, 'notes.txt'), 'w') as outfile:
+            outfile.write('ignored')
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _check(self, results):
+        self.assertEqual([os.path.basename(r.path) for r in results], ['report-{}.mp'.format(i) for i in range(7)])
+        for i, result in enumerate(results):
+            if i == 3:
+                self.assertIsNone(result.data)
+                self.assertIsNotNone(result.error)
+                continue
+            self.assertIsNone(result.error)
+            self.assertEqual(result.origin, i + 1)
+            self.assertEqual(len(result.data), i + 1)
+
+    def test_find_reports(self):
+        self.assertEqual(len(find_reports(self.tmp_dir)), 7)
+        self.assertEqual(len(find_reports(os.path.join(self.tmp_dir, 'report-[0-2].mp'))), 3)
+        self.assertEqual(find_reports(self.tmp_dir, pattern='*.txt', recursive=True),
+                         [os.path.join(self.tmp_dir, 'notes.txt')])
+
+    def test_in_process(self):
+        results = list(iter_reports(self.tmp_dir, max_workers=0, chunk_size=3))
+        self._check(results)
+        self.assertEqual(results[6].data[6].reading_id, 606)
+
+    def test_process_pool(self):
+        results = list(iter_reports(self.tmp_dir, max_workers=2, chunk_size=2, max_in_flight=2))
+        self._check(results)
+        self.assertEqual(results[5].data[0].timestamp, datetime(2021, 1, 20, tzinfo=timezone.utc))
+
+    def test_raw_data_section(self):
+        readings = _readings(700, 3)
+        for reading in readings:
+            reading.raw_data = {'samples': [reading.value] * 10}
+        report = ArchFXFlexibleDictionaryReport.FromReadings(8, readings, raw_data_section=True)
+        report.write(os.path.join(self.tmp_dir, 'report-7.mp'))
+
+        results = list(iter_reports(self.tmp_dir, max_workers=1, chunk_size=8))
+        self._check(results[:7])
+        self.assertIsNone(results[7].error)
+        self.assertEqual([point.raw_data for point in results[7].data],
+                         [{'samples': [float(i)] * 10} for i in range(3)])
+
+    def test_batches(self):
+        pytest.importorskip('numpy')
+
+        results = list(iter_reports(find_reports(self.tmp_dir), batches=True, max_workers=2, chunk_size=4))
+        self._check(results)
+        self.assertEqual(results[4].data.reading_id.tolist(), [400, 401, 402, 403, 404])
@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+import unittest
+
+import msgpack
+
+from archfx_cloud.reports.compact import ArchFXCompactReport
+from archfx_cloud.reports.exceptions import DataError
+from archfx_cloud.reports.flexible_dictionary import ArchFXFlexibleDictionaryReport
+from archfx_cloud.reports.report import ArchFXDataPoint
+
+
+def _readings(count=100):
+    return [
+        ArchFXDataPoint(
+            timestamp=datetime(2021, 1, 20, 0, 0, i % 60, 1000 * i, timezone.utc),
+            stream='0001-5030' if i % 2 else 0x5051,
+            value=float(i) / 3,
+            summary_data={'axis': 'z', 'peak': i} if i % 3 == 0 else None,
+            raw_data={'samples': [i, i]} if i % 10 == 0 else None,
+            reading_id=1000 + i,
+        )
+        for i in range(count)
+    ]
+
+
+class CompactReportTests(unittest.TestCase):
+
+    def _assert_readings(self, data, expected):
+        self.assertEqual(len(data), len(expected))
+        for point, other in zip(data, expected):
+            self.assertEqual(point.timestamp, other.timestamp)
+            self.assertEqual(point.stream, other.stream)
+            self.assertEqual(point.value, other.value)
+            self.assertEqual(point.reading_id, other.reading_id)
+            self.assertEqual(point.summary_data, other.summary_data)
+            self.assertEqual(point.raw_data, other.raw_data)
+
+    def test_round_trip(self):
+        readings = _readings()
+        sent_time = datetime(2021, 1, 20, 0, 0, 0, 300000, timezone.utc)
+        report = ArchFXCompactReport.FromReadings('d--1234', readings, report_id=1200, streamer=0xff,
+                                                  sent_timestamp=sent_time)
+
+        decoded = msgpack.unpackb(report.encode(), raw=False)
+        self.assertEqual(decoded['format'], 'v300')
+        self.assertEqual(decoded['columns']['streams'], [0x5051, 0x15030])
+        self.assertEqual(decoded['columns']['keys'], ['axis', 'peak'])
+
+        self.assertEqual(report.origin, 0x1234)
+        self.assertEqual(report.report_id, 1200)
+        self.assertEqual(report.origin_streamer, 0xff)
+        self.assertEqual(report.lowest_id, 1000)
+        self.assertEqual(report.highest_id, 1099)
+        self.assertEqual(report.sent_timestamp, '2021-01-20T00:00:00.300000+00:00')
+        self._assert_readings(report.visible_data, readings)
+
+        # Format is detected by the flexible dictionary report, lazy or not
+        self._assert_readings(ArchFXFlexibleDictionaryReport(report.encode(), False, False).visible_data, readings)
+        lazy = ArchFXFlexibleDictionaryReport(report.encode(), False, False, lazy=True)
+        self.assertEqual(lazy.highest_id, 1099)
+        self._assert_readings(list(lazy.iter_data()), readings)
+
+    def test_smaller_than_v200(self):
+        readings = _readings(1000)
+        compact = ArchFXCompactReport.FromReadings('d--1234', readings)
+        flexible = ArchFXFlexibleDictionaryReport.FromReadings('d--1234', readings)
+        self.assertLess(len(compact.encode()) * 2, len(flexible.encode()))
+
+    def test_empty_and_invalid(self):
+        report = ArchFXCompactReport.FromReadings('d--1234', [])
+        self.assertEqual(report.visible_data, [])
+        self.assertEqual(report.lowest_id, ArchFXDataPoint.InvalidReadingID)
+
+        encoded = msgpack.packb({'format': 'v300', 'device': 1, 'columns': {'stream': [0], 'streams': [1]}})
+        with self.assertRaises(DataError):
+            ArchFXFlexibleDictionaryReport(encoded, False, False)
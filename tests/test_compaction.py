@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta, timezone
+import os
+import tempfile
+import unittest
+
+import mock
+
+from archfx_cloud.reports import compaction
+from archfx_cloud.reports.compact import ArchFXCompactReport
+from archfx_cloud.reports.compaction import ReportCompactor, compact_reports
+from archfx_cloud.reports.exceptions import DataError
+from archfx_cloud.reports.flexible_dictionary import ArchFXFlexibleDictionaryReport
+from archfx_cloud.reports.report import ArchFXDataPoint
+
+START = datetime(2021, 1, 20, tzinfo=timezone.utc)
+
+
+def _report(device, streamer, reading_ids, report_cls=ArchFXFlexibleDictionaryReport):
+    readings = [
+        ArchFXDataPoint(START + timedelta(seconds=i), 0x5051, float(i), summary_data={'id': i}, reading_id=i)
+        for i in reading_ids
+    ]
+    report_id = max(reading_ids) + 1 if reading_ids else 0
+    return report_cls.FromReadings(device, readings, report_id=report_id, streamer=streamer,
+                                   sent_timestamp=START + timedelta(seconds=report_id))
+
+
+class CompactionTests(unittest.TestCase):
+
+    def _reports(self):
+        return [
+            _report(1, 0, [5, 6, 7]),
+            _report(2, 0, [1, 2]),
+            _report(1, 0, [1, 2, 3]),
+            _report(1, 1, [10, 11]),
+            _report(1, 0, [3, 4, 5], report_cls=ArchFXCompactReport),
+            _report(1, 0, [7, 8, 9]),
+        ]
+
+    def _check(self, reports, compactor=None):
+        groups = {}
+        for report in reports:
+            groups.setdefault((report.origin, report.origin_streamer), []).append(report)
+
+        self.assertEqual(list(groups), [(1, 0), (2, 0), (1, 1)])
+        device1 = groups[(1, 0)]
+        self.assertEqual([r.report_id for r in device1], [5, 9, 10])
+        self.assertEqual([(r.lowest_id, r.highest_id) for r in device1], [(1, 4), (5, 8), (9, 9)])
+        self.assertEqual([p.reading_id for r in device1 for p in r.visible_data], list(range(1, 10)))
+        self.assertEqual([p.value for r in device1 for p in r.visible_data], [float(i) for i in range(1, 10)])
+        self.assertEqual(device1[0].visible_data[2].summary_data, {'id': 3})
+        self.assertEqual(device1[-1].sent_timestamp, '2021-01-20T00:00:10+00:00')
+        self.assertEqual(groups[(2, 0)][0].report_id, 3)
+        self.assertEqual([p.reading_id for p in groups[(1, 1)][0].visible_data], [10, 11])
+
+    def test_in_memory(self):
+        self._check(list(compact_reports(self._reports(), max_events=4)))
+
+    def test_external_merge(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            compactor = ReportCompactor(max_events=4, run_size=2, tmp_dir=tmp_dir)
+            compactor.extend(self._reports())
+            self.assertTrue(os.listdir(tmp_dir))
+            self._check(list(compactor.finish()))
+            self.assertEqual(compactor.events, 16)
+            self.assertEqual(compactor.duplicates, 3)
+            self.assertEqual(os.listdir(tmp_dir), [])
+
+    def test_multi_pass_merge(self):
+        open_runs = set()
+        peak = []
+
+        def _tracked_run(path):
+            open_runs.add(path)
+            peak.append(len(open_runs))
+            try:
+                yield from iter_run(path)
+            finally:
+                open_runs.discard(path)
+
+        iter_run = compaction._iter_run
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with mock.patch.object(compaction, '_iter_run', side_effect=_tracked_run):
+                compactor = ReportCompactor(max_events=4, run_size=1, tmp_dir=tmp_dir, max_fan_in=3)
+                compactor.extend(self._reports())
+                self.assertEqual(len(compactor._groups[(1, 0)].runs), 12)
+                self._check(list(compactor.finish()))
+            self.assertEqual(max(peak), 3)
+            self.assertEqual(compactor.duplicates, 3)
+            self.assertEqual(os.listdir(tmp_dir), [])
+
+        with self.assertRaises(DataError):
+            ReportCompactor(max_fan_in=1)
+
+    def test_unknown_reading_ids(self):
+        reports = [_report(1, 0, [0, 0]), _report(1, 0, [0, 3])]
+        compacted = list(compact_reports(reports))
+        self.assertEqual(len(compacted), 1)
+        self.assertEqual([p.reading_id for p in compacted[0].visible_data], [0, 0, 0, 3])
+        self.assertEqual(compacted[0].lowest_id, 3)
@@ -0,0 +1,123 @@
+from datetime import datetime, timezone
+import gzip
+import os
+import tempfile
+import unittest
+
+import mock
+import pytest
+import requests_mock
+
+from archfx_cloud.api.connection import Api
+from archfx_cloud.reports import compression
+from archfx_cloud.reports.exceptions import DataError
+from archfx_cloud.reports.flexible_dictionary import (
+    ArchFXFlexibleDictionaryReport,
+    ArchFXFlexibleDictionaryReportWriter,
+)
+from archfx_cloud.reports.report import ArchFXDataPoint
+
+
+def _readings(count=500):
+    return [
+        ArchFXDataPoint(
+            timestamp=datetime(2021, 1, 20, 0, 0, i % 60, tzinfo=timezone.utc),
+            stream=0x5051,
+            value=float(i % 10),
+            summary_data={'axis': 'z'},
+            reading_id=1000 + i,
+        )
+        for i in range(count)
+    ]
+
+
+class CompressionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.readings = _readings()
+        self.report = ArchFXFlexibleDictionaryReport.FromReadings('d--1234', self.readings, report_id=2000)
+
+    def _codecs(self):
+        codecs = [compression.GZIP]
+        if compression.zstandard is not None:
+            codecs.append(compression.ZSTD)
+        return codecs
+
+    def test_round_trip(self):
+        encoded = self.report.encode()
+        self.assertFalse(compression.is_compressed(encoded))
+        self.assertIsNone(self.report.compression)
+
+        for codec in self._codecs():
+            compressed = self.report.encode(compression=codec, level=1)
+            self.assertTrue(compression.is_compressed(compressed))
+            self.assertEqual(compression.get_codec(compressed), codec)
+            self.assertLess(len(compressed), len(encoded))
+            self.assertEqual(self.report.compression_ratio, len(encoded) / len(compressed))
+            self.assertEqual(compression.decompress(compressed), encoded)
+
+            # Compressed reports are detected when decoding, lazy or not
+            report = ArchFXFlexibleDictionaryReport(compressed, False, False)
+            self.assertEqual(report.compression, codec)
+            self.assertGreater(report.compression_ratio, 1)
+            self.assertEqual(report.encode(), encoded)
+            self.assertEqual(len(report.visible_data), len(self.readings))
+            self.assertEqual(ArchFXFlexibleDictionaryReport(compressed, False, False, lazy=True).report_id, 2000)
+
+    def test_write_and_upload(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for codec in self._codecs():
+                path = os.path.join(tmp_dir, 'report.mp')
+                self.report.write(path, compression=codec)
+
+                writer = ArchFXFlexibleDictionaryReportWriter('d--1234', report_id=2000, spool_size=64)
+                writer.extend(self.readings)
+                writer_path = os.path.join(tmp_dir, 'writer.mp')
+                writer.write(writer_path, compression=codec)
+
+                for file_path in (path, writer_path):
+                    with open(file_path, 'rb') as infile:
+                        report = ArchFXFlexibleDictionaryReport(infile.read(), False, False)
+                    self.assertEqual(report.compression, codec)
+                    self.assertEqual(report.encode(), self.report.encode())
+
+    @requests_mock.Mocker()
+    def test_upload(self, m):
+        m.post('http://archfx.test/api/v1/streamer/report/', json={'count': 500})
+        api = Api(domain='http://archfx.test')
+        compressed = ArchFXFlexibleDictionaryReport(self.report.encode(compression.GZIP), False, False)
+
+        # The report itself is always uploaded uncompressed, the request body is compressed with Content-Encoding
+        for codec in self._codecs():
+            self.assertEqual(compressed.upload(api, compression=codec), 500)
+            request = m.request_history[-1]
+            self.assertEqual(request.headers['Content-Encoding'], codec)
+            self.assertTrue(request.headers['Content-Type'].startswith('multipart/form-data; boundary='))
+            if codec == compression.GZIP:
+                body = gzip.decompress(request.body)
+            else:
+                body = compression.zstandard.ZstdDecompressor().decompressobj().decompress(request.body)
+            self.assertIn(self.report.encode(), body)
+            self.assertNotIn(compression.MAGIC, body)
+
+        compressed.upload(api)
+        self.assertNotIn('Content-Encoding', m.request_history[-1].headers)
+        self.assertIn(self.report.encode(), m.request_history[-1].body.read())
+
+    def test_errors(self):
+        with self.assertRaises(DataError):
+            self.report.encode(compression='lz4')
+        with self.assertRaises(DataError):
+            compression.decompress(self.report.encode())
+        with self.assertRaises(DataError):
+            ArchFXFlexibleDictionaryReport(compression.MAGIC + b'\x01garbage', False, False)
+        with self.assertRaises(DataError):
+            compression.get_codec(compression.MAGIC + b'\x7f')
+        for codec in self._codecs():
+            with self.assertRaises(DataError):
+                ArchFXFlexibleDictionaryReport(self.report.encode(codec)[:-4], False, False)
+
+    def test_missing_zstd(self):
+        with mock.patch.object(compression, 'zstandard', None):
+            with pytest.raises(ImportError):
+                self.report.encode(compression=compression.ZSTD)
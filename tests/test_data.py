@@ -0,0 +1,138 @@
+import unittest
+
+import pytest
+import requests_mock
+
+from archfx_cloud.api.connection import Api
+from archfx_cloud.api.data import fetch_columnar, fetch_merged, iter_pages, timestamps_to_us
+
+np = pytest.importorskip('numpy')
+
+STREAM = 'sl--0000-0001--0000-0000-0000-0002--0000-5051'
+STREAM2 = 'sl--0000-0001--0000-0000-0000-0002--0000-5052'
+
+
+class ColumnarDataTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.api = Api(domain='http://archfx.test')
+
+    def _mock_pages(self, m):
+        m.get(
+            f'http://archfx.test/api/v1/data/?filter={STREAM}&page_size=2',
+            json={
+                'count': 3,
+                'next': f'http://archfx.test/api/v1/data/?filter={STREAM}&page_size=2&page=2',
+                'results': [
+                    {'timestamp': '2021-01-20T00:00:00.100000Z', 'value': 1.0, 'seqid': 10},
+                    {'timestamp': '2021-01-20T00:00:01+00:00', 'value': None, 'seqid': 11},
+                ]
+            },
+            complete_qs=True,
+        )
+        m.get(
+            f'http://archfx.test/api/v1/data/?filter={STREAM}&page_size=2&page=2',
+            json={
+                'count': 3,
+                'next': None,
+                'results': [
+                    {'timestamp': '2021-01-20T02:00:02-02:00', 'value': 3, 'seqid': None},
+                ]
+            },
+            complete_qs=True,
+        )
+
+    @requests_mock.Mocker()
+    def test_iter_pages(self, m):
+        self._mock_pages(m)
+
+        pages = list(iter_pages(self.api, filter=STREAM, page_size=2))
+        self.assertEqual([len(page) for page in pages], [2, 1])
+
+    @requests_mock.Mocker()
+    def test_fetch_columnar(self, m):
+        self._mock_pages(m)
+
+        data = fetch_columnar(self.api, STREAM, page_size=2)
+        self.assertEqual(len(data), 3)
+        self.assertEqual(data.stream, STREAM)
+        self.assertEqual(data.timestamp.dtype, np.int64)
+        self.assertEqual(data.value.dtype, np.float64)
+        self.assertEqual(data.seqid.dtype, np.int64)
+        self.assertEqual(data.timestamp.tolist(), [1611100800100000, 1611100801000000, 1611115202000000])
+        self.assertEqual(data.value[0], 1.0)
+        self.assertTrue(np.isnan(data.value[1]))
+        self.assertEqual(data.value[2], 3.0)
+        self.assertEqual(data.seqid.tolist(), [10, 11, 0])
+
+    @requests_mock.Mocker()
+    def test_fetch_columnar_empty(self, m):
+        m.get('http://archfx.test/api/v1/data/', json={'count': 0, 'next': None, 'results': []})
+
+        data = fetch_columnar(self.api, STREAM)
+        self.assertEqual(len(data), 0)
+        self.assertEqual(data.timestamp.dtype, np.int64)
+
+    @requests_mock.Mocker()
+    def test_to_dataframe(self, m):
+        pytest.importorskip('pandas')
+        self._mock_pages(m)
+
+        df = fetch_columnar(self.api, STREAM, page_size=2).to_dataframe()
+        self.assertEqual(list(df.columns), ['timestamp', 'value', 'seqid'])
+        self.assertEqual(str(df['timestamp'][0]), '2021-01-20 00:00:00.100000+00:00')
+
+    def test_timestamps_to_us(self):
+        result = timestamps_to_us(['1970-01-01T00:00:00Z', '1970-01-01T00:00:00.000001', '1970-01-01T01:00:00+01:00'])
+        self.assertEqual(result.tolist(), [0, 1, 0])
+
+
+class MergedDataTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.api = Api(domain='http://archfx.test')
+
+    def _mock_stream(self, m, stream, pages):
+        base = f'http://archfx.test/api/v1/data/?filter={stream}&page_size=2'
+        for num, rows in enumerate(pages, start=1):
+            url = base if num == 1 else f'{base}&page={num}'
+            next_url = f'{base}&page={num + 1}' if num < len(pages) else None
+            m.get(url, json={'count': 0, 'next': next_url, 'results': rows}, complete_qs=True)
+
+    @requests_mock.Mocker()
+    def test_fetch_merged(self, m):
+        self._mock_stream(m, STREAM, [
+            [
+                {'timestamp': '2021-01-20T00:00:01Z', 'value': 1.0, 'seqid': 1},
+                {'timestamp': '2021-01-20T00:00:03Z', 'value': 3.0, 'seqid': 2},
+            ],
+            [
+                {'timestamp': '2021-01-20T00:00:05Z', 'value': 5.0, 'seqid': 3},
+            ],
+        ])
+        self._mock_stream(m, STREAM2, [
+            [
+                {'timestamp': '2021-01-20T00:00:00.500000Z', 'value': 0.5, 'seqid': 10},
+                {'timestamp': '2021-01-20T00:00:03Z', 'value': 3.5, 'seqid': 11},
+            ],
+            [
+                {'timestamp': '2021-01-20T00:00:04Z', 'value': 4.0, 'seqid': 12},
+            ],
+        ])
+
+        for workers in (1, 4):
+            points = list(fetch_merged(self.api, [STREAM, STREAM2], page_size=2, max_workers=workers))
+            self.assertEqual([p.value for p in points], [0.5, 1.0, 3.0, 3.5, 4.0, 5.0])
+            self.assertEqual([p.stream for p in points], [STREAM2, STREAM, STREAM, STREAM2, STREAM2, STREAM])
+            self.assertEqual(points[0].seqid, 10)
+            self.assertEqual(points[0].timestamp.microsecond, 500000)
+
+    @requests_mock.Mocker()
+    def test_fetch_merged_empty_stream(self, m):
+        self._mock_stream(m, STREAM, [[]])
+        self._mock_stream(m, STREAM2, [[{'timestamp': '2021-01-20T00:00:00Z', 'value': 1.0, 'seqid': 1}]])
+
+        points = list(fetch_merged(self.api, [STREAM, STREAM2], page_size=2))
+        self.assertEqual(len(points), 1)
+        self.assertEqual(points[0].stream, STREAM2)
+        self.assertEqual(list(fetch_merged(self.api, [])), [])
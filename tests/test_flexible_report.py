@@ -1,12 +1,22 @@
 from datetime import datetime, timezone
+import os
+import pickle
+import tempfile
 import unittest
 
+import mock
 import msgpack
 import requests_mock
 
 from archfx_cloud.api.connection import Api
-from archfx_cloud.reports.flexible_dictionary import ArchFXFlexibleDictionaryReport
-from archfx_cloud.reports.report import ArchFXDataPoint
+from archfx_cloud.reports.exceptions import DataError
+from archfx_cloud.reports.flexible_dictionary import (
+    ArchFXFlexibleDictionaryReport,
+    ArchFXFlexibleDictionaryReportWriter,
+    ReportHeader,
+    read_header,
+)
+from archfx_cloud.reports.report import ArchFXDataPoint, ArchFXReport, LazyRawData
 
 
 class FlexibleReportTests(unittest.TestCase):
@@ -183,5 +193,307 @@ class FlexibleReportTests(unittest.TestCase):
 
         request = m.request_history[0]._request
         self.assertIn('multipart/form-data; boundary=', request.headers["Content-Type"])
-        self.assertIn(b'Content-Disposition: form-data; name="file"; filename=', request.body)
-        self.assertIn(b'filename="report.mp"', request.body)  # Check filename correctness
+        body = request.body.read()
+        self.assertIn(b'Content-Disposition: form-data; name="file"; filename=', body)
+        self.assertIn(b'filename="report.mp"', body)  # Check filename correctness
+
+    def test_report_writer(self):
+        """Make sure the streaming writer produces the same report as a single msgpack encoding."""
+        sent_time = datetime(2021, 1, 20, 0, 0, 0, 300000, timezone.utc)
+
+        def readings():
+            for i in range(100):
+                yield ArchFXDataPoint(
+                    timestamp=datetime(2021, 1, 20, 0, 0, i % 60, 0, timezone.utc),
+                    stream='0001-5030',
+                    value=float(i),
+                    summary_data={'foo': i},
+                    raw_data={'samples': [i] * 10} if i % 10 == 0 else None,
+                    reading_id=1000 - i if i else None,
+                )
+
+        expected = msgpack.packb({
+            "format": "v200",
+            "device": 0x1234,
+            "streamer_index": 0xff,
+            "streamer_selector": 0xffff,
+            "seqid": 1003,
+            "lowest_id": 901,
+            "highest_id": 999,
+            "sent_timestamp": '2021-01-20T00:00:00.300000+00:00',
+            "events": [
+                dict(x.asdict(), timestamp=x.timestamp.isoformat()) for x in readings()
+            ],
+        }, use_bin_type=True)
+
+        # Spool events to a temporary file very early
+        writer = ArchFXFlexibleDictionaryReportWriter('d--1234', report_id=1003, streamer=0xff,
+                                                      sent_timestamp=sent_time, spool_size=64)
+        for reading in readings():
+            writer.add(reading)
+        self.assertEqual(writer.count, 100)
+        self.assertEqual(writer.lowest_id, 901)
+        self.assertEqual(writer.highest_id, 999)
+
+        report = writer.finish()
+        self.assertEqual(report.encode(), expected)
+        self.assertEqual(len(report.visible_data), 100)
+        self.assertEqual(report.lowest_id, 901)
+        self.assertEqual(report.highest_id, 999)
+
+        with self.assertRaises(DataError):
+            writer.add(next(readings()))
+
+        # FromReadings accepts generators
+        report = ArchFXFlexibleDictionaryReport.FromReadings('d--1234', readings(), report_id=1003,
+                                                             streamer=0xff, sent_timestamp=sent_time)
+        self.assertEqual(report.encode(), expected)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'report.mp')
+            writer = ArchFXFlexibleDictionaryReportWriter('d--1234', report_id=1003, streamer=0xff,
+                                                          sent_timestamp=sent_time)
+            writer.extend(readings())
+            writer.write(path)
+            with open(path, 'rb') as infile:
+                self.assertEqual(infile.read(), expected)
+
+    def test_chunked_reports(self):
+        """Make sure readings are split into bounded reports with correct ids."""
+        readings = [
+            ArchFXDataPoint(
+                timestamp=datetime(2021, 1, 20, 0, 0, i, 0, timezone.utc),
+                stream='0001-5030',
+                value=float(i),
+                summary_data={'foo': 'x' * 20},
+                reading_id=100 + i,
+            )
+            for i in range(25)
+        ]
+
+        reports = list(ArchFXFlexibleDictionaryReport.ChunkedFromReadings(
+            'd--1234', readings, max_events=10, report_id=200, streamer=0xff
+        ))
+        self.assertEqual([len(r.visible_data) for r in reports], [10, 10, 5])
+        self.assertEqual([r.lowest_id for r in reports], [100, 110, 120])
+        self.assertEqual([r.highest_id for r in reports], [109, 119, 124])
+        self.assertEqual([r.report_id for r in reports], [110, 120, 200])
+        self.assertEqual([r.origin_streamer for r in reports], [0xff, 0xff, 0xff])
+        values = [point.value for report in reports for point in report.visible_data]
+        self.assertEqual(values, [float(i) for i in range(25)])
+
+        reports = list(ArchFXFlexibleDictionaryReport.ChunkedFromReadings('d--1234', readings, max_events=10))
+        self.assertEqual([r.report_id for r in reports], [110, 120, 125])
+
+        no_ids = [ArchFXDataPoint(timestamp=point.timestamp, stream=point.stream, value=point.value)
+                  for point in readings[:5]]
+        reports = list(ArchFXFlexibleDictionaryReport.ChunkedFromReadings('d--1234', no_ids, max_events=10))
+        self.assertEqual([r.report_id for r in reports], [ArchFXDataPoint.InvalidReadingID])
+
+        max_bytes = 600
+        reports = list(ArchFXFlexibleDictionaryReport.ChunkedFromReadings('d--1234', readings, max_bytes=max_bytes))
+        self.assertGreater(len(reports), 1)
+        for report in reports:
+            self.assertLessEqual(len(report.encode()), max_bytes)
+        ids = [point.reading_id for report in reports for point in report.visible_data]
+        self.assertEqual(ids, list(range(100, 125)))
+
+        with self.assertRaises(DataError):
+            list(ArchFXFlexibleDictionaryReport.ChunkedFromReadings('d--1234', readings, max_bytes=100))
+
+        self.assertEqual(list(ArchFXFlexibleDictionaryReport.ChunkedFromReadings('d--1234', [], max_events=10)), [])
+
+    def test_lazy_report(self):
+        """Make sure lazy reports only decode what is accessed."""
+        readings = [
+            ArchFXDataPoint(
+                timestamp=datetime(2021, 1, 20, 0, 0, i, 0, timezone.utc),
+                stream='0001-5030',
+                value=float(i),
+                reading_id=100 + i,
+            )
+            for i in range(10)
+        ]
+        encoded = ArchFXFlexibleDictionaryReport.FromReadings('d--1234', readings, report_id=200).encode()
+
+        # Construction parses nothing
+        ArchFXFlexibleDictionaryReport(b'not msgpack', False, False, lazy=True)
+
+        report = ArchFXFlexibleDictionaryReport(encoded, False, False, lazy=True)
+        with mock.patch.object(ArchFXDataPoint, 'FromDict') as from_dict:
+            self.assertEqual(report.origin, 0x1234)
+            self.assertEqual(report.report_id, 200)
+            self.assertEqual(report.lowest_id, 100)
+            self.assertEqual(report.highest_id, 109)
+            from_dict.assert_not_called()
+        self.assertIsNone(report._visible_data)
+
+        values = [point.value for point in report.iter_data()]
+        self.assertEqual(values, [float(i) for i in range(10)])
+        self.assertIsNone(report._visible_data)
+
+        self.assertEqual(len(report.visible_data), 10)
+        self.assertIs(report.visible_data, report.visible_data)
+
+        report = ArchFXFlexibleDictionaryReport(encoded, False, False, memory_mode=ArchFXReport.DROP_RAW)
+        self.assertIsNone(report.raw_report)
+        self.assertEqual(len(report.visible_data), 10)
+        self.assertEqual(report.origin, 0x1234)
+        with self.assertRaises(DataError):
+            report.encode()
+        with self.assertRaises(DataError):
+            report.asdict()
+
+        report = ArchFXFlexibleDictionaryReport(encoded, False, False, lazy=True,
+                                                memory_mode=ArchFXReport.DROP_DECODED)
+        self.assertEqual(len(report.visible_data), 10)
+        self.assertIsNone(report._visible_data)
+        self.assertEqual(report.encode(), encoded)
+
+        with self.assertRaises(DataError):
+            ArchFXFlexibleDictionaryReport(encoded, False, False, memory_mode='foo')
+
+    def test_from_file(self):
+        """Make sure memory mapped reports decode, save and upload from the mapped file."""
+        readings = [
+            ArchFXDataPoint(
+                timestamp=datetime(2021, 1, 20, 0, 0, i, 0, timezone.utc),
+                stream='0001-5030',
+                value=float(i),
+                reading_id=100 + i,
+            )
+            for i in range(10)
+        ]
+        original = ArchFXFlexibleDictionaryReport.FromReadings('d--1234', readings, report_id=200)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'report.mp')
+            original.save(path)
+
+            with ArchFXFlexibleDictionaryReport.FromFile(path) as report:
+                self.assertIsInstance(report.raw_report, memoryview)
+                self.assertEqual(report.report_id, 200)
+                self.assertEqual([point.value for point in report.iter_data()], [float(i) for i in range(10)])
+                self.assertEqual(len(report.visible_data), 10)
+
+                copy_path = os.path.join(tmp_dir, 'copy.mp')
+                report.save(copy_path)
+                with open(copy_path, 'rb') as infile:
+                    self.assertEqual(infile.read(), original.encode())
+
+                cloud = mock.MagicMock()
+                cloud.return_value.upload_fp.return_value = {'count': 10}
+                self.assertEqual(report.upload(cloud), 10)
+                self.assertEqual(cloud.return_value.upload_fp.call_args[0][0][1].read(), original.encode())
+
+                info = report.serialize()
+                self.assertIsInstance(info['encoded_report'], memoryview)
+                self.assertEqual(bytes(info['encoded_report']), original.encode())
+                self.assertEqual(info['report_format'], ArchFXFlexibleDictionaryReport.FORMAT_TAG)
+                self.assertEqual(info['origin'], 0x1234)
+
+            self.assertIsNone(report.raw_report)
+            with self.assertRaises(DataError):
+                report.encode()
+
+            original.write(path, compression='gzip')
+            report = ArchFXFlexibleDictionaryReport.FromFile(path)
+            self.assertEqual(report.compression, 'gzip')
+            self.assertEqual(report.encode(), original.encode())
+
+            open(path, 'wb').close()
+            with self.assertRaises(DataError):
+                ArchFXFlexibleDictionaryReport.FromFile(path)
+
+    def test_read_header(self):
+        """Make sure headers are read without decoding events, and asdict() is cached."""
+        readings = [
+            ArchFXDataPoint(
+                timestamp=datetime(2021, 1, 20, 0, 0, i, 0, timezone.utc),
+                stream='0001-5030',
+                value=float(i),
+                reading_id=100 + i,
+            )
+            for i in range(10)
+        ]
+        report = ArchFXFlexibleDictionaryReport.FromReadings('d--1234', readings, report_id=200, streamer=3,
+                                                             sent_timestamp=1)
+        encoded = report.encode()
+        expected = ReportHeader('v200', 0x1234, 3, 0xFFFF, 200, 100, 109, 1)
+
+        with mock.patch.object(msgpack, 'unpackb') as unpackb:
+            self.assertEqual(read_header(encoded), expected)
+            self.assertEqual(read_header(memoryview(encoded)), expected)
+            unpackb.assert_not_called()
+        self.assertEqual(read_header(report.encode('gzip')), expected)
+        self.assertEqual(report.header(), expected)
+
+        lazy = ArchFXFlexibleDictionaryReport(encoded, False, False, lazy=True)
+        with mock.patch.object(ArchFXDataPoint, 'FromDict') as from_dict:
+            self.assertEqual(lazy.header(), expected)
+            from_dict.assert_not_called()
+
+        with self.assertRaises(DataError):
+            read_header(msgpack.packb({'format': 'v200', 'events': []}))
+
+        self.assertEqual(report.asdict()['seqid'], 200)
+        self.assertIs(report.asdict(), report.asdict())
+
+        # The header is set before the first event, even when it follows the events
+        events_first = msgpack.packb({'events': [x.asdict() for x in readings], 'format': 'v200',
+                                      'device': 0x1234, 'seqid': 200}, default=str)
+        lazy = ArchFXFlexibleDictionaryReport(events_first, False, False, lazy=True)
+        with mock.patch.object(ArchFXFlexibleDictionaryReport, 'decode_header') as decode_header:
+            events = lazy.iter_decode()
+            self.assertEqual(next(events).value, 0.0)
+            self.assertEqual((lazy.origin, lazy.report_id), (0x1234, 200))
+            decode_header.assert_not_called()
+        self.assertEqual(len(list(events)), 9)
+
+    def test_raw_data_section(self):
+        """Make sure raw data stored in a separate section is only loaded when accessed."""
+        readings = [
+            ArchFXDataPoint(
+                timestamp=datetime(2021, 1, 20, 0, 0, i, 0, timezone.utc),
+                stream='0001-5030',
+                value=float(i),
+                raw_data={'samples': [float(i)] * 100} if i % 2 else None,
+                reading_id=100 + i,
+            )
+            for i in range(10)
+        ]
+        inline = ArchFXFlexibleDictionaryReport.FromReadings('d--1234', readings, report_id=200)
+        report = ArchFXFlexibleDictionaryReport.FromReadings('d--1234', readings, report_id=200,
+                                                             raw_data_section=True)
+        self.assertEqual(report.lowest_id, 100)
+        self.assertEqual(read_header(report.encode()), read_header(inline.encode()))
+
+        with mock.patch.object(LazyRawData, 'load', autospec=True, side_effect=LazyRawData.load) as load:
+            points = report.visible_data
+            self.assertEqual([point.value for point in points], [float(i) for i in range(10)])
+            self.assertEqual([point.has_raw_data for point in points], [bool(i % 2) for i in range(10)])
+            load.assert_not_called()
+
+            self.assertEqual(points[3].raw_data, {'samples': [3.0] * 100})
+            self.assertIs(points[3].raw_data, points[3].raw_data)
+            self.assertEqual(load.call_count, 1)
+        self.assertIsNone(points[2].raw_data)
+
+        # Unloaded raw data is pickled with its point (e.g. to leave a worker process), and stays lazy
+        copied = pickle.loads(pickle.dumps(points[5]))
+        self.assertIsInstance(copied._raw_data, LazyRawData)
+        self.assertEqual(copied.raw_data, {'samples': [5.0] * 100})
+
+        self.assertEqual([point.raw_data for point in report.iter_data()],
+                         [point.raw_data for point in inline.visible_data])
+
+        # Raw data is inlined again for the cloud, and when events are re-encoded
+        cloud = mock.MagicMock()
+        cloud.return_value.upload_fp.return_value = {'count': 10}
+        report.upload(cloud)
+        self.assertEqual(cloud.return_value.upload_fp.call_args[0][0][1].read(), inline.encode())
+
+        writer = ArchFXFlexibleDictionaryReportWriter('d--1234', report_id=200)
+        for event in report.iter_events():
+            writer.add_dict(event)
+        self.assertEqual(writer.finish().encode(), inline.encode())
@@ -0,0 +1,93 @@
+from datetime import datetime, timezone
+import os
+import tempfile
+import unittest
+
+from archfx_cloud.reports.exceptions import DataError
+from archfx_cloud.reports.flexible_dictionary import ArchFXFlexibleDictionaryReport
+from archfx_cloud.reports.framed_log import LogEntry, ReportLog
+from archfx_cloud.reports.report import ArchFXDataPoint
+
+
+def _report(device, streamer, report_id, count=5):
+    readings = [
+        ArchFXDataPoint(datetime(2021, 1, 20, 0, 0, i, tzinfo=timezone.utc), 0x5051, float(i),
+                        reading_id=report_id * 100 + i)
+        for i in range(count)
+    ]
+    return ArchFXFlexibleDictionaryReport.FromReadings(device, readings, report_id=report_id, streamer=streamer)
+
+
+class ReportLogTests(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, 'reports.log')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _fill(self, log):
+        log.append(_report('d--1234', 0x100, 1))
+        log.append(_report('d--1234', 0x100, 2))
+        log.append(_report(0x20, 3, 1))
+
+    def test_append_and_get(self):
+        with ReportLog(self.path) as log:
+            self._fill(log)
+            self.assertEqual(len(log), 3)
+
+            entries = log.find('d--1234', 0x100)
+            self.assertEqual([entry.seqid for entry in entries], [1, 2])
+            self.assertEqual(log.find(0x1234, 0x100, reading_id=203), [entries[1]])
+            self.assertEqual(log.find(0x1234, 0x100, seqid=1), [entries[0]])
+            self.assertEqual(log.find(0x1234, 0x100, reading_id=300), [])
+            self.assertEqual(log.find(0x20, 4), [])
+
+            report = log.get(entries[1])
+            self.assertEqual(report.report_id, 2)
+            self.assertEqual(report.lowest_id, 200)
+            self.assertEqual(report.encode(), _report('d--1234', 0x100, 2).encode())
+
+            self.assertEqual([(report.origin, report.report_id) for report in log],
+                             [(0x1234, 1), (0x1234, 2), (0x20, 1)])
+
+        with ReportLog(self.path, compression='gzip') as log:
+            self.assertEqual(len(log), 3)
+            entry = log.append(_report(0x20, 3, 2))
+            self.assertEqual(log.get(entry).compression, 'gzip')
+            self.assertEqual(log.get(entry).report_id, 2)
+
+        with self.assertRaises(DataError):
+            log.append(_report(0x20, 3, 3))
+
+    def test_recovery(self):
+        with ReportLog(self.path) as log:
+            self._fill(log)
+            entries = log.entries()
+
+        # Torn frame at the end of the data file, and a torn index record
+        with open(self.path, 'ab') as outfile:
+            outfile.write(b'\x10\x00\x00\x00garbage')
+        with open(self.path + '.idx', 'ab') as outfile:
+            outfile.write(b'\x01\x02')
+
+        with ReportLog(self.path) as log:
+            self.assertEqual(log.entries(), entries)
+            self.assertEqual(len(list(log)), 3)
+            log.append(_report(0x20, 3, 2))
+
+        # Index records missing, or pointing past the end of the data file
+        os.remove(self.path + '.idx')
+        with ReportLog(self.path) as log:
+            self.assertEqual(log.entries()[:3], entries)
+            self.assertEqual(log.entries()[3].seqid, 2)
+
+        with open(self.path, 'r+b') as outfile:
+            outfile.truncate(entries[2].offset + 4)
+        with ReportLog(self.path) as log:
+            self.assertEqual(log.entries(), entries[:2])
+            self.assertEqual(os.path.getsize(self.path), entries[1].offset + entries[1].length)
+
+            with self.assertRaises(DataError):
+                log.get(LogEntry(entries[0].offset + 1, entries[0].length, 0, 0, 0, 0, 0))
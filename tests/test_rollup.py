@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta, timezone
+import unittest
+
+import pytest
+
+from archfx_cloud.reports.exceptions import DataError
+from archfx_cloud.reports.flexible_dictionary import ArchFXFlexibleDictionaryReport
+from archfx_cloud.reports.report import ArchFXDataPoint
+
+np = pytest.importorskip('numpy')
+
+from archfx_cloud.reports.batch import DataPointBatch  # noqa: E402
+from archfx_cloud.reports.rollup import rollup, rollup_batch  # noqa: E402
+
+START = datetime(2021, 1, 20, tzinfo=timezone.utc)
+
+
+def _points():
+    # 10 Hz for 3 seconds on two streams, out of order
+    points = [
+        ArchFXDataPoint(START + timedelta(milliseconds=100 * i), stream, float(i) * factor, reading_id=i + 1)
+        for i in range(30)
+        for stream, factor in ((0x5001, 1), (0x5002, -1))
+    ]
+    return points[::-1]
+
+
+class RollupTests(unittest.TestCase):
+
+    def test_tumbling(self):
+        points = rollup(_points(), window=timedelta(seconds=1), output_streams={'5002': '5102'})
+        self.assertEqual(len(points), 6)
+        self.assertEqual([point.stream for point in points], [0x5001] * 3 + [0x5102] * 3)
+        self.assertEqual([point.timestamp for point in points[:3]],
+                         [START, START + timedelta(seconds=1), START + timedelta(seconds=2)])
+        self.assertEqual([point.value for point in points[:3]], [4.5, 14.5, 24.5])
+        self.assertEqual(points[1].summary_data, {'min': 10.0, 'max': 19.0, 'count': 10, 'last': 19.0})
+        self.assertEqual(points[4].summary_data, {'min': -19.0, 'max': -10.0, 'count': 10, 'last': -19.0})
+        self.assertEqual({point.reading_id for point in points}, {ArchFXDataPoint.InvalidReadingID})
+
+        report = ArchFXFlexibleDictionaryReport.FromReadings('d--1234', points)
+        self.assertEqual(len(report.visible_data), 6)
+
+    def test_sliding(self):
+        batch = rollup_batch(DataPointBatch.FromPoints(_points()), window=2.0, step=1.0, aggregates=['count', 'last'],
+                             value='last', origin=START)
+        self.assertEqual(batch.stream.tolist(), [0x5001] * 4 + [0x5002] * 4)
+        starts = [START + timedelta(seconds=i) for i in range(-1, 3)]
+        self.assertEqual([point.timestamp for point in batch.to_points()[:4]], starts)
+        self.assertEqual(batch.value.tolist()[:4], [9.0, 19.0, 29.0, 29.0])
+        self.assertEqual(batch.summary_data[:4], [{'count': 10}, {'count': 20}, {'count': 20}, {'count': 10}])
+
+    def test_errors(self):
+        self.assertEqual(len(rollup([], window=1)), 0)
+        with self.assertRaises(DataError):
+            rollup(_points(), window=0)
+        with self.assertRaises(DataError):
+            rollup(_points(), window=1, aggregates=['median'])
+        with self.assertRaises(DataError):
+            rollup(_points(), window=1, value='sum')
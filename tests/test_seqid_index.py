@@ -0,0 +1,102 @@
+from datetime import datetime, timezone
+import os
+import tempfile
+import unittest
+
+import mock
+
+from archfx_cloud.reports.compact import ArchFXCompactReport
+from archfx_cloud.reports.flexible_dictionary import ArchFXFlexibleDictionaryReport
+from archfx_cloud.reports.report import ArchFXDataPoint
+from archfx_cloud.reports.seqid_index import IntervalSet, SeqidIndex
+from archfx_cloud.reports.uploader import upload_reports
+
+
+def _readings(reading_ids):
+    return [
+        ArchFXDataPoint(datetime(2021, 1, 20, tzinfo=timezone.utc), 0x5051, float(i), reading_id=i)
+        for i in reading_ids
+    ]
+
+
+def _mock_api():
+    api = mock.MagicMock()
+    api.return_value.upload_fp.return_value = {'count': 1}
+    return api
+
+
+class IntervalSetTests(unittest.TestCase):
+
+    def test_add(self):
+        intervals = IntervalSet([(10, 20), (30, 40)])
+        intervals.add(22, 25)
+        self.assertEqual(list(intervals), [(10, 20), (22, 25), (30, 40)])
+        intervals.add(21, 21)
+        self.assertEqual(list(intervals), [(10, 25), (30, 40)])
+        intervals.add(5, 8)
+        intervals.add(50, 60)
+        intervals.add(26, 29)
+        self.assertEqual(list(intervals), [(5, 8), (10, 40), (50, 60)])
+        intervals.add(1, 100)
+        self.assertEqual(list(intervals), [(1, 100)])
+
+        intervals = IntervalSet()
+        intervals.add_values([7, 3, 4, 5, 9, 10, 4])
+        self.assertEqual(list(intervals), [(3, 5), (7, 7), (9, 10)])
+        self.assertIn(4, intervals)
+        self.assertNotIn(6, intervals)
+        self.assertNotIn(2, intervals)
+        self.assertTrue(intervals.covers(3, 5))
+        self.assertFalse(intervals.covers(3, 7))
+
+
+class SeqidIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp_dir.name, 'accepted.json')
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_skip_accepted_readings(self):
+        index = SeqidIndex(self.path)
+        api = _mock_api()
+
+        report = ArchFXFlexibleDictionaryReport.FromReadings('d--1234', _readings([1, 2, 3, 5]), report_id=6,
+                                                             streamer=2, seqid_index=index)
+        self.assertEqual(report.upload(api, seqid_index=index), 1)
+        self.assertEqual(index.ranges(0x1234, 2), [(1, 3), (5, 5)])
+
+        # Persisted, and only applies to the same device streamer
+        index = SeqidIndex(self.path)
+        self.assertTrue(index.contains(0x1234, 2, 3))
+        self.assertFalse(index.contains(0x1234, 2, 4))
+        self.assertFalse(index.contains(0x1234, 1, 3))
+
+        readings = _readings([0, 2, 3, 4, 5, 6])
+        for report_cls in (ArchFXFlexibleDictionaryReport, ArchFXCompactReport):
+            report = report_cls.FromReadings('d--1234', readings, streamer=2, seqid_index=index)
+            self.assertEqual([p.reading_id for p in report.visible_data], [0, 4, 6])
+
+        chunks = ArchFXFlexibleDictionaryReport.ChunkedFromReadings('d--1234', readings, max_events=1, streamer=2,
+                                                                    seqid_index=index)
+        self.assertEqual([r.lowest_id for r in chunks], [0, 4, 6])
+
+    def test_uploader(self):
+        index = SeqidIndex(self.path, autosave=False)
+        reports = [
+            ArchFXFlexibleDictionaryReport.FromReadings('d--1234', _readings(ids), report_id=max(ids) + 1)
+            for ids in ([1, 2], [3, 4], [5, 6])
+        ]
+
+        summary = upload_reports(_mock_api(), reports[:2], seqid_index=index)
+        self.assertEqual(len(summary.uploaded), 2)
+        self.assertEqual(index.ranges(0x1234, 0x100), [(1, 4)])
+        self.assertFalse(os.path.exists(self.path))
+        index.save()
+
+        summary = upload_reports(_mock_api(), reports, seqid_index=SeqidIndex(self.path))
+        self.assertEqual([r.report_id for r in summary.already_accepted], [3, 5])
+        self.assertEqual([r.report_id for r in summary.uploaded], [7])
+        self.assertTrue(summary.ok)
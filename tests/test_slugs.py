@@ -8,6 +8,7 @@ from archfx_cloud.utils.slugs import (
     ArchFxDeviceSlug,
     ArchFxVariableID,
     ArchFxStreamSlug,
+    ArchFxStreamerSlug,
 )
 
 ArchFxVariableID_CASES = (
@@ -124,6 +125,22 @@ class SlugTestCase(unittest.TestCase):
         self.assertRaises(ValueError, ArchFxDeviceSlug, pow(16, 16))
         self.assertRaises(ValueError, ArchFxDeviceSlug, pow(16, 12), False)
 
+    def test_integer_backed_slugs(self):
+        device = ArchFxDeviceSlug('d--1234')
+        self.assertFalse(hasattr(device, '__dict__'))
+        self.assertEqual(device, ArchFxDeviceSlug(0x1234))
+        self.assertEqual(hash(device), hash(ArchFxDeviceSlug('0000-0000-0000-1234')))
+        self.assertNotEqual(ArchFxParentSlug(5), ArchFxParentSlug(5, ptype='pa'))
+        self.assertNotEqual(ArchFxParentSlug(5), ArchFxVariableID(5))
+        self.assertEqual(ArchFxVariableID(ArchFxVariableID((1, 2))).get_id(), 0x10002)
+
+        streamer = ArchFxStreamerSlug(device, 1)
+        self.assertEqual(streamer, ArchFxStreamerSlug('d--1234', '1'))
+        self.assertEqual(str(streamer), 't--0000-0000-0000-1234--0001')
+        self.assertEqual(streamer.get_device(), 'd--0000-0000-0000-1234')
+        self.assertEqual(streamer.get_index(), '0001')
+        self.assertRaises(ValueError, streamer.get_id)
+
     def test_stream_slug(self):
         slug1 = ArchFxStreamSlug('sl--0000-0001--0000-0000-0000-0002--5051')
         parts = slug1.get_parts()
@@ -245,3 +262,10 @@ class SlugTestCase(unittest.TestCase):
             start=now
         )
         self.assertEqual(str(slug14), f'sa--0000-0001--0000-0001-0000-0133--0000-5051--{int(now.timestamp() * 10**6)}')
+
+        self.assertEqual(ArchFxStreamSlug.stype, 'sd')
+        self.assertEqual(ArchFxStreamSlug().stype, 'sd')
+        self.assertEqual(slug7.stype, 'sa')
+        self.assertEqual(slug14.stype, 'sa')
+        self.assertEqual(ArchFxStreamSlug('s--0000-0001--0000-0002--5051').stype, 's')
+        self.assertEqual(slug7, ArchFxStreamSlug('sa--0001--0000-0001-0000-0123--1-5051'))
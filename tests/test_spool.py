@@ -0,0 +1,163 @@
+from datetime import datetime, timezone
+import os
+import tempfile
+import time
+import unittest
+
+import mock
+
+from archfx_cloud.api.exceptions import HttpClientError, HttpServerError
+from archfx_cloud.reports import compression
+from archfx_cloud.reports.flexible_dictionary import ArchFXFlexibleDictionaryReport
+from archfx_cloud.reports.report import ArchFXDataPoint
+from archfx_cloud.reports.spool import ReportSpool
+from archfx_cloud.utils.framing import encode_frame, truncate_invalid_tail
+
+
+def _report(report_id, count=5):
+    readings = [
+        ArchFXDataPoint(datetime(2021, 1, 20, 0, 0, i, tzinfo=timezone.utc), 0x5051, float(i),
+                        reading_id=report_id * 100 + i)
+        for i in range(count)
+    ]
+    return ArchFXFlexibleDictionaryReport.FromReadings('d--1234', readings, report_id=report_id)
+
+
+def _mock_api(*side_effect):
+    api = mock.MagicMock()
+    upload_fp = api.return_value.upload_fp
+    upload_fp.side_effect = list(side_effect) if side_effect else None
+    upload_fp.return_value = {'count': 5}
+    return api, upload_fp
+
+
+def _uploaded_ids(upload_fp):
+    ids = []
+    for call in upload_fp.call_args_list:
+        ids.append(ArchFXFlexibleDictionaryReport(call[0][0][1].getvalue(), False, False, lazy=True).report_id)
+    return ids
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out")
+        time.sleep(0.01)
+
+
+class FramingTests(unittest.TestCase):
+
+    def test_truncate_invalid_tail(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'frames')
+            with open(path, 'wb') as outfile:
+                outfile.write(encode_frame(b'first'))
+                outfile.write(encode_frame(b'second')[:-2])
+            self.assertEqual(truncate_invalid_tail(path), 12)
+            self.assertEqual(os.path.getsize(path), 13)
+            self.assertEqual(truncate_invalid_tail(path), 0)
+
+
+class ReportSpoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self._tmp_dir.name, 'spool')
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_survives_restart(self):
+        api, upload_fp = _mock_api()
+        with ReportSpool(self.directory, api, compression=compression.GZIP) as spool:
+            for report_id in range(1, 4):
+                spool.enqueue(_report(report_id))
+            self.assertEqual(len(spool), 3)
+            self.assertTrue(spool.upload_next())
+
+        # Simulate a crash in the middle of an append
+        with open(os.path.join(self.directory, '00000000.log'), 'ab') as outfile:
+            outfile.write(encode_frame(b'torn')[:6])
+
+        with ReportSpool(self.directory, api) as spool:
+            self.assertEqual(len(spool), 2)
+            spool.enqueue(_report(4))
+            while spool.upload_next():
+                pass
+            self.assertEqual(len(spool), 0)
+            self.assertIsNone(spool.peek())
+
+        self.assertEqual(_uploaded_ids(upload_fp), [1, 2, 3, 4])
+
+    def test_segments_and_quota(self):
+        size = len(encode_frame(_report(8).encode()))
+        with ReportSpool(self.directory, segment_size=2 * size + 16, max_bytes=5 * size) as spool:
+            for report_id in range(1, 9):
+                spool.enqueue(_report(report_id))
+            self.assertEqual(spool.evicted, 4)
+            self.assertEqual(len(spool), 4)
+            self.assertEqual(spool.peek().report.report_id, 5)
+
+            self.assertTrue(spool.ack(spool.peek()))
+            self.assertEqual(spool.peek().report.report_id, 6)
+
+        with ReportSpool(self.directory) as spool:
+            self.assertEqual(len(spool), 3)
+            entry = spool.peek()
+            self.assertEqual(entry.report.report_id, 6)
+            self.assertTrue(spool.ack(entry))
+            self.assertFalse(spool.ack(entry))
+            self.assertEqual(spool.peek().report.report_id, 7)
+            self.assertEqual(sorted(os.listdir(self.directory)), ['00000003.log', 'cursor.json'])
+
+    def test_evicted_while_uploading(self):
+        size = len(encode_frame(_report(8).encode()))
+        api, upload_fp = _mock_api()
+        with ReportSpool(self.directory, api, segment_size=2 * size + 16, max_bytes=3 * size) as spool:
+            spool.enqueue(_report(1))
+
+            def _evict(*args, **kwargs):
+                for report_id in range(2, 6):
+                    spool.enqueue(_report(report_id))
+                return {'count': 5}
+
+            upload_fp.side_effect = _evict
+            self.assertTrue(spool.upload_next())
+            self.assertEqual(spool.evicted, 2)
+            self.assertEqual(spool.uploaded, 0)
+            self.assertEqual(spool.peek().report.report_id, 3)
+
+    def test_background_uploader(self):
+        rejected = HttpClientError('Client Error 400', response=mock.Mock(status_code=400))
+        api, upload_fp = _mock_api(HttpServerError('Server Error 503'), {'count': 5}, rejected, {'count': 5})
+
+        spool = ReportSpool(self.directory, api, retry_delay=0.01, fsync_interval=0.05)
+        spool.start()
+        try:
+            for report_id in range(1, 4):
+                spool.enqueue(_report(report_id))
+            _wait_for(lambda: len(spool) == 0)
+        finally:
+            spool.close()
+
+        self.assertEqual(_uploaded_ids(upload_fp), [1, 1, 2, 3])
+        self.assertEqual(spool.uploaded, 2)
+        self.assertEqual(spool.rejected, 1)
+
+    def test_unauthorized_is_retried(self):
+        unauthorized = HttpClientError('Client Error 401', response=mock.Mock(status_code=401))
+        api, upload_fp = _mock_api(*[unauthorized] * 100)
+
+        spool = ReportSpool(self.directory, api, retry_delay=0.01, max_retry_delay=0.01)
+        spool.start()
+        try:
+            spool.enqueue(_report(1))
+            _wait_for(lambda: upload_fp.call_count >= 3)
+        finally:
+            spool.close()
+
+        self.assertEqual(len(spool), 1)
+        self.assertEqual(spool.rejected, 0)
+        with ReportSpool(self.directory) as spool:
+            self.assertEqual(spool.peek().report.report_id, 1)
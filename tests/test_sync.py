@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests_mock
+
+from archfx_cloud.api.connection import Api
+from archfx_cloud.api.sync import Checkpoint, CheckpointStore, IncrementalSync
+
+STREAM = 'sl--0000-0001--0000-0000-0000-0002--0000-5051'
+URL = f'http://archfx.test/api/v1/data/?filter={STREAM}&page_size=2'
+
+
+class IncrementalSyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.api = Api(domain='http://archfx.test')
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'checkpoints.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _mock_first_run(self, m):
+        m.get(URL, json={
+            'next': f'{URL}&page=2',
+            'results': [
+                {'timestamp': '2021-01-20T00:00:01Z', 'value': 1.0, 'seqid': 1},
+                {'timestamp': '2021-01-20T00:00:02Z', 'value': 2.0, 'seqid': 2},
+            ]
+        }, complete_qs=True)
+        m.get(f'{URL}&page=2', json={
+            'next': None,
+            'results': [
+                {'timestamp': '2021-01-20T00:00:03Z', 'value': 3.0, 'seqid': 3},
+            ]
+        }, complete_qs=True)
+
+    @requests_mock.Mocker()
+    def test_sync_and_resume(self, m):
+        self._mock_first_run(m)
+
+        store = CheckpointStore(self.path)
+        sync = IncrementalSync(self.api, store, page_size=2)
+        batches = sync.run([STREAM])
+
+        batch = next(batches)
+        self.assertEqual([p.value for p in batch.points], [1.0, 2.0])
+        batch.ack()
+
+        # Simulate a crash before the second batch is acknowledged
+        batch = next(batches)
+        self.assertEqual([p.value for p in batch.points], [3.0])
+        batches.close()
+
+        with open(self.path) as fp:
+            self.assertEqual(json.load(fp), {STREAM: {'timestamp': '2021-01-20T00:00:02+00:00', 'seqid': 2}})
+
+        # Second run starts from the committed checkpoint and skips what was acknowledged
+        start = '2021-01-20T00:00:02%2B00:00'
+        m.get(f'{URL}&start={start}', json={
+            'next': None,
+            'results': [
+                {'timestamp': '2021-01-20T00:00:02Z', 'value': 2.0, 'seqid': 2},
+                {'timestamp': '2021-01-20T00:00:03Z', 'value': 3.0, 'seqid': 3},
+            ]
+        }, complete_qs=True)
+
+        store = CheckpointStore(self.path)
+        batches = list(IncrementalSync(self.api, store, page_size=2).run([STREAM]))
+        self.assertEqual(len(batches), 1)
+        self.assertEqual([p.value for p in batches[0].points], [3.0])
+        batches[0].ack()
+        self.assertEqual(store.get(STREAM), Checkpoint('2021-01-20T00:00:03+00:00', 3))
+
+    @requests_mock.Mocker()
+    def test_out_of_order_ack(self, m):
+        self._mock_first_run(m)
+
+        store = CheckpointStore(self.path)
+        first, second = IncrementalSync(self.api, store, page_size=2).run([STREAM])
+
+        # The first batch was not processed yet, so the stream can't move past it
+        second.ack()
+        self.assertIsNone(store.get(STREAM))
+        self.assertIsNone(CheckpointStore(self.path).get(STREAM))
+
+        first.ack()
+        self.assertEqual(store.get(STREAM), Checkpoint('2021-01-20T00:00:03+00:00', 3))
+        self.assertEqual(CheckpointStore(self.path).get(STREAM), Checkpoint('2021-01-20T00:00:03+00:00', 3))
+
+    def test_checkpoint_store(self):
+        store = CheckpointStore(self.path)
+        self.assertIsNone(store.get(STREAM))
+
+        store.commit(STREAM, Checkpoint('2021-01-20T00:00:03+00:00', 3))
+        # Older checkpoints never move a stream backwards
+        store.commit(STREAM, Checkpoint('2021-01-20T00:00:02+00:00', 2))
+
+        store = CheckpointStore(self.path)
+        self.assertEqual(store.get(STREAM), Checkpoint('2021-01-20T00:00:03+00:00', 3))
+        self.assertEqual(store.streams(), [STREAM])
+        self.assertEqual(os.listdir(self.tmpdir), ['checkpoints.json'])
+
+        store.reset(STREAM)
+        self.assertIsNone(CheckpointStore(self.path).get(STREAM))
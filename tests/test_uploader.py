@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+import random
+import threading
+import time
+import unittest
+
+import mock
+
+from archfx_cloud.api.exceptions import HttpServerError
+from archfx_cloud.reports.flexible_dictionary import ArchFXFlexibleDictionaryReport
+from archfx_cloud.reports.report import ArchFXDataPoint
+from archfx_cloud.reports.uploader import shard_reports, upload_reports
+
+
+def _report(device, streamer, report_id):
+    reading = ArchFXDataPoint(datetime(2021, 1, 20, tzinfo=timezone.utc), 0x5051, 1.0, reading_id=report_id - 1)
+    return ArchFXFlexibleDictionaryReport.FromReadings(device, [reading], report_id=report_id, streamer=streamer)
+
+
+class UploaderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.reports = [
+            _report(device, streamer, report_id)
+            for report_id in (30, 10, 20)
+            for device in (1, 2, 3)
+            for streamer in (0, 1)
+        ]
+        self.uploads = []
+        self.lock = threading.Lock()
+
+    def _api(self, fail=None):
+        def _upload_fp(fp, timestamp=None):
+            report = ArchFXFlexibleDictionaryReport(fp[1].getvalue(), False, False, lazy=True)
+            time.sleep(random.random() * 0.005)
+            key = (report.origin, report.origin_streamer, report.report_id)
+            with self.lock:
+                self.uploads.append(key)
+            if key == fail:
+                raise HttpServerError('Server Error 503')
+            return {'count': report.report_id}
+
+        api = mock.MagicMock()
+        api.return_value.upload_fp.side_effect = _upload_fp
+        return api
+
+    def test_shard_reports(self):
+        shards = shard_reports(self.reports)
+        self.assertEqual(len(shards), 6)
+        self.assertEqual([(r.origin, r.origin_streamer, r.report_id) for r in shards[0]],
+                         [(1, 0, 10), (1, 0, 20), (1, 0, 30)])
+
+    def test_upload_reports(self):
+        summary = upload_reports(self._api(), self.reports, max_workers=4)
+        self.assertTrue(summary.ok)
+        self.assertEqual(summary.accepted, 6 * 60)
+        self.assertEqual(len(summary.uploaded), 18)
+
+        for device in (1, 2, 3):
+            for streamer in (0, 1):
+                ids = [key[2] for key in self.uploads if key[:2] == (device, streamer)]
+                self.assertEqual(ids, [10, 20, 30])
+
+    def test_failure_stops_shard(self):
+        summary = upload_reports(self._api(fail=(2, 1, 20)), self.reports, max_workers=4)
+        self.assertFalse(summary.ok)
+        self.assertEqual(summary.accepted, 5 * 60 + 10)
+        self.assertEqual(len(summary.failures), 1)
+        self.assertEqual(summary.failures[0].report.report_id, 20)
+        self.assertIsInstance(summary.failures[0].error, HttpServerError)
+        self.assertEqual([(r.origin, r.origin_streamer, r.report_id) for r in summary.skipped], [(2, 1, 30)])
+        self.assertNotIn((2, 1, 30), self.uploads)
+
+        self.assertEqual(upload_reports(self._api(), []).accepted, 0)